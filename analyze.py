@@ -1,6 +1,5 @@
-import MetaTrader5 as mt5
+from broker import mt5
 import pandas as pd
-import time
 import numpy as np
 from datetime import datetime
 
@@ -0,0 +1,520 @@
+"""
+Historical backtests of the S/R breakout bots.
+
+Each strategy turns a whole bar history into signal, stop and target arrays
+in one vectorized pass. The arrays reproduce what the bot's generate_signal()
+and execute_trade() would decide with that bar forming and its close as the
+current price. Their keyword arguments are the knobs the bots hard-code
+(S/R window, touch threshold and band, stop size, RR) with the bots' values
+as defaults, so sweep.py can vary them. run() then plays the trades through the bars:
+
+- A signal on bar t enters at bar t's close: the ask (close + spread) for
+  buys, the bid for sells.
+- One position at a time. Signals while a position is open are ignored,
+  and a new one can open at the close of the bar that closed the last.
+- SL/TP are checked from bar t + 1 on. Buys close on the bid, sells on the
+  ask. A bar that opens beyond a level fills at its open. When a bar's range
+  reaches both levels, `both_hit` decides which came first: 'sl' (default,
+  the conservative choice) or 'tp'.
+
+Bars are a RATES_DTYPE array (as the offline broker stores them) or a
+DataFrame with the same columns.
+
+    python backtest.py data/XAUUSD_M1.npy snr
+"""
+import argparse
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import indicators
+from broker import DEFAULT_SYMBOL_SPEC, read_rates_csv
+from support_resistance import support_resistance_levels
+
+# Cells of the (windows x fractals) matrix sorted at once in main_signals
+CHUNK_CELLS = 1 << 22
+
+# Bytes of columns, indicators and signal arrays kept by use_cache()
+CACHE_BYTES = 1 << 29
+
+_cache = None
+
+
+class _Cache:
+    # Least recently used arrays up to max_bytes, keyed per bar array
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, bars, key, compute):
+        # The bars are held in the entry, so their id() stays theirs
+        key = (id(bars), key)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key][1]
+        value = compute()
+        size = _nbytes(value)
+        self.entries[key] = (bars, value, size)
+        self.size += size
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, (_, _, dropped) = self.entries.popitem(last=False)
+            self.size -= dropped
+        return value
+
+
+def use_cache(max_bytes=CACHE_BYTES):
+    """
+    Memoize the bar columns, indicators and signal arrays of later runs, so
+    repeated backtests on the same bars (sweeps, walk-forward folds) only
+    compute what a new parameter value changes. The bars must not be
+    modified in place while cached.
+    """
+    global _cache
+    _cache = _Cache(max_bytes)
+
+
+def _memo(bars, key, compute):
+    return compute() if _cache is None else _cache.get(bars, key, compute)
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+def _indicator(bars, fn, columns, *args, **kwargs):
+    # fn over the named bar columns and args, shared between strategies and runs
+    key = (fn, columns, args, tuple(sorted(kwargs.items())))
+    return _memo(bars, key, lambda: fn(*(_columns(bars)[name] for name in columns), *args, **kwargs))
+
+
+def _columns(bars):
+    return _memo(bars, 'columns', lambda: _read_columns(bars))
+
+
+def _read_columns(bars):
+    if isinstance(bars, pd.DataFrame):
+        get = lambda name: bars[name].to_numpy()
+    else:
+        get = lambda name: bars[name]
+    columns = {name: np.asarray(get(name), dtype=float) for name in ('open', 'high', 'low', 'close')}
+    columns['spread'] = np.asarray(get('spread'), dtype=float) if 'spread' in _names(bars) else np.zeros(len(columns['close']))
+    columns['time'] = np.asarray(get('time'))
+    return columns
+
+
+def _names(bars):
+    return bars.columns if isinstance(bars, pd.DataFrame) else bars.dtype.names
+
+
+def _previous(x):
+    # x shifted one bar later, NaN on the first bar
+    out = np.empty_like(x)
+    out[:1] = np.nan
+    out[1:] = x[:-1]
+    return out
+
+
+def _last_level(levels, lookback):
+    # Most recent non-NaN level within the last `lookback` bars, as
+    # df['resistance'].dropna().iloc[-1] sees it inside a bot's bar window
+    bars = np.arange(len(levels))
+    last = np.maximum.accumulate(np.where(np.isnan(levels), -1, bars))
+    found = (last >= 0) & (bars - last <= lookback)
+    return np.where(found, levels[np.maximum(last, 0)], np.nan)
+
+
+def _direction(buy, sell):
+    return np.where(buy, 1, np.where(sell, -1, 0)).astype(np.int8)
+
+
+# snr.py: two closes beyond the last closed bar's level, fixed 10 * point * 100 stop, RR 1:2
+def snr_signals(bars, point=0.01, window=20, touch_threshold=2, band=0.001, stop_points=1000, rr=2.0):
+    c = _columns(bars)
+    close = c['close']
+    resistance, support = _indicator(bars, support_resistance_levels, ('high', 'low'), window, touch_threshold, band)
+    resistance, support = _previous(resistance), _previous(support)
+    previous_close = _previous(close)
+    with np.errstate(invalid='ignore'):
+        buy = (previous_close > resistance) & (close > resistance)
+        sell = (previous_close < support) & (close < support)
+    stop = np.full(len(close), stop_points * point)
+    return _direction(buy, sell), stop, stop * rr
+
+
+# h1.py: two closes beyond the latest level on the trend side of SMA(200), 2 ATR stop, 3 ATR target
+def h1_signals(bars, point=0.01, window=20, touch_threshold=2, band=0.001, num_bars=500, sl_atr=2.0, rr=1.5):
+    c = _columns(bars)
+    close = c['close']
+    resistance, support = _indicator(bars, support_resistance_levels, ('high', 'low'), window, touch_threshold, band)
+    # Levels exist from bar `window` of the bot's frame on
+    resistance = _last_level(resistance, num_bars - 1 - window)
+    support = _last_level(support, num_bars - 1 - window)
+    sma = _indicator(bars, indicators.sma, ('close',), 200)
+    atr = _indicator(bars, indicators.atr, ('high', 'low', 'close'), 14)
+    previous_close = _previous(close)
+    with np.errstate(invalid='ignore'):
+        buy = (close > resistance) & (previous_close > resistance) & (close > sma)
+        sell = ~buy & (close < support) & (previous_close < support) & (close < sma)
+    return _direction(buy, sell), sl_atr * atr, sl_atr * rr * atr
+
+
+# h4new.py: SMA 20/50 cross with ADX > 25 through the previous level, 2 ATR stop (spread inside), 4 ATR target
+def h4new_signals(bars, point=0.01, window=50, touch_threshold=2, band=0.001, sl_atr=2.0, rr=2.0):
+    c = _columns(bars)
+    close = c['close']
+    resistance, support = _indicator(bars, support_resistance_levels, ('high', 'low'), window, touch_threshold, band)
+    resistance, support = _previous(resistance), _previous(support)
+    fast, slow = _indicator(bars, indicators.sma, ('close',), 20), _indicator(bars, indicators.sma, ('close',), 50)
+    fast_prev, slow_prev = _previous(fast), _previous(slow)
+    adx = _indicator(bars, indicators.adx, ('high', 'low', 'close'), 14, method='sma')[0]
+    atr = _indicator(bars, indicators.atr, ('high', 'low', 'close'), 14)
+    previous_close = _previous(close)
+    with np.errstate(invalid='ignore'):
+        buy = ((fast_prev <= slow_prev) & (fast > slow) & (adx > 25) &
+               (previous_close < resistance) & (close > resistance))
+        sell = ~buy & ((fast_prev >= slow_prev) & (fast < slow) & (adx > 25) &
+                       (previous_close > support) & (close < support))
+    return _direction(buy, sell), sl_atr * atr - c['spread'] * point, sl_atr * rr * atr
+
+
+# main.py: break of the top fractal key level with the SMA(50) filter, 1.5 ATR stop, RR 1:2
+def main_signals(bars, point=0.01, num_bars=500, tolerance=0.3, max_spread=5, sl_atr=1.5, rr=2.0):
+    c = _columns(bars)
+    close = c['close']
+    resistance = _indicator(bars, _fractal_key_level, ('high',), np.greater, num_bars, tolerance)
+    support = _indicator(bars, _fractal_key_level, ('low',), np.less, num_bars, tolerance)
+    sma = _indicator(bars, indicators.sma, ('close',), 50)
+    atr = _indicator(bars, indicators.atr, ('high', 'low', 'close'), 14, method='wilder')
+    previous_close = _previous(close)
+    with np.errstate(invalid='ignore'):
+        tradable = (atr > 0) & (c['spread'] * point <= max_spread * 0.1)
+        buy = (previous_close <= resistance) & (resistance < close) & (close > sma)
+        sell = ~buy & (previous_close >= support) & (support > close) & (close < sma)
+    return _direction(buy & tradable, sell & tradable), sl_atr * atr, sl_atr * rr * atr
+
+
+# newnsrbtc.py: two closes beyond the previous bar's level in the ADX trend direction, 1.5 ATR stop, RR 1:2.
+# ADX runs over the whole history rather than the bot's 200-bar frame, which
+# only differs while Wilder smoothing is warming up.
+def newnsrbtc_signals(bars, point=0.01, window=20, touch_threshold=2, band=0.001, adx_period=14,
+                      adx_threshold=25, sl_atr=1.5, rr=2.0):
+    close = _columns(bars)['close']
+    resistance, support = _indicator(bars, support_resistance_levels, ('high', 'low'), window, touch_threshold, band)
+    resistance, support = _previous(resistance), _previous(support)
+    adx, plus_di, minus_di = _indicator(bars, indicators.adx, ('high', 'low', 'close'), adx_period)
+    atr = _indicator(bars, indicators.atr, ('high', 'low', 'close'), 14)
+    previous_close = _previous(close)
+    with np.errstate(invalid='ignore'):
+        trending = adx > adx_threshold
+        buy = trending & (plus_di > minus_di) & (previous_close > resistance) & (close > resistance)
+        sell = trending & ~(plus_di > minus_di) & (previous_close < support) & (close < support)
+    return _direction(buy, sell), sl_atr * atr, sl_atr * rr * atr
+
+
+# The multisession.py scalpers send orders without SL/TP, so their backtests
+# exit on an ATR stop (`sl_atr`) and an `rr` multiple of it. Signals are taken
+# on every bar; which session runs which strategy is left to the caller.
+
+# multisession.asian_range_breakout: forming bar beyond the 00:00-06:00 range of the last range_period + 50 bars
+def asian_range_breakout_signals(bars, point=0.01, range_period=30, atr_period=14, entry_threshold=0.7,
+                                 sl_atr=1.5, rr=2.0):
+    c = _columns(bars)
+    high, low = c['high'], c['low']
+    seconds = _seconds_of_day(c['time'])
+    # between_time("00:00", "06:00") includes both ends
+    in_range = seconds <= 6 * 3600
+    lookback = range_period + 50
+    range_high = indicators.rolling_max(np.where(in_range, high, -np.inf), lookback)
+    range_low = indicators.rolling_min(np.where(in_range, low, np.inf), lookback)
+    # No range bars in the frame: max() of nothing is NaN and never triggers
+    range_high[np.isinf(range_high)] = np.nan
+    range_low[np.isinf(range_low)] = np.nan
+    atr = _indicator(bars, indicators.atr, ('high', 'low', 'close'), atr_period)
+    with np.errstate(invalid='ignore'):
+        buy = high > range_high + atr * entry_threshold
+        sell = ~buy & (low < range_low - atr * entry_threshold)
+    return _direction(buy, sell), sl_atr * atr, sl_atr * rr * atr
+
+
+# multisession.momentum_scalp: EMA trend with an RSI hook out of 35/65 and the stochastic at an extreme
+def momentum_scalp_signals(bars, point=0.01, ema_fast=8, ema_slow=21, rsi_period=9, stoch_period=14,
+                           sl_atr=1.5, rr=2.0):
+    close = _columns(bars)['close']
+    fast = _indicator(bars, indicators.ema, ('close',), span=ema_fast)
+    slow = _indicator(bars, indicators.ema, ('close',), span=ema_slow)
+    rsi = _indicator(bars, indicators.rsi, ('close',), rsi_period)
+    previous_rsi = _previous(rsi)
+    # %K is 0..100 but the bot compares it with 0.2/0.8; kept as it trades
+    stoch = _indicator(bars, indicators.stochastic, ('high', 'low', 'close'), stoch_period)
+    atr = _indicator(bars, indicators.atr, ('high', 'low', 'close'), 14)
+    with np.errstate(invalid='ignore'):
+        buy = (fast > slow) & (previous_rsi < 35) & (rsi > 40) & (stoch < 0.2)
+        sell = ~buy & (fast < slow) & (previous_rsi > 65) & (rsi < 60) & (stoch > 0.8)
+    return _direction(buy, sell), sl_atr * atr, sl_atr * rr * atr
+
+
+# multisession.volatility_arbitrage: close outside the Bollinger bands with MACD against the move
+def volatility_arbitrage_signals(bars, point=0.01, bollinger_period=20, macd_fast=12, macd_slow=26,
+                                 macd_signal=9, sl_atr=1.5, rr=2.0):
+    c = _columns(bars)
+    close = c['close']
+    _, upper, lower = _indicator(bars, indicators.bollinger, ('close',), bollinger_period, 2)
+    line, signal, _ = _indicator(bars, indicators.macd, ('close',), macd_fast, macd_slow, macd_signal)
+    atr = _indicator(bars, indicators.atr, ('high', 'low', 'close'), 14)
+    with np.errstate(invalid='ignore'):
+        buy = (close < lower) & (line > signal)
+        sell = ~buy & (close > upper) & (line < signal)
+    return _direction(buy, sell), sl_atr * atr, sl_atr * rr * atr
+
+
+def _seconds_of_day(times):
+    if np.issubdtype(times.dtype, np.integer):
+        return times % 86400
+    return (pd.to_datetime(times) - pd.to_datetime(times).normalize()).total_seconds().to_numpy()
+
+
+def _fractals(x, beats):
+    # Bar beats both neighbours on each side (main.detect_support_resistance)
+    found = np.zeros(len(x), dtype=bool)
+    if len(x) >= 5:
+        mid = x[2:-2]
+        found[2:-2] = beats(mid, x[1:-3]) & beats(mid, x[:-4]) & beats(mid, x[3:-1]) & beats(mid, x[4:])
+    return found
+
+
+def _fractal_key_level(values, beats, num_bars, tolerance):
+    # main.py aggregates the fractals inside its bar window into groups of
+    # levels no more than `tolerance` apart and trades the top group's median.
+    # The fractals in the window of bar t are a contiguous run of all the
+    # fractals, so each distinct run is sorted once, as rows of a matrix.
+    n = len(values)
+    level = np.full(n, np.nan)
+    positions = np.flatnonzero(_fractals(values, beats))
+    if len(positions) == 0:
+        return level
+    fractal_values = values[positions]
+    bars = np.arange(n)
+    # A fractal needs two bars either side inside the window
+    lo = np.searchsorted(positions, bars - num_bars + 3, side='left')
+    hi = np.searchsorted(positions, bars - 2, side='right')
+    changed = np.ones(n, dtype=bool)
+    changed[1:] = (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+    run_lo, run_hi = lo[changed], hi[changed]
+    width = max(int((run_hi - run_lo).max()), 1)
+    medians = np.full(len(run_lo), np.nan)
+    step = max(1, CHUNK_CELLS // width)
+    for start in range(0, len(run_lo), step):
+        rows_lo, rows_hi = run_lo[start:start + step], run_hi[start:start + step]
+        index = rows_lo[:, None] + np.arange(width)
+        inside = index < rows_hi[:, None]
+        # Padding sorts to the front and always breaks the chain
+        rows = np.sort(np.where(inside, fractal_values[np.minimum(index, len(positions) - 1)], -np.inf), axis=1)
+        with np.errstate(invalid='ignore'):
+            gaps = np.diff(rows, axis=1) > tolerance
+        # Top group starts after the last gap wider than the tolerance
+        if width > 1:
+            last_gap = np.where(gaps.any(axis=1), width - 1 - np.argmax(gaps[:, ::-1], axis=1), 0)
+        else:
+            last_gap = np.zeros(len(rows), dtype=np.int64)
+        size = width - last_gap
+        row = np.arange(len(rows))
+        median = (rows[row, last_gap + (size - 1) // 2] + rows[row, last_gap + size // 2]) / 2
+        medians[start:start + step] = np.where(rows_hi > rows_lo, median, np.nan)
+    return medians[np.cumsum(changed) - 1]
+
+
+STRATEGIES = {
+    'snr': snr_signals,
+    'h1': h1_signals,
+    'h4new': h4new_signals,
+    'main': main_signals,
+    'newnsrbtc': newnsrbtc_signals,
+    'asian_range_breakout': asian_range_breakout_signals,
+    'momentum_scalp': momentum_scalp_signals,
+    'volatility_arbitrage': volatility_arbitrage_signals,
+}
+
+
+class BacktestResult:
+    """
+    trades: one row per trade (entry/exit bar and time, direction, prices,
+            sl, tp, exit reason, profit in account currency)
+    equity: balance plus the open position's floating profit at every bar close
+    """
+
+    def __init__(self, trades, equity):
+        self.trades = trades
+        self.equity = equity
+
+    def summary(self):
+        profit = self.trades['profit']
+        wins = profit[profit > 0]
+        losses = profit[profit <= 0]
+        peak = np.maximum.accumulate(self.equity.to_numpy()) if len(self.equity) else np.array([])
+        return {
+            'trades': len(profit),
+            'win_rate': len(wins) / len(profit) * 100 if len(profit) else 0.0,
+            'net_profit': profit.sum(),
+            'profit_factor': wins.sum() / -losses.sum() if losses.sum() < 0 else np.inf,
+            'max_drawdown': (peak - self.equity.to_numpy()).max() if len(peak) else 0.0,
+            'final_equity': self.equity.iloc[-1] if len(self.equity) else np.nan,
+        }
+
+
+def run(bars, strategy, point=0.01, volume=0.1, balance=10000.0, both_hit='sl', spec=None,
+        start=0, end=None, **params):
+    """
+    Backtest `strategy` (a STRATEGIES key or a function returning
+    (direction, stop distance, target distance) arrays) over `bars`.
+
+    start/end limit trading to bars [start, end): indicators still see the
+    bars before `start`, and a trade open at `end` is closed on its last bar.
+    """
+    signals = STRATEGIES[strategy] if isinstance(strategy, str) else strategy
+    spec = dict(DEFAULT_SYMBOL_SPEC, point=point, **(spec or {}))
+    c = _columns(bars)
+    n = len(c['close'])
+    end = n if end is None else min(end, n)
+    key = (signals, point, tuple(sorted(params.items())))
+    direction, stop, target = _memo(bars, key, lambda: signals(bars, point=point, **params))
+    with np.errstate(invalid='ignore'):
+        valid = (direction[start:end] != 0) & (stop[start:end] > 0) & (target[start:end] > 0)
+    entries = np.flatnonzero(valid) + start
+
+    spread = c['spread'] * point
+    trades = []
+    bar = start
+    while True:
+        k = np.searchsorted(entries, bar)
+        if k == len(entries):
+            break
+        i = entries[k]
+        side = int(direction[i])
+        price = c['close'][i] + (spread[i] if side > 0 else 0.0)
+        sl = price - side * stop[i]
+        tp = price + side * target[i]
+        exit_bar, exit_price, reason = _exit(c, spread, i, side, sl, tp, both_hit, end)
+        trades.append((i, exit_bar, side, price, exit_price, sl, tp, reason))
+        if reason == 'end':
+            break
+        bar = exit_bar
+
+    return _result(bars, c, spread, trades, volume, balance, spec, start, end)
+
+
+def _exit(c, spread, entry, side, sl, tp, both_hit, end):
+    # First bar after `entry` and before `end` touching sl or tp, scanning in growing chunks
+    start, size = entry + 1, 64
+    while start < end:
+        stop = min(end, start + size)
+        # Buys are closed on the bid, sells on the ask
+        offset = 0.0 if side > 0 else spread[start:stop]
+        opens = c['open'][start:stop] + offset
+        highs = c['high'][start:stop] + offset
+        lows = c['low'][start:stop] + offset
+        if side > 0:
+            stop_hit, target_hit = lows <= sl, highs >= tp
+        else:
+            stop_hit, target_hit = highs >= sl, lows <= tp
+        hits = np.flatnonzero(stop_hit | target_hit)
+        if len(hits):
+            j = hits[0]
+            bar = start + j
+            opened = opens[j]
+            # Gaps through a level fill at the open; otherwise both_hit decides
+            gapped_stop = opened <= sl if side > 0 else opened >= sl
+            gapped_target = opened >= tp if side > 0 else opened <= tp
+            if gapped_stop:
+                return bar, opened, 'sl'
+            if gapped_target:
+                return bar, opened, 'tp'
+            if stop_hit[j] and (not target_hit[j] or both_hit == 'sl'):
+                return bar, sl, 'sl'
+            return bar, tp, 'tp'
+        start, size = stop, size * 4
+    # Still open at the end of the range
+    last = end - 1
+    return last, c['close'][last] + (spread[last] if side < 0 else 0.0), 'end'
+
+
+def _times(bars):
+    def convert():
+        times = _columns(bars)['time']
+        if np.issubdtype(times.dtype, np.integer):
+            return pd.to_datetime(times, unit='s')
+        return pd.DatetimeIndex(pd.to_datetime(times))
+    return _memo(bars, 'times', convert)
+
+
+def _result(bars, c, spread, trades, volume, balance, spec, start, end):
+    columns = ['entry_bar', 'exit_bar', 'direction', 'entry_price', 'exit_price', 'sl', 'tp', 'reason']
+    trades = pd.DataFrame(trades, columns=columns).astype({
+        'entry_bar': np.int64, 'exit_bar': np.int64, 'direction': np.int8,
+        'entry_price': float, 'exit_price': float, 'sl': float, 'tp': float,
+    })
+    per_price = volume * spec['trade_tick_value'] / spec['trade_tick_size']
+    trades['profit'] = (trades['exit_price'] - trades['entry_price']) * trades['direction'] * per_price
+    times = _times(bars)
+    trades.insert(1, 'entry_time', times[trades['entry_bar']])
+    trades.insert(3, 'exit_time', times[trades['exit_bar']])
+
+    # Realised balance at each bar close, plus the open trade marked to the close
+    span = np.arange(start, end)
+    realised = np.zeros(len(span))
+    np.add.at(realised, trades['exit_bar'].to_numpy() - start, trades['profit'].to_numpy())
+    equity = balance + np.cumsum(realised)
+    if len(trades):
+        entry_bar = trades['entry_bar'].to_numpy()
+        exit_bar = trades['exit_bar'].to_numpy()
+        k = np.searchsorted(entry_bar, span, side='right') - 1
+        k_safe = np.maximum(k, 0)
+        open_now = (k >= 0) & (span < exit_bar[k_safe])
+        side = trades['direction'].to_numpy()[k_safe]
+        mark = c['close'][start:end] + np.where(side < 0, spread[start:end], 0.0)
+        floating = (mark - trades['entry_price'].to_numpy()[k_safe]) * side * per_price
+        equity += np.where(open_now, floating, 0.0)
+    return BacktestResult(trades, pd.Series(equity, index=times[start:end], name='equity'))
+
+
+def load_bars(path):
+    if os.path.splitext(path)[1] == '.npy':
+        return np.load(path)
+    return read_rates_csv(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest a bot's signals on historical bars")
+    parser.add_argument('bars', help="RATES_DTYPE .npy or MT5 rates .csv")
+    parser.add_argument('strategy', choices=sorted(STRATEGIES))
+    parser.add_argument('--point', type=float, default=0.01)
+    parser.add_argument('--volume', type=float, default=0.1)
+    parser.add_argument('--balance', type=float, default=10000.0)
+    parser.add_argument('--both-hit', choices=['sl', 'tp'], default='sl')
+    parser.add_argument('--trades', help="write the trade list to this CSV")
+    args = parser.parse_args()
+
+    bars = load_bars(args.bars)
+    started = time.perf_counter()
+    result = run(bars, args.strategy, point=args.point, volume=args.volume,
+                 balance=args.balance, both_hit=args.both_hit)
+    elapsed = time.perf_counter() - started
+    print(f"{args.strategy} on {len(bars)} bars in {elapsed:.2f}s")
+    for name, value in result.summary().items():
+        print(f"{name:>14}: {value:.2f}" if isinstance(value, float) else f"{name:>14}: {value}")
+    if args.trades:
+        result.trades.to_csv(args.trades, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+# Columns of the MT5 rates array, in terminal order
+RATE_FIELDS = ['time', 'open', 'high', 'low', 'close', 'tick_volume', 'spread', 'real_volume']
+
+
+class BarCache:
+    """
+    Per-(symbol, timeframe) cache of MT5 bars.
+
+    The first request for a key pulls the full window from the terminal. After
+    that only the bars from the last closed cached bar onwards are requested
+    (normally that bar, the previously forming one and the current one), merged into a
+    fixed-capacity columnar buffer, and handed back as a DataFrame whose
+    columns are views into that buffer.
+
+    With a BarStore, the window is seeded from the stored history and only
+    bars newer than it are requested; closed bars pulled from the terminal
+    are appended to the store. Seeding needs a whole window stored without
+    a break; after one (a cache that fell too far behind) the window comes
+    from the terminal until the store holds enough bars past it.
+
+    The returned frame is only valid until the next get() for the same key.
+    Adding columns to it is fine; writing into the rate columns is not.
+    """
+
+    def __init__(self, terminal, store=None):
+        # terminal: the MetaTrader5 module (or anything exposing copy_rates_from_pos)
+        self.terminal = terminal
+        self.store = store
+        self._buffers = {}
+
+    def get(self, symbol, timeframe, num_bars):
+        key = (symbol, timeframe)
+        buf = self._buffers.get(key)
+        if buf is None or buf.capacity < num_bars:
+            buf = _BarBuffer(num_bars)
+            self._buffers[key] = buf
+            if not self._load(buf, symbol, timeframe, num_bars):
+                self._merge(buf, symbol, timeframe, self._fetch(symbol, timeframe, num_bars))
+        else:
+            self._update(buf, symbol, timeframe)
+        return buf.frame(num_bars)
+
+    def last_closed_time(self, symbol, timeframe):
+        # Open time of the most recent closed bar, or None before the first get()
+        buf = self._buffers.get((symbol, timeframe))
+        if buf is None or buf.size < 2:
+            return None
+        return buf.columns['time'][buf.end - 2]
+
+    def clear(self, symbol=None, timeframe=None):
+        if symbol is None:
+            self._buffers.clear()
+        else:
+            self._buffers.pop((symbol, timeframe), None)
+
+    def _update(self, buf, symbol, timeframe):
+        # The last closed bar, so the batch overlaps what the store holds
+        last_time = buf.columns['time'][max(buf.start, buf.end - 2)]
+        count = 3
+        while True:
+            rates = self._fetch(symbol, timeframe, count)
+            # Done once the batch reaches back to the last closed bar
+            if _to_datetime(rates['time'][0]) <= last_time or len(rates) < count:
+                break
+            if count >= buf.capacity:
+                # Fell behind by more than a whole window, start over
+                buf.reset()
+                break
+            count = min(count * 4, buf.capacity)
+        self._merge(buf, symbol, timeframe, rates)
+
+    def _load(self, buf, symbol, timeframe, num_bars):
+        # Seed the buffer from the store when it holds a whole window past its last break
+        if self.store is None or self.store.contiguous(symbol, timeframe) < num_bars:
+            return False
+        buf.merge(pd.DataFrame(self.store.tail(symbol, timeframe, num_bars), copy=False))
+        self._update(buf, symbol, timeframe)
+        return True
+
+    def _merge(self, buf, symbol, timeframe, rates):
+        buf.merge(rates)
+        if self.store is not None:
+            # The last bar is still forming
+            self.store.append(symbol, timeframe, rates[:-1])
+
+    def _fetch(self, symbol, timeframe, count):
+        rates = self.terminal.copy_rates_from_pos(symbol, timeframe, 0, count)
+        if rates is None or len(rates) == 0:
+            raise RuntimeError(f"copy_rates_from_pos returned no data for {symbol}")
+        return rates
+
+
+class _BarBuffer:
+    # Columnar ring of twice the capacity, compacted to the front when full so
+    # appends stay amortised O(1) and the live window is always contiguous.
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.start = 0
+        self.end = 0
+        self.columns = {}
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def reset(self):
+        self.start = self.end = 0
+
+    def merge(self, rates):
+        times = _to_datetime(rates['time'])
+        if not self.columns:
+            for name in RATE_FIELDS:
+                dtype = times.dtype if name == 'time' else rates[name].dtype
+                self.columns[name] = np.empty(2 * self.capacity, dtype=dtype)
+
+        # Drop cached bars the new batch supersedes (at least the forming bar)
+        live = self.columns['time'][self.start:self.end]
+        self.end = self.start + int(np.searchsorted(live, times[0]))
+
+        rows = len(rates)
+        if rows > self.capacity:
+            rates, times, rows = rates[-self.capacity:], times[-self.capacity:], self.capacity
+        if self.end + rows > len(self.columns['time']):
+            keep = min(self.size, self.capacity - rows)
+            for col in self.columns.values():
+                col[:keep] = col[self.end - keep:self.end]
+            self.start, self.end = 0, keep
+
+        for name, col in self.columns.items():
+            col[self.end:self.end + rows] = times if name == 'time' else rates[name]
+        self.end += rows
+        self.start = max(self.start, self.end - self.capacity)
+
+    def frame(self, num_bars):
+        lo = max(self.start, self.end - num_bars)
+        return pd.DataFrame(
+            {name: col[lo:self.end] for name, col in self.columns.items()},
+            copy=False,
+        )
+
+
+def _to_datetime(seconds):
+    return np.asarray(seconds, dtype='int64').astype('datetime64[s]').astype('datetime64[ns]')
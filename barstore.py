@@ -0,0 +1,160 @@
+"""
+Local, append-only bar history per symbol and timeframe.
+
+Each RATES_DTYPE field is a raw little-endian column file,
+
+    <root>/<SYMBOL>/<TIMEFRAME>/<field>.bin
+
+read through memory maps, so a date range comes back as NumPy views of the
+files without copying or loading the rest. The time column is sorted and
+doubles as the index: ranges are found by binary search on it. Appends only
+add bars newer than the last stored one. The time column is written last,
+so an append cut short leaves at most some extra bytes in the other
+columns, which the next append trims.
+
+An append that does not reach back to the last stored bar may leave bars
+out before it. Its first bar's time goes to breaks.bin, and contiguous()
+counts only the bars after the newest break, so a window is never read
+across a hole.
+
+    python barstore.py store data/XAUUSD_M1.npy XAUUSD M1
+"""
+import argparse
+import os
+
+import numpy as np
+
+from broker import RATES_DTYPE, TIMEFRAMES, TIMEFRAME_NAMES, read_rates_csv, to_timestamp
+
+
+class BarStore:
+    """
+    Reads give the columns as read-only views that stay valid after later
+    appends; a view only covers the bars stored when it was taken.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._maps = {}
+
+    def count(self, symbol, timeframe):
+        path = self._path(symbol, timeframe, 'time')
+        return os.path.getsize(path) // RATES_DTYPE['time'].itemsize if os.path.exists(path) else 0
+
+    def last_time(self, symbol, timeframe):
+        # Open time of the newest stored bar in epoch seconds, or None when there are none
+        times = self._columns(symbol, timeframe)['time']
+        return int(times[-1]) if len(times) else None
+
+    def read(self, symbol, timeframe, start=None, end=None):
+        """
+        Columns of the bars opened in [start, end) (epoch seconds or
+        datetimes, open-ended when None), as a dict of views.
+        """
+        columns = self._columns(symbol, timeframe)
+        times = columns['time']
+        lo = 0 if start is None else int(np.searchsorted(times, to_timestamp(start)))
+        hi = len(times) if end is None else int(np.searchsorted(times, to_timestamp(end)))
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    def breaks(self, symbol, timeframe):
+        # Open times of the bars that may have a gap before them, ascending
+        path = self._path(symbol, timeframe, 'breaks')
+        return np.fromfile(path, dtype='<i8') if os.path.exists(path) else np.zeros(0, dtype='<i8')
+
+    def contiguous(self, symbol, timeframe):
+        # How many of the newest bars are stored without a gap among them
+        times = self._columns(symbol, timeframe)['time']
+        breaks = self.breaks(symbol, timeframe)
+        if not len(breaks):
+            return len(times)
+        return len(times) - int(np.searchsorted(times, breaks[-1]))
+
+    def tail(self, symbol, timeframe, count):
+        # The newest `count` bars, as views
+        return {name: column[-count:] if count else column[:0]
+                for name, column in self._columns(symbol, timeframe).items()}
+
+    def append(self, symbol, timeframe, rates):
+        """
+        Add the bars of `rates` (a RATES_DTYPE array or mapping of its columns,
+        sorted by time) newer than the last stored one. Returns how many.
+        Only closed bars belong here; a forming bar would be stored as it was.
+        Bars must follow on from the stored ones to count as contiguous with
+        them, so include the last stored bar when the store is not empty.
+        """
+        times = np.asarray(rates['time'], dtype=RATES_DTYPE['time'])
+        last = self.last_time(symbol, timeframe)
+        first = 0 if last is None else int(np.searchsorted(times, last, side='right'))
+        if first == len(times):
+            return 0
+
+        count = self.count(symbol, timeframe)
+        os.makedirs(self._path(symbol, timeframe), exist_ok=True)
+        if last is not None and times[0] > last:
+            self._add_break(symbol, timeframe, int(times[0]))
+        for name in RATES_DTYPE.names[1:] + ('time',):
+            path = self._path(symbol, timeframe, name)
+            dtype = RATES_DTYPE[name]
+            with open(path, 'ab') as f:
+                # Drop what an interrupted append left past the last whole bar
+                f.truncate(count * dtype.itemsize)
+                np.asarray(rates[name][first:], dtype=dtype).tofile(f)
+        self._maps.pop((symbol, timeframe), None)
+        return len(times) - first
+
+    def _add_break(self, symbol, timeframe, time):
+        # Written before the bars: a break left by an append cut short only
+        # makes contiguous() count fewer bars
+        breaks = self.breaks(symbol, timeframe)
+        if not len(breaks) or time > breaks[-1]:
+            with open(self._path(symbol, timeframe, 'breaks'), 'ab') as f:
+                np.asarray([time], dtype='<i8').tofile(f)
+
+    def _columns(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        count = self.count(symbol, timeframe)
+        cached = self._maps.get(key)
+        if cached is None or len(cached['time']) != count:
+            cached = {name: self._map(symbol, timeframe, name, count) for name in RATES_DTYPE.names}
+            self._maps[key] = cached
+        return cached
+
+    def _map(self, symbol, timeframe, name, count):
+        dtype = RATES_DTYPE[name]
+        if count == 0:
+            # mmap cannot map an empty file
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._path(symbol, timeframe, name), dtype=dtype, mode='r', shape=(count,))
+
+    def _path(self, symbol, timeframe, name=None):
+        directory = os.path.join(self.root, symbol, TIMEFRAME_NAMES[timeframe])
+        return directory if name is None else os.path.join(directory, f'{name}.bin')
+
+
+def from_env():
+    # The store at TRADE_BAR_STORE, or None when it is not set
+    root = os.environ.get('TRADE_BAR_STORE')
+    return BarStore(root) if root else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import bars into a bar store")
+    parser.add_argument('root', help="bar store directory")
+    parser.add_argument('bars', help="RATES_DTYPE .npy or MT5 rates .csv")
+    parser.add_argument('symbol')
+    parser.add_argument('timeframe', choices=list(TIMEFRAMES))
+    args = parser.parse_args()
+
+    if os.path.splitext(args.bars)[1] == '.npy':
+        rates = np.load(args.bars, mmap_mode='r')
+    else:
+        rates = read_rates_csv(args.bars)
+    store = BarStore(args.root)
+    timeframe = TIMEFRAMES[args.timeframe]
+    added = store.append(args.symbol, timeframe, rates)
+    print(f"{args.symbol} {args.timeframe}: {added} bars added, {store.count(args.symbol, timeframe)} stored")
+
+
+if __name__ == "__main__":
+    main()
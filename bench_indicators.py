@@ -0,0 +1,105 @@
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import indicators
+
+SIZES = [500, 10_000, 1_000_000]
+
+
+# The pandas versions the bots used before indicators.py
+def pandas_atr(df, period=14):
+    df = df.copy()
+    df['high_low'] = df['high'] - df['low']
+    df['high_close'] = abs(df['high'] - df['close'].shift())
+    df['low_close'] = abs(df['low'] - df['close'].shift())
+    df['tr'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
+    return df['tr'].rolling(period).mean()
+
+
+def pandas_rsi(df, period=9):
+    delta = df['close'].diff()
+    gain = (delta.where(delta > 0, 0)).ewm(alpha=1/period).mean()
+    loss = (-delta.where(delta < 0, 0)).ewm(alpha=1/period).mean()
+    return 100 - (100 / (1 + gain / loss))
+
+
+def pandas_bollinger(df, period=20, dev=2):
+    sma = df['close'].rolling(period).mean()
+    std = df['close'].rolling(period).std()
+    return sma + (std * dev), sma - (std * dev)
+
+
+def pandas_sma(df, period=50):
+    return df['close'].rolling(period).mean()
+
+
+def pandas_macd(df):
+    macd = df['close'].ewm(span=12).mean() - df['close'].ewm(span=26).mean()
+    return macd, macd.ewm(span=9).mean()
+
+
+def pandas_stochastic(df, period=14):
+    low_min = df['low'].rolling(period).min()
+    high_max = df['high'].rolling(period).max()
+    return 100 * (df['close'] - low_min) / (high_max - low_min)
+
+
+def pandas_adx(df, period=14):
+    # newnsrbtc's Wilder ADX with the bar loop, as it was
+    high, low, close = df['high'].values, df['low'].values, df['close'].values
+    plus_dm = high[1:] - high[:-1]
+    minus_dm = low[:-1] - low[1:]
+    plus_dm = np.where((plus_dm > minus_dm) & (plus_dm > 0), plus_dm, 0)
+    minus_dm = np.where((minus_dm > plus_dm) & (minus_dm > 0), minus_dm, 0)
+    tr = np.maximum(np.maximum(high[1:] - low[1:], np.abs(high[1:] - close[:-1])), np.abs(low[1:] - close[:-1]))
+    atr = np.zeros(len(tr))
+    for i in range(len(tr)):
+        atr[i] = tr[:i+1].mean() if i < period else (atr[i-1] * (period - 1) + tr[i]) / period
+    plus_di = 100 * (pd.Series(plus_dm).ewm(alpha=1/period).mean() / atr)
+    minus_di = 100 * (pd.Series(minus_dm).ewm(alpha=1/period).mean() / atr)
+    dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+    return dx.ewm(alpha=1/period).mean()
+
+
+CASES = [
+    ('ATR(14)', pandas_atr, lambda h, l, c: indicators.atr(h, l, c, 14)),
+    ('RSI(9)', pandas_rsi, lambda h, l, c: indicators.rsi(c, 9)),
+    ('Bollinger(20)', pandas_bollinger, lambda h, l, c: indicators.bollinger(c, 20)),
+    ('SMA(50)', pandas_sma, lambda h, l, c: indicators.sma(c, 50)),
+    ('MACD(12,26,9)', pandas_macd, lambda h, l, c: indicators.macd(c)),
+    ('Stochastic(14)', pandas_stochastic, lambda h, l, c: indicators.stochastic(h, l, c, 14)),
+    ('ADX(14)', pandas_adx, lambda h, l, c: indicators.adx(h, l, c, 14)),
+]
+
+
+def make_bars(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2900 + np.cumsum(rng.normal(0, 0.5, n))
+    return pd.DataFrame({
+        'high': close + rng.random(n),
+        'low': close - rng.random(n),
+        'close': close,
+    })
+
+
+def best_of(func, repeat=5):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def main():
+    print(f"{'indicator':<16}{'bars':>10}{'pandas ms':>12}{'numpy ms':>12}{'speedup':>10}")
+    for n in SIZES:
+        df = make_bars(n)
+        high, low, close = df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy()
+        for name, old, new in CASES:
+            old_time = best_of(lambda: old(df))
+            new_time = best_of(lambda: new(high, low, close))
+            print(f"{name:<16}{n:>10}{old_time * 1e3:>12.3f}{new_time * 1e3:>12.3f}{old_time / new_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
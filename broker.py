@@ -0,0 +1,590 @@
+"""
+Broker backends shared by all the bots.
+
+Scripts do `from broker import mt5` and keep calling the MetaTrader5 API on
+it. Which backend answers is picked from the environment:
+
+    TRADE_BROKER=mt5       the real terminal (default, Windows only)
+    TRADE_BROKER=offline   OfflineBroker, bars from TRADE_DATA_DIR
+
+The offline stand-in serves bars and ticks from files, fills market orders at
+the simulated bid/ask, applies SL/TP on the bars it steps over and keeps
+positions, deals and the account balance in memory. Its clock only moves when
+a bot calls mt5.sleep(), so a replay runs as fast as the bot can evaluate.
+"""
+import calendar
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# MT5 rates layout as returned by copy_rates_from_pos
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+
+# MT5 ticks layout as returned by copy_ticks_range
+TICK_DTYPE = np.dtype([
+    ('time', '<i8'), ('bid', '<f8'), ('ask', '<f8'), ('last', '<f8'), ('volume', '<u8'),
+    ('time_msc', '<i8'), ('flags', '<u4'), ('volume_real', '<f8'),
+])
+
+TIMEFRAMES = {
+    'M1': 1, 'M2': 2, 'M3': 3, 'M4': 4, 'M5': 5, 'M6': 6, 'M10': 10, 'M12': 12,
+    'M15': 15, 'M20': 20, 'M30': 30, 'H1': 16385, 'H2': 16386, 'H3': 16387,
+    'H4': 16388, 'H6': 16390, 'H8': 16392, 'H12': 16396, 'D1': 16408,
+    'W1': 32769, 'MN1': 49153,
+}
+TIMEFRAME_NAMES = {value: name for name, value in TIMEFRAMES.items()}
+
+
+def timeframe_seconds(timeframe):
+    # Bar length in seconds; MN1 has no fixed length and returns None
+    name = TIMEFRAME_NAMES[timeframe]
+    unit, count = name[0], int(name[1:] if name != 'MN1' else 0)
+    if unit == 'M' and name != 'MN1':
+        return count * 60
+    if unit == 'H':
+        return count * 3600
+    if unit == 'D':
+        return count * 86400
+    if unit == 'W':
+        return count * 604800
+    return None
+
+
+def to_timestamp(value):
+    # MT5 accepts datetimes or epoch seconds for dates; naive datetimes are server time
+    if isinstance(value, datetime):
+        return calendar.timegm(value.timetuple())
+    return int(value)
+
+
+Tick = namedtuple('Tick', 'time bid ask last volume time_msc flags volume_real')
+SymbolInfo = namedtuple('SymbolInfo', (
+    'name visible digits point spread trade_tick_value trade_tick_size '
+    'trade_contract_size volume_min volume_max volume_step'
+))
+AccountInfo = namedtuple('AccountInfo', 'login balance equity profit margin margin_free leverage currency server')
+TradePosition = namedtuple('TradePosition', (
+    'ticket time type magic identifier volume price_open sl tp '
+    'price_current swap profit symbol comment'
+))
+TradeDeal = namedtuple('TradeDeal', (
+    'ticket order time type entry magic position_id volume price '
+    'commission swap profit symbol comment'
+))
+OrderSendResult = namedtuple('OrderSendResult', 'retcode deal order volume price bid ask comment request')
+
+
+class ReplayFinished(SystemExit):
+    # Not an Exception, so the bots' catch-all error handlers let it through
+    pass
+
+
+class Broker:
+    """
+    The part of the MetaTrader5 API the bots use.
+
+    Constants carry the terminal's values so code written against the real
+    module works unchanged on any backend.
+    """
+
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    POSITION_TYPE_BUY = 0
+    POSITION_TYPE_SELL = 1
+    DEAL_TYPE_BUY = 0
+    DEAL_TYPE_SELL = 1
+    DEAL_ENTRY_IN = 0
+    DEAL_ENTRY_OUT = 1
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_SLTP = 6
+    ORDER_TIME_GTC = 0
+    ORDER_FILLING_FOK = 0
+    ORDER_FILLING_IOC = 1
+    ORDER_FILLING_RETURN = 2
+    TRADE_RETCODE_REQUOTE = 10004
+    TRADE_RETCODE_REJECT = 10006
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_INVALID = 10013
+    TRADE_RETCODE_INVALID_VOLUME = 10014
+    TRADE_RETCODE_INVALID_STOPS = 10016
+    TRADE_RETCODE_MARKET_CLOSED = 10018
+    TRADE_RETCODE_NO_MONEY = 10019
+    COPY_TICKS_ALL = -1
+    COPY_TICKS_INFO = 1
+    COPY_TICKS_TRADE = 2
+
+    # Whether calls may come from a second thread (orders.OrderPipeline's
+    # worker) while the bot keeps calling in
+    threadsafe = True
+
+    def initialize(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def login(self, login, password=None, server=None, timeout=None):
+        raise NotImplementedError
+
+    def shutdown(self):
+        raise NotImplementedError
+
+    def last_error(self):
+        raise NotImplementedError
+
+    def account_info(self):
+        raise NotImplementedError
+
+    def symbol_info(self, symbol):
+        raise NotImplementedError
+
+    def symbol_select(self, symbol, enable=True):
+        raise NotImplementedError
+
+    def symbol_info_tick(self, symbol):
+        raise NotImplementedError
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        raise NotImplementedError
+
+    def copy_ticks_from(self, symbol, date_from, count, flags):
+        raise NotImplementedError
+
+    def order_send(self, request):
+        raise NotImplementedError
+
+    def positions_get(self, symbol=None, ticket=None):
+        raise NotImplementedError
+
+    def history_deals_get(self, date_from=None, date_to=None, position=None):
+        raise NotImplementedError
+
+    def sleep(self, seconds):
+        # Wait between loop iterations; simulated backends advance their clock instead
+        time.sleep(seconds)
+
+    def time(self):
+        # Local clock in epoch seconds; simulated backends return their replay clock
+        return time.time()
+
+
+for _name, _value in TIMEFRAMES.items():
+    setattr(Broker, f'TIMEFRAME_{_name}', _value)
+
+
+class MT5Broker(Broker):
+    # The real terminal, through the MetaTrader5 package
+
+    def __init__(self, module=None):
+        if module is None:
+            import MetaTrader5 as module
+        self.terminal = module
+
+    def __getattr__(self, name):
+        # Anything outside the interface goes straight to the terminal
+        return getattr(self.terminal, name)
+
+    def initialize(self, *args, **kwargs):
+        return self.terminal.initialize(*args, **kwargs)
+
+    def login(self, login, password=None, server=None, timeout=None):
+        kwargs = {'password': password, 'server': server, 'timeout': timeout}
+        return self.terminal.login(login=login, **{k: v for k, v in kwargs.items() if v is not None})
+
+    def shutdown(self):
+        return self.terminal.shutdown()
+
+    def last_error(self):
+        return self.terminal.last_error()
+
+    def account_info(self):
+        return self.terminal.account_info()
+
+    def symbol_info(self, symbol):
+        return self.terminal.symbol_info(symbol)
+
+    def symbol_select(self, symbol, enable=True):
+        return self.terminal.symbol_select(symbol, enable)
+
+    def symbol_info_tick(self, symbol):
+        return self.terminal.symbol_info_tick(symbol)
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        return self.terminal.copy_rates_from_pos(symbol, timeframe, start_pos, count)
+
+    def copy_ticks_from(self, symbol, date_from, count, flags):
+        return self.terminal.copy_ticks_from(symbol, date_from, count, flags)
+
+    def order_send(self, request):
+        return self.terminal.order_send(request)
+
+    def positions_get(self, symbol=None, ticket=None):
+        if ticket is not None:
+            return self.terminal.positions_get(ticket=ticket)
+        if symbol is not None:
+            return self.terminal.positions_get(symbol=symbol)
+        return self.terminal.positions_get()
+
+    def history_deals_get(self, date_from=None, date_to=None, position=None):
+        if position is not None:
+            return self.terminal.history_deals_get(position=position)
+        return self.terminal.history_deals_get(date_from, date_to)
+
+
+# Contract spec used for symbols missing from symbols.json (gold-like, 2 digits)
+DEFAULT_SYMBOL_SPEC = {
+    'digits': 2, 'point': 0.01, 'trade_tick_value': 1.0, 'trade_tick_size': 0.01,
+    'trade_contract_size': 100.0, 'volume_min': 0.01, 'volume_max': 100.0, 'volume_step': 0.01,
+}
+
+
+class OfflineBroker(Broker):
+    """
+    In-process stand-in for the terminal, replaying bars from `data_dir`.
+
+    Files are `<SYMBOL>_<TIMEFRAME>.csv` (MT5 rates columns, `time` as epoch
+    seconds or a date string) or `.npy` arrays of RATES_DTYPE. An optional
+    symbols.json maps symbol names to SymbolInfo fields overriding
+    DEFAULT_SYMBOL_SPEC.
+
+    The bar containing the clock is served as just opened (open = high = low
+    = close), so nothing after `now` leaks into the bots. Ticks are taken from
+    the finest timeframe on disk for the symbol, bid at the bar price and ask
+    `spread` points above. SL/TP are checked against every finer-grained bar
+    the clock steps over, stop first when both are inside one bar.
+    """
+
+    # Positions and the clock are plain dicts and ints, and orders must fill
+    # at the clock the bot sent them at
+    threadsafe = False
+
+    def __init__(self, data_dir, start=None, balance=10000.0, warmup_bars=500):
+        self.data_dir = data_dir
+        self.balance = float(balance)
+        self.warmup_bars = warmup_bars
+        self.now = None if start is None else to_timestamp(start)
+        self._bars = {}
+        self._finest_series = {}
+        self._symbols = {}
+        self._specs = {}
+        self._positions = {}
+        self._deals = []
+        self._next_ticket = 1
+        self._error = (1, 'Success')
+
+        spec_path = os.path.join(data_dir, 'symbols.json')
+        if os.path.exists(spec_path):
+            with open(spec_path) as f:
+                self._specs = json.load(f)
+
+    # ----- session -----
+
+    def initialize(self, *args, **kwargs):
+        return True
+
+    def login(self, login, password=None, server=None, timeout=None):
+        self.account = login
+        return True
+
+    def shutdown(self):
+        return None
+
+    def last_error(self):
+        return self._error
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def time(self):
+        self._ensure_clock()
+        return self.now
+
+    def advance(self, seconds):
+        # Move the clock forward, settling SL/TP hits on the way
+        self._ensure_clock()
+        previous, self.now = self.now, self.now + int(seconds)
+        for position in list(self._positions.values()):
+            self._check_stops(position, previous, self.now)
+        if all(self.now >= bars['time'][-1] + timeframe_seconds(tf)
+               for (_, tf), bars in self._bars.items()):
+            raise ReplayFinished(f"No more bars after {pd.Timestamp(self.now, unit='s')}")
+
+    # ----- market data -----
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        bars = self._load(symbol, timeframe)
+        if bars is None:
+            return None
+        self._ensure_clock()
+        visible = int(np.searchsorted(bars['time'], self.now, side='right'))
+        stop = visible - start_pos
+        if stop <= 0:
+            return bars[:0]
+        rates = bars[max(0, stop - count):stop].copy()
+        forming = rates[-1]
+        if start_pos == 0 and forming['time'] + timeframe_seconds(timeframe) > self.now:
+            forming['high'] = forming['low'] = forming['close'] = forming['open']
+            forming['tick_volume'] = forming['real_volume'] = 0
+        return rates
+
+    def symbol_info_tick(self, symbol):
+        bars, tf = self._finest(symbol)
+        if bars is None:
+            return None
+        self._ensure_clock()
+        i = int(np.searchsorted(bars['time'], self.now, side='right')) - 1
+        if i < 0:
+            return None
+        bar = bars[i]
+        price = bar['open'] if bar['time'] + timeframe_seconds(tf) > self.now else bar['close']
+        point = self.symbol_info(symbol).point
+        bid = float(price)
+        return Tick(self.now, bid, bid + int(bar['spread']) * point, 0.0, 0,
+                    self.now * 1000, 0, 0.0)
+
+    def copy_ticks_from(self, symbol, date_from, count, flags):
+        # The bars carry nothing finer than the current simulated tick
+        tick = self.symbol_info_tick(symbol)
+        if tick is None:
+            return None
+        ticks = np.zeros(0, dtype=TICK_DTYPE)
+        if count > 0 and tick.time >= to_timestamp(date_from):
+            ticks = np.array([tuple(tick)], dtype=TICK_DTYPE)
+        return ticks
+
+    def symbol_info(self, symbol):
+        if symbol not in self._symbols:
+            spec = {**DEFAULT_SYMBOL_SPEC, **self._specs.get(symbol, {})}
+            bars, _ = self._finest(symbol)
+            if bars is None:
+                return None
+            self._symbols[symbol] = SymbolInfo(name=symbol, visible=True, spread=int(bars['spread'][-1]), **spec)
+        return self._symbols[symbol]
+
+    def symbol_select(self, symbol, enable=True):
+        return True
+
+    # ----- account and trading -----
+
+    def account_info(self):
+        profit = sum(self._floating(p) for p in self._positions.values())
+        equity = self.balance + profit
+        return AccountInfo(getattr(self, 'account', 0), self.balance, equity, profit,
+                           0.0, equity, 100, 'USD', 'Offline')
+
+    def positions_get(self, symbol=None, ticket=None):
+        positions = self._positions.values()
+        if ticket is not None:
+            positions = [p for p in positions if p['ticket'] == ticket]
+        elif symbol is not None:
+            positions = [p for p in positions if p['symbol'] == symbol]
+        return tuple(self._position_tuple(p) for p in positions)
+
+    def history_deals_get(self, date_from=None, date_to=None, position=None):
+        if position is not None:
+            return tuple(d for d in self._deals if d.position_id == position)
+        start = to_timestamp(date_from) if date_from is not None else None
+        stop = to_timestamp(date_to) if date_to is not None else None
+        return tuple(d for d in self._deals
+                     if (start is None or d.time >= start) and (stop is None or d.time <= stop))
+
+    def order_send(self, request):
+        symbol = request.get('symbol')
+        tick = self.symbol_info_tick(symbol) if symbol else None
+        if tick is None:
+            return self._result(request, self.TRADE_RETCODE_INVALID, 'Unknown symbol')
+
+        if request.get('action') == self.TRADE_ACTION_SLTP:
+            position = self._positions.get(request.get('position'))
+            if position is None:
+                return self._result(request, self.TRADE_RETCODE_INVALID, 'Position not found', tick)
+            position['sl'] = request.get('sl', 0.0) or 0.0
+            position['tp'] = request.get('tp', 0.0) or 0.0
+            return self._result(request, self.TRADE_RETCODE_DONE, 'Request executed', tick)
+
+        if request.get('action') != self.TRADE_ACTION_DEAL:
+            return self._result(request, self.TRADE_RETCODE_INVALID, 'Unsupported action', tick)
+
+        spec = self.symbol_info(symbol)
+        volume = float(request.get('volume', 0))
+        if not spec.volume_min <= volume <= spec.volume_max:
+            return self._result(request, self.TRADE_RETCODE_INVALID_VOLUME, 'Invalid volume', tick)
+
+        order_type = request.get('type')
+        price = tick.ask if order_type == self.ORDER_TYPE_BUY else tick.bid
+
+        if request.get('position'):
+            position = self._positions.get(request['position'])
+            if position is None:
+                return self._result(request, self.TRADE_RETCODE_INVALID, 'Position not found', tick)
+            deal = self._close(position, price, request.get('comment', ''))
+            return self._result(request, self.TRADE_RETCODE_DONE, 'Request executed', tick,
+                                deal=deal.ticket, order=deal.order, volume=volume, price=price)
+
+        ticket = self._ticket()
+        position = {
+            'ticket': ticket, 'time': self.now, 'type': order_type, 'symbol': symbol,
+            'volume': volume, 'price_open': price,
+            'sl': float(request.get('sl', 0.0) or 0.0), 'tp': float(request.get('tp', 0.0) or 0.0),
+            'magic': request.get('magic', 0), 'comment': request.get('comment', ''),
+        }
+        self._positions[ticket] = position
+        deal = self._deal(position, price, self.DEAL_ENTRY_IN, 0.0, ticket)
+        return self._result(request, self.TRADE_RETCODE_DONE, 'Request executed', tick,
+                            deal=deal.ticket, order=ticket, volume=volume, price=price)
+
+    # ----- internals -----
+
+    def _load(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        if key not in self._bars:
+            base = os.path.join(self.data_dir, f"{symbol}_{TIMEFRAME_NAMES[timeframe]}")
+            if os.path.exists(base + '.npy'):
+                bars = np.load(base + '.npy').astype(RATES_DTYPE)
+            elif os.path.exists(base + '.csv'):
+                bars = read_rates_csv(base + '.csv')
+            else:
+                self._error = (-2, f"No data for {symbol} {TIMEFRAME_NAMES[timeframe]}")
+                return None
+            self._bars[key] = bars
+        return self._bars[key]
+
+    def _finest(self, symbol):
+        if symbol not in self._finest_series:
+            found = None, None
+            for timeframe in sorted(TIMEFRAME_NAMES, key=lambda tf: timeframe_seconds(tf) or 1 << 40):
+                bars = self._load(symbol, timeframe) if timeframe_seconds(timeframe) else None
+                if bars is not None and len(bars):
+                    found = bars, timeframe
+                    break
+            self._finest_series[symbol] = found
+        return self._finest_series[symbol]
+
+    def _ensure_clock(self):
+        if self.now is not None:
+            return
+        if not self._bars:
+            raise RuntimeError("OfflineBroker has no data loaded to start the clock from")
+        # Start where every loaded series has its warm-up history behind it
+        self.now = max(
+            int(bars['time'][min(self.warmup_bars, len(bars) - 1)])
+            for bars in self._bars.values()
+        )
+
+    def _check_stops(self, position, start, stop):
+        bars, tf = self._finest(position['symbol'])
+        seconds = timeframe_seconds(tf)
+        # Bars that completed between the two clock readings
+        lo = int(np.searchsorted(bars['time'], start - seconds, side='right'))
+        hi = int(np.searchsorted(bars['time'], stop - seconds, side='right'))
+        point = self.symbol_info(position['symbol']).point
+        is_buy = position['type'] == self.ORDER_TYPE_BUY
+        sl, tp = position['sl'], position['tp']
+        for bar in bars[lo:hi]:
+            # Buys close on the bid, sells on the ask
+            offset = 0.0 if is_buy else int(bar['spread']) * point
+            high, low = bar['high'] + offset, bar['low'] + offset
+            if is_buy:
+                if sl and low <= sl:
+                    return self._close(position, sl, 'sl', bar['time'] + seconds)
+                if tp and high >= tp:
+                    return self._close(position, tp, 'tp', bar['time'] + seconds)
+            else:
+                if sl and high >= sl:
+                    return self._close(position, sl, 'sl', bar['time'] + seconds)
+                if tp and low <= tp:
+                    return self._close(position, tp, 'tp', bar['time'] + seconds)
+        return None
+
+    def _close(self, position, price, comment, when=None):
+        del self._positions[position['ticket']]
+        profit = self._profit(position, price)
+        self.balance += profit
+        return self._deal(position, price, self.DEAL_ENTRY_OUT, profit, self._ticket(), comment, when)
+
+    def _deal(self, position, price, entry, profit, order, comment=None, when=None):
+        deal_type = position['type'] if entry == self.DEAL_ENTRY_IN else 1 - position['type']
+        deal = TradeDeal(
+            ticket=self._ticket(), order=order, time=int(when or self.now), type=deal_type,
+            entry=entry, magic=position['magic'], position_id=position['ticket'],
+            volume=position['volume'], price=float(price), commission=0.0, swap=0.0,
+            profit=float(profit), symbol=position['symbol'],
+            comment=position['comment'] if comment is None else comment,
+        )
+        self._deals.append(deal)
+        return deal
+
+    def _profit(self, position, price):
+        spec = self.symbol_info(position['symbol'])
+        direction = 1 if position['type'] == self.ORDER_TYPE_BUY else -1
+        ticks = (price - position['price_open']) * direction / spec.trade_tick_size
+        return ticks * spec.trade_tick_value * position['volume']
+
+    def _floating(self, position):
+        tick = self.symbol_info_tick(position['symbol'])
+        price = tick.bid if position['type'] == self.ORDER_TYPE_BUY else tick.ask
+        return self._profit(position, price)
+
+    def _position_tuple(self, position):
+        tick = self.symbol_info_tick(position['symbol'])
+        current = tick.bid if position['type'] == self.ORDER_TYPE_BUY else tick.ask
+        return TradePosition(
+            ticket=position['ticket'], time=position['time'], type=position['type'],
+            magic=position['magic'], identifier=position['ticket'], volume=position['volume'],
+            price_open=position['price_open'], sl=position['sl'], tp=position['tp'],
+            price_current=current, swap=0.0, profit=self._profit(position, current),
+            symbol=position['symbol'], comment=position['comment'],
+        )
+
+    def _ticket(self):
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        return ticket
+
+    def _result(self, request, retcode, comment, tick=None, deal=0, order=0, volume=0.0, price=0.0):
+        self._error = (1, 'Success') if retcode == self.TRADE_RETCODE_DONE else (retcode, comment)
+        return OrderSendResult(
+            retcode=retcode, deal=deal, order=order, volume=volume, price=price,
+            bid=tick.bid if tick else 0.0, ask=tick.ask if tick else 0.0,
+            comment=comment, request=request,
+        )
+
+
+def read_rates_csv(path):
+    df = pd.read_csv(path)
+    if not np.issubdtype(df['time'].dtype, np.integer):
+        df['time'] = pd.to_datetime(df['time']).astype('datetime64[s]').astype('int64')
+    rates = np.zeros(len(df), dtype=RATES_DTYPE)
+    for name in RATES_DTYPE.names:
+        if name in df:
+            rates[name] = df[name].to_numpy()
+    rates['time'] = df['time'].to_numpy()
+    return np.sort(rates, order='time')
+
+
+def connect(backend=None):
+    backend = backend or os.environ.get('TRADE_BROKER', 'mt5')
+    if backend == 'mt5':
+        return MT5Broker()
+    if backend == 'offline':
+        start = os.environ.get('TRADE_START')
+        return OfflineBroker(
+            data_dir=os.environ.get('TRADE_DATA_DIR', 'data'),
+            start=int(start) if start else None,
+            balance=float(os.environ.get('TRADE_BALANCE', 10000)),
+        )
+    raise ValueError(f"Unknown broker backend: {backend}")
+
+
+def __getattr__(name):
+    # `from broker import mt5` connects on first use, so helper modules can
+    # import this one on machines without the terminal
+    if name == 'mt5':
+        globals()['mt5'] = connect()
+        return globals()['mt5']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
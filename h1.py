@@ -1,8 +1,13 @@
-import MetaTrader5 as mt5
-import pandas as pd
-import time
-import numpy as np
+from broker import mt5
 from datetime import datetime
+from support_resistance import detect_support_resistance
+import indicators
+import barstore
+import journal
+from metadata import MetadataCache
+from orders import OrderPipeline
+from resample import ResampledFeed
+from scheduler import BarScheduler
 
 # Initialize MT5 connection
 def initialize_mt5():
@@ -21,51 +26,31 @@ def login_mt5(account, password, server):
     print(f"Connected to account #{account}")
     return True
 
+# Higher-timeframe bars are resampled from one cached M1 feed; only new M1 bars are pulled
+bar_feed = ResampledFeed(mt5, store=barstore.from_env())
+
+# Specs, quotes and account state for the order path, one snapshot per decision
+metadata = MetadataCache(mt5)
+
+# Fills go to the shared trade journal, written off the loop
+trade_journal = journal.from_env("h1", clock=mt5.time)
+
+# Orders are sent off the analysis loop and reported back by orders.poll()
+orders = OrderPipeline(mt5)
+
 # Fetch historical data
 def get_historical_data(symbol, timeframe, num_bars):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_bars)
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
+    df = bar_feed.get(symbol, timeframe, num_bars)
     return df
 
 # Calculate Average True Range (ATR)
 def calculate_atr(df, period=14):
-    high = df['high']
-    low = df['low']
-    close = df['close']
-    
-    tr = np.maximum(high - low, 
-                   np.maximum(abs(high - close.shift()), 
-                            abs(low - close.shift())))
-    df['ATR'] = tr.rolling(period).mean()
+    df['ATR'] = indicators.atr(df['high'], df['low'], df['close'], period)
     return df
 
 # Calculate Simple Moving Average
 def calculate_sma(df, period=200):
-    df['SMA'] = df['close'].rolling(period).mean()
-    return df
-
-# Detect support and resistance levels
-def detect_support_resistance(df, window=20, touch_threshold=2):
-    df = df.copy()
-    df['resistance'] = None
-    df['support'] = None
-
-    for i in range(window, len(df)):
-        current_high = df['high'].iloc[i-window:i].max()
-        current_low = df['low'].iloc[i-window:i].min()
-
-
-        resistance_touches = sum((df['high'].iloc[i-window:i] >= current_high * 0.999) & 
-                                (df['high'].iloc[i-window:i] <= current_high * 1.001))
-        support_touches = sum((df['low'].iloc[i-window:i] >= current_low * 0.999) & 
-                             (df['low'].iloc[i-window:i] <= current_low * 1.001))
-
-        if resistance_touches >= touch_threshold:
-            df.loc[i, 'resistance'] = current_high
-        if support_touches >= touch_threshold:
-            df.loc[i, 'support'] = current_low
-
+    df['SMA'] = indicators.sma(df['close'], period)
     return df
 
 # Generate trading signals with confirmation and trend filter
@@ -103,7 +88,7 @@ def generate_signal(df):
 # Dynamic position sizing based on volatility
 def calculate_position_size(df, risk_percent=0.02):
     return 0.1
-    account_info = mt5.account_info()
+    account_info = metadata.account_info()
     if not account_info:
         return 0.01  # Default lot size
     
@@ -126,18 +111,18 @@ def calculate_position_size(df, risk_percent=0.02):
 
 # Execute trade with enhanced features
 def execute_trade(symbol, signal, df):
-    symbol_info = mt5.symbol_info(symbol)
+    symbol_info = metadata.symbol_info(symbol)
     if not symbol_info:
         print(f"Failed to get info for {symbol}")
         return
 
     if not symbol_info.visible:
-        if not mt5.symbol_select(symbol, True):
+        if not metadata.symbol_select(symbol, True):
             print("Symbol select failed")
             return
 
     point = symbol_info.point
-    price = mt5.symbol_info_tick(symbol).ask if signal == 'BUY' else mt5.symbol_info_tick(symbol).bid
+    price = metadata.symbol_info_tick(symbol).ask if signal == 'BUY' else metadata.symbol_info_tick(symbol).bid
     
     # Calculate position size
     lot_size = calculate_position_size(df)
@@ -166,13 +151,18 @@ def execute_trade(symbol, signal, df):
         "type_filling": mt5.ORDER_FILLING_FOK,
     }
 
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        print(f"Order failed: {result.comment}")
+    orders.submit(request, on_event=report_trade)
+
+
+def report_trade(event):
+    metadata.on_order(event)
+    request = event.request
+    if event.kind != 'filled':
+        print(f"Order {event.kind}: {event.result.comment if event.result else event.error}")
     else:
+        price, sl, tp, lot_size = (request[k] for k in ('price', 'sl', 'tp', 'volume'))
         print(f"Executed {lot_size} lots at {price} | SL: {sl:.2f} | TP: {tp:.2f}")
-        with open('trades_h1.csv', 'a') as f:
-            f.write(f"{datetime.now()},{symbol},{signal},price:{price},sl:{sl},tp:{tp},lot_size:{lot_size}\n")
+        trade_journal.record_order(request, event.result)
 
 # Main trading loop
 def main():
@@ -181,7 +171,6 @@ def main():
     num_bars = 500
     executed = 0
     window = 20
-    check_interval = 900  # 15 minutes
 
     if not initialize_mt5():
         return
@@ -190,39 +179,42 @@ def main():
     if not login_mt5(account=239634700, password="B6D4YAMdemo_", server="Exness-MT5Trial6"):
         return
 
-    while True:
-        try:
-            print(f"\n{datetime.now()} - Analyzing market...")
-            df = get_historical_data(symbol, timeframe, num_bars)
-            df = calculate_sma(df, 200)
-            df = calculate_atr(df, 14)
-            df = detect_support_resistance(df, window)
-            
-            signal = generate_signal(df)
-            
-            print(f"Price: {df['close'].iloc[-1]:.2f}")
-            print(f"SMA(200): {df['SMA'].iloc[-1]:.2f}")
-            print(f"ATR(14): {df['ATR'].iloc[-1]:.2f}")
-            if(df['resistance'].dropna().empty):
-                print("No resistance")
-            else:
-                print(f"Resistance: {df['resistance'].iloc[-1]}")
-            if(df['support'].dropna().empty):
-                print("No support")
-            else:
-                print(f"Support: {df['support'].iloc[-1]}")
-            print(f"Signal: {signal}")
-            print(f"Executed: {executed}")
-
-            if signal in ['BUY', 'SELL']:
-                execute_trade(symbol, signal, df)
-                executed += 1
-
-            time.sleep(check_interval)
-
-        except Exception as e:
-            print(f"Error: {str(e)}")
-            time.sleep(60)
+    def analyze(symbol, timeframe):
+        nonlocal executed
+        orders.poll()
+        metadata.refresh(symbol)
+        print(f"\n{datetime.now()} - Analyzing market...")
+        df = get_historical_data(symbol, timeframe, num_bars)
+        df = calculate_sma(df, 200)
+        df = calculate_atr(df, 14)
+        df = detect_support_resistance(df, window)
+        
+        signal = generate_signal(df)
+        
+        print(f"Price: {df['close'].iloc[-1]:.2f}")
+        print(f"SMA(200): {df['SMA'].iloc[-1]:.2f}")
+        print(f"ATR(14): {df['ATR'].iloc[-1]:.2f}")
+        if(df['resistance'].dropna().empty):
+            print("No resistance")
+        else:
+            print(f"Resistance: {df['resistance'].iloc[-1]}")
+        if(df['support'].dropna().empty):
+            print("No support")
+        else:
+            print(f"Support: {df['support'].iloc[-1]}")
+        print(f"Signal: {signal}")
+        print(f"Executed: {executed}")
+
+        if signal in ['BUY', 'SELL']:
+            execute_trade(symbol, signal, df)
+            executed += 1
+
+    scheduler = BarScheduler(mt5, feed=bar_feed)
+    # Order results are picked up between bars too
+    scheduler.register(symbol, timeframe, on_bar=analyze, on_tick=lambda symbol, tick: orders.poll())
+    scheduler.run()
+    orders.stop()
+    orders.poll()
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,16 @@
-import MetaTrader5 as mt5
+from broker import mt5
 import pandas as pd
-import time
 from datetime import datetime
 import warnings
-import numpy as np
+from support_resistance import detect_support_resistance
+import indicators
+import barstore
+import journal
+from metadata import MetadataCache
+from orders import OrderPipeline
+from positions import PositionBook
+from resample import ResampledFeed
+from scheduler import BarScheduler
 
 warnings.filterwarnings("ignore", category=pd.errors.ChainedAssignmentError)
 
@@ -24,78 +31,47 @@ def login_mt5(account, password, server):
     print(f"Connected to account #{account}")
     return True
 
-# Fetch historical data
-def get_historical_data(symbol, timeframe, num_bars):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_bars)
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    return df
-
-# Detect support and resistance levels
-def detect_support_resistance(df, window=50, touch_threshold=2):
-    df = df.copy()
-    df['resistance'] = None
-    df['support'] = None
-
-    for i in range(window, len(df)):
-        lookback_start = i - window
-        current_window = df.iloc[lookback_start:i]
+# Higher-timeframe bars are resampled from one cached M1 feed; only new M1 bars are pulled
+bar_feed = ResampledFeed(mt5, store=barstore.from_env())
 
-        current_high = current_window['high'].max()
-        current_low = current_window['low'].min()
+# Specs, quotes and account state for the order path, one snapshot per decision
+metadata = MetadataCache(mt5)
 
-        resistance_touches = sum(
-            (current_window['high'] >= current_high * 0.999) &
-            (current_window['high'] <= current_high * 1.001)
-        )
+# Fills go to the shared trade journal, written off the loop
+trade_journal = journal.from_env("h4new", clock=mt5.time)
 
-        support_touches = sum(
-            (current_window['low'] >= current_low * 0.999) &
-            (current_window['low'] <= current_low * 1.001)
-        )
+# Open positions, kept from our order results and a periodic diff against the terminal
+position_book = PositionBook(mt5)
 
-        if resistance_touches >= touch_threshold:
-            df.loc[i, 'resistance'] = current_high
-        if support_touches >= touch_threshold:
-            df.loc[i, 'support'] = current_low
+# Orders are sent off the analysis loop and reported back by orders.poll()
+orders = OrderPipeline(mt5)
 
+# Fetch historical data
+def get_historical_data(symbol, timeframe, num_bars):
+    df = bar_feed.get(symbol, timeframe, num_bars)
     return df
 
 # Calculate ATR for dynamic SL and TP
 def calculate_atr(df, period=14):
-    df['high_low'] = df['high'] - df['low']
-    df['high_close'] = abs(df['high'] - df['close'].shift())
-    df['low_close'] = abs(df['low'] - df['close'].shift())
-    df['tr'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
-    df['atr'] = df['tr'].rolling(window=period).mean()
-    return df['atr'].iloc[-1]
+    return indicators.atr(df['high'], df['low'], df['close'], period)[-1]
 
 # Calculate SMA
 def calculate_sma(df, period):
-    return df['close'].rolling(window=period).mean()
+    return indicators.sma(df['close'], period)
 
 # Calculate ADX
 def calculate_adx(df, period=14):
-    df['plus_dm'] = np.where((df['high'] - df['high'].shift(1)) > (df['low'].shift(1) - df['low']),
-                             (df['high'] - df['high'].shift(1)).clip(lower=0), 0)
-    df['minus_dm'] = np.where((df['low'].shift(1) - df['low']) > (df['high'] - df['high'].shift(1)),
-                              (df['low'].shift(1) - df['low']).clip(lower=0), 0)
-
-    df['plus_di'] = 100 * (df['plus_dm'].rolling(window=period).mean() / df['tr'].rolling(window=period).mean())
-    df['minus_di'] = 100 * (df['minus_dm'].rolling(window=period).mean() / df['tr'].rolling(window=period).mean())
-    df['dx'] = 100 * abs(df['plus_di'] - df['minus_di']) / (df['plus_di'] + df['minus_di'])
-    df['adx'] = df['dx'].rolling(window=period).mean()
-    return df['adx'].iloc[-1]
+    return indicators.adx(df['high'], df['low'], df['close'], period, method='sma')[0][-1]
 # Generate signal with new strategy
 def generate_signal(df):
     if len(df) < 50:  # Need enough data for SMA and ADX
         return 'HOLD'
 
     # Calculate SMAs
-    sma_short = calculate_sma(df, period=20).iloc[-1]
-    sma_long = calculate_sma(df, period=50).iloc[-1]
-    sma_short_prev = calculate_sma(df, period=20).iloc[-2]
-    sma_long_prev = calculate_sma(df, period=50).iloc[-2]
+    sma_20 = calculate_sma(df, period=20)
+    sma_50 = calculate_sma(df, period=50)
+    sma_short, sma_short_prev = sma_20[-1], sma_20[-2]
+    sma_long, sma_long_prev = sma_50[-1], sma_50[-2]
 
     # Calculate ADX
     adx = calculate_adx(df)
@@ -122,7 +98,7 @@ def generate_signal(df):
 
 # Calculate dynamic lot size
 def calculate_lot_size(balance, risk_percentage, stop_loss_pips, symbol):
-    symbol_info = mt5.symbol_info(symbol)
+    symbol_info = metadata.symbol_info(symbol)
     if symbol_info is None:
         print(f"Failed to get info for {symbol}")
         return 0.01
@@ -134,32 +110,31 @@ def calculate_lot_size(balance, risk_percentage, stop_loss_pips, symbol):
 
 # Execute trade
 def execute_trade(symbol, signal, df, risk_percentage=1.0):
-    positions = mt5.positions_get(symbol=symbol)
-    if positions:
+    if position_book.has_position(symbol):
         print(f"Position already open for {symbol}, skipping trade.")
         return
 
-    account_info = mt5.account_info()
+    account_info = metadata.account_info()
     if account_info is None:
         print("Failed to get account info")
         return
 
     balance = account_info.balance
-    symbol_info = mt5.symbol_info(symbol)
+    symbol_info = metadata.symbol_info(symbol)
     if symbol_info is None:
         print(f"Failed to get info for {symbol}")
         return
 
     if not symbol_info.visible:
-        if not mt5.symbol_select(symbol, True):
+        if not metadata.symbol_select(symbol, True):
             print("Symbol select failed")
             return
 
     point = symbol_info.point
-    price = mt5.symbol_info_tick(symbol).ask if signal == 'BUY' else mt5.symbol_info_tick(symbol).bid
+    price = metadata.symbol_info_tick(symbol).ask if signal == 'BUY' else metadata.symbol_info_tick(symbol).bid
     deviation = 20
-    ask_price = mt5.symbol_info_tick(symbol).ask
-    bid_price = mt5.symbol_info_tick(symbol).bid
+    ask_price = metadata.symbol_info_tick(symbol).ask
+    bid_price = metadata.symbol_info_tick(symbol).bid
     spread = ask_price - bid_price
     atr = calculate_atr(df)
     sl_pips = atr * 2.0
@@ -192,13 +167,19 @@ def execute_trade(symbol, signal, df, risk_percentage=1.0):
         "type_filling": mt5.ORDER_FILLING_FOK,
     }
 
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        print(f"Order failed: {result.comment}")
+    orders.submit(request, on_event=report_trade)
+
+
+def report_trade(event):
+    metadata.on_order(event)
+    position_book.on_order(event)
+    request = event.request
+    if event.kind != 'filled':
+        print(f"Order {event.kind}: {event.result.comment if event.result else event.error}")
     else:
+        price, sl, tp, lot_size = (request[k] for k in ('price', 'sl', 'tp', 'volume'))
         print(f"Executed {lot_size} lots at {price} | SL: {sl:.2f} | TP: {tp:.2f}")
-        with open('trades_swing_v2.csv', 'a') as f:
-            f.write(f"{datetime.now()},{symbol},{signal},price:{price},sl:{sl},tp:{tp},lot_size:{lot_size}\n")
+        trade_journal.record_order(request, event.result)
 
 # Illustrate price levels
 def illustrate_levels(current_price, resistance, support):
@@ -232,7 +213,6 @@ def main():
     timeframe = mt5.TIMEFRAME_H4
     num_bars = 500
     window = 50
-    check_interval = 60
 
     if not initialize_mt5():
         return
@@ -240,41 +220,36 @@ def main():
     if not login_mt5(239634700, password="B6D4YAMdemo_", server="Exness-MT5Trial6"):
         return
 
-    last_bar_time = None
-    while True:
-        try:
-            print(f"\nChecking market at {datetime.now()}")
-            latest_bar = mt5.copy_rates_from_pos(symbol, timeframe, 0, 1)[0]
-            current_bar_time = latest_bar['time']
-
-            if last_bar_time is None or current_bar_time > last_bar_time:
-                last_bar_time = current_bar_time
-                df = get_historical_data(symbol, timeframe, num_bars)
-                df = detect_support_resistance(df, window=window)
-                calculate_atr(df)  # Ensure necessary columns are present
-                signal = generate_signal(df)
-
-                current_price = df['close'].iloc[-1]
-                resistance = df['resistance'].iloc[-1]
-                support = df['support'].iloc[-1]
-
-                print(f"Current Price: {current_price:.2f}")
-                print(f"Latest Resistance: {resistance}" if not pd.isna(resistance) else "No resistance")
-                print(f"Latest Support: {support}" if not pd.isna(support) else "No support")
-                print(f"Signal: {signal}")
-
-                illustrate_levels(current_price, resistance, support)
-
-                if signal in ['BUY', 'SELL']:
-                    execute_trade(symbol, signal, df, risk_percentage=1.0)
-            else:
-                print("No new bar, waiting...")
-
-            time.sleep(check_interval)
-
-        except Exception as e:
-            print(f"Error occurred: {str(e)}")
-            time.sleep(60)
+    # Runs once per closed H4 bar
+    def analyze(symbol, timeframe):
+        orders.poll()
+        metadata.refresh(symbol)
+        position_book.sync()
+        df = get_historical_data(symbol, timeframe, num_bars)
+        df = detect_support_resistance(df, window=window)
+        signal = generate_signal(df)
+
+        current_price = df['close'].iloc[-1]
+        resistance = df['resistance'].iloc[-1]
+        support = df['support'].iloc[-1]
+
+        print(f"\nChecking market at {datetime.now()}")
+        print(f"Current Price: {current_price:.2f}")
+        print(f"Latest Resistance: {resistance}" if not pd.isna(resistance) else "No resistance")
+        print(f"Latest Support: {support}" if not pd.isna(support) else "No support")
+        print(f"Signal: {signal}")
+
+        illustrate_levels(current_price, resistance, support)
+
+        if signal in ['BUY', 'SELL']:
+            execute_trade(symbol, signal, df, risk_percentage=1.0)
+
+    scheduler = BarScheduler(mt5, feed=bar_feed)
+    # Order results are picked up between bars too
+    scheduler.register(symbol, timeframe, on_bar=analyze, on_tick=lambda symbol, tick: orders.poll())
+    scheduler.run()
+    orders.stop()
+    orders.poll()
     
 
 if __name__ == "__main__":
@@ -0,0 +1,313 @@
+"""
+Indicators shared by the bots, on plain NumPy arrays.
+
+Every function takes array-likes (Series are fine), never writes to its
+inputs, and returns float64 arrays of the input length with NaN where the
+indicator is not defined yet. Conventions follow the pandas code they
+replace: rolling windows need a full window, std uses ddof=1 and ema()
+matches Series.ewm(...).mean() with adjust=True.
+"""
+import numpy as np
+
+# Bars per block in the blocked rolling sums and recursive filters
+BLOCK = 4096
+
+
+def _values(x):
+    return np.asarray(x, dtype=float)
+
+
+def _linear_filter(x, decay, initial=0.0):
+    # y[t] = x[t] + decay * y[t-1], with y[-1] = initial
+    #
+    # Solved in closed form over blocks of B bars laid out as rows:
+    # y[k] = decay^k * cumsum(x[j] / decay^j) within a row, then each row is
+    # shifted by the carry from the end of the row before. B is capped so
+    # decay^-B stays far from overflow.
+    x = _values(x)
+    n = len(x)
+    if n == 0 or decay == 0:
+        y = x.copy()
+        if n:
+            y[0] += decay * initial
+        return y
+    size = BLOCK if decay == 1 else max(1, min(BLOCK, int(300 / -np.log(decay))))
+    size = min(size, n)
+    rows = -(-n // size)
+    powers = decay ** np.arange(size + 1)
+    blocks = np.empty(rows * size)
+    blocks[:n] = x
+    blocks[n:] = 0.0
+    blocks = blocks.reshape(rows, size)
+    blocks *= 1.0 / powers[:size]
+    np.cumsum(blocks, axis=1, out=blocks)
+    blocks *= powers[:size]
+
+    carries = np.empty(rows)
+    carry = initial
+    for row, end in enumerate(blocks[:, -1]):
+        carries[row] = carry
+        carry = end + powers[size] * carry
+    blocks += carries[:, None] * powers[1:]
+    return blocks.ravel()[:n]
+
+
+def _first_valid(x):
+    if len(x) == 0 or not np.isnan(x[0]):
+        return 0
+    valid = np.flatnonzero(~np.isnan(x))
+    return valid[0] if len(valid) else len(x)
+
+
+def _rolling_moments(x, period):
+    # Rolling mean and variance (ddof=1) from blocked running sums. Each block
+    # is centred on its own mean before summing so the sums stay small and
+    # the variance does not lose precision to cancellation.
+    x = _values(x)
+    n = len(x)
+    mean = np.full(n, np.nan)
+    var = np.full(n, np.nan)
+    if n < period:
+        return mean, var
+    missing = np.isnan(x)
+    for end in range(period - 1, n, BLOCK):
+        stop = min(end + BLOCK, n)
+        segment = x[end - period + 1:stop]
+        gaps = missing[end - period + 1:stop]
+        ref = segment[~gaps].mean() if not gaps.all() else 0.0
+        centred = np.where(gaps, 0.0, segment - ref)
+        s1 = np.concatenate(([0.0], np.cumsum(centred)))
+        s2 = np.concatenate(([0.0], np.cumsum(centred * centred)))
+        holes = np.concatenate(([0], np.cumsum(gaps)))
+        w1 = s1[period:] - s1[:-period]
+        w2 = s2[period:] - s2[:-period]
+        full = (holes[period:] - holes[:-period]) == 0
+        mean[end:stop] = np.where(full, w1 / period + ref, np.nan)
+        if period > 1:
+            v = (w2 - w1 * w1 / period) / (period - 1)
+            var[end:stop] = np.where(full, np.maximum(v, 0.0), np.nan)
+    return mean, var
+
+
+def _rolling_sum(x, period):
+    # Trailing-window sums, NaN for incomplete windows or windows holding a NaN
+    x = _values(x)
+    out = np.full(len(x), np.nan)
+    if len(x) < period:
+        return out
+    missing = np.isnan(x)
+    # Offset by a sample value so the running sum stays small
+    ref = x[~missing][0] if not missing.all() else 0.0
+    sums = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, x - ref))))
+    out[period - 1:] = sums[period:] - sums[:-period] + ref * period
+    if missing.any():
+        holes = np.concatenate(([0], np.cumsum(missing)))
+        out[period - 1:][(holes[period:] - holes[:-period]) > 0] = np.nan
+    return out
+
+
+def _rolling_extreme(x, period, ufunc):
+    # Van Herk/Gil-Werman: prefix and suffix running extremes (ufunc is
+    # np.maximum or np.minimum) over blocks of `period` bars; every window
+    # spans at most two blocks.
+    x = _values(x)
+    n = len(x)
+    out = np.full(n, np.nan)
+    if n < period:
+        return out
+    rows = -(-n // period)
+    padded = np.empty(rows * period)
+    padded[:n] = x
+    padded[n:] = x[-1]
+    blocks = padded.reshape(rows, period)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    # The window ending at bar i starts at i - period + 1
+    ufunc(suffix[:n - period + 1], prefix[period - 1:n], out=out[period - 1:])
+    if np.isnan(x).any():
+        out[np.isnan(_rolling_sum(x, period))] = np.nan
+    return out
+
+
+def sma(x, period):
+    return _rolling_sum(x, period) / period
+
+
+def rolling_mean(x, period, min_periods=None):
+    # Series.rolling(period, min_periods=...).mean(): NaNs are skipped and a
+    # window needs min_periods valid values (all of them when None)
+    if min_periods is None:
+        return sma(x, period)
+    x = _values(x)
+    n = len(x)
+    valid = ~np.isnan(x)
+    ref = x[valid][0] if valid.any() else 0.0
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, x - ref, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    start = np.maximum(np.arange(1, n + 1) - period, 0)
+    count = counts[1:] - counts[start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = (sums[1:] - sums[start]) / count + ref
+    out[count < max(min_periods, 1)] = np.nan
+    return out
+
+
+def rolling_std(x, period):
+    return np.sqrt(_rolling_moments(x, period)[1])
+
+
+def rolling_max(x, period):
+    return _rolling_extreme(x, period, np.maximum)
+
+
+def rolling_min(x, period):
+    return _rolling_extreme(x, period, np.minimum)
+
+
+def ema(x, span=None, alpha=None, adjust=True):
+    # Series.ewm(span=..., alpha=..., adjust=...).mean(); leading NaNs are
+    # skipped, later ones (adjust=True only) repeat the previous value
+    x = _values(x)
+    if alpha is None:
+        alpha = 2.0 / (span + 1)
+    first = _first_valid(x)
+    if first:
+        out = np.full(len(x), np.nan)
+        out[first:] = ema(x[first:], alpha=alpha, adjust=adjust)
+        return out
+    if alpha == 1:
+        return x.copy()
+    decay = 1.0 - alpha
+    missing = np.isnan(x)
+    if adjust and missing.any():
+        # NaNs add no weight but the older values keep decaying past them
+        with np.errstate(invalid='ignore'):
+            return _linear_filter(np.where(missing, 0.0, x), decay) / _linear_filter(~missing, decay)
+    if adjust:
+        out = _linear_filter(x, decay)
+        # Divide by the sum of the weights decay^0 .. decay^t; it reaches
+        # 1 / alpha to double precision after a few dozen spans
+        warm = min(len(x), int(40 / -np.log(decay)) + 1)
+        out[:warm] /= -np.expm1(np.arange(1, warm + 1) * np.log(decay)) / alpha
+        out[warm:] *= alpha
+        return out
+    scaled = alpha * x
+    if len(x):
+        scaled[0] = x[0]
+    return _linear_filter(scaled, decay)
+
+
+def wilder(x, period):
+    # Wilder smoothing: SMA of the first `period` values, then
+    # y[t] = (y[t-1] * (period - 1) + x[t]) / period
+    x = _values(x)
+    out = np.full(len(x), np.nan)
+    first = _first_valid(x)
+    seed = first + period - 1
+    if seed >= len(x):
+        return out
+    out[seed] = x[first:seed + 1].mean()
+    decay = (period - 1) / period
+    out[seed + 1:] = _linear_filter(x[seed + 1:] / period, decay, initial=out[seed])
+    return out
+
+
+def streak(condition, initial=0):
+    # Length of the run of True values ending at each bar, 0 where False;
+    # initial is a run carried in from before the first bar. "N consecutive
+    # bars above X" is streak(x > level) >= N.
+    condition = np.asarray(condition, dtype=bool)
+    bar = np.arange(1, len(condition) + 1)
+    last_break = np.maximum.accumulate(np.where(condition, 0, bar))
+    return bar - last_break + np.where(last_break == 0, initial, 0)
+
+
+def true_range(high, low, close):
+    high, low, close = _values(high), _values(low), _values(close)
+    tr = high - low
+    prev_close = close[:-1]
+    np.maximum(tr[1:], np.abs(high[1:] - prev_close), out=tr[1:])
+    np.maximum(tr[1:], np.abs(low[1:] - prev_close), out=tr[1:])
+    return tr
+
+
+def atr(high, low, close, period=14, method='sma'):
+    # method='sma' is the rolling mean of TR the bots use, 'wilder' the classic ATR
+    tr = true_range(high, low, close)
+    if method == 'wilder':
+        return wilder(tr, period)
+    return sma(tr, period)
+
+
+def directional_movement(high, low):
+    # (+DM, -DM), 0 on the first bar
+    high, low = _values(high), _values(low)
+    up = np.zeros_like(high)
+    down = np.zeros_like(low)
+    up[1:] = np.diff(high)
+    down[1:] = -np.diff(low)
+    plus_dm = np.where((up > down) & (up > 0), up, 0.0)
+    minus_dm = np.where((down > up) & (down > 0), down, 0.0)
+    return plus_dm, minus_dm
+
+
+def adx(high, low, close, period=14, method='wilder'):
+    # Returns (adx, +DI, -DI).
+    # method='wilder': TR and DM start at the second bar (the first is NaN),
+    # TR is averaged over the first `period` bars and Wilder-smoothed after
+    # that, DM and DX are smoothed with ewm(alpha=1/period).
+    # method='sma': rolling means of TR, DM and DX over `period` bars.
+    plus_dm, minus_dm = directional_movement(high, low)
+    n = len(plus_dm)
+    if method == 'sma':
+        smoothed_tr = atr(high, low, close, period)
+        plus_dm, minus_dm = sma(plus_dm, period), sma(minus_dm, period)
+    else:
+        tr = true_range(high, low, close)[1:]
+        smoothed_tr = np.full(n, np.nan)
+        if n > 1:
+            warm = min(period, len(tr))
+            smoothed_tr[1:] = wilder(tr, period)
+            smoothed_tr[1:warm + 1] = np.cumsum(tr[:warm]) / np.arange(1, warm + 1)
+        plus_dm = np.concatenate(([np.nan], ema(plus_dm[1:], alpha=1.0 / period)))[:n]
+        minus_dm = np.concatenate(([np.nan], ema(minus_dm[1:], alpha=1.0 / period)))[:n]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus_di = 100 * plus_dm / smoothed_tr
+        minus_di = 100 * minus_dm / smoothed_tr
+        dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+    if method == 'sma':
+        return sma(dx, period), plus_di, minus_di
+    return ema(dx, alpha=1.0 / period), plus_di, minus_di
+
+
+def rsi(close, period=14):
+    # RSI with gains/losses averaged by ewm(alpha=1/period), as the scalpers compute it
+    close = _values(close)
+    delta = np.zeros_like(close)
+    delta[1:] = np.diff(close)
+    gain = ema(np.where(delta > 0, delta, 0.0), alpha=1.0 / period)
+    loss = ema(np.where(delta < 0, -delta, 0.0), alpha=1.0 / period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + gain / loss)
+
+
+def bollinger(close, period=20, dev=2.0):
+    # Returns (middle, upper, lower)
+    mid, var = _rolling_moments(close, period)
+    width = np.sqrt(var) * dev
+    return mid, mid + width, mid - width
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    # Returns (macd, signal, histogram) from adjusted EMAs
+    line = ema(close, span=fast) - ema(close, span=slow)
+    signal_line = ema(line, span=signal)
+    return line, signal_line, line - signal_line
+
+
+def stochastic(high, low, close, period=14):
+    # Raw %K in 0..100
+    lowest = rolling_min(low, period)
+    highest = rolling_max(high, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * (_values(close) - lowest) / (highest - lowest)
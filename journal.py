@@ -0,0 +1,239 @@
+"""
+Trade journal shared by the bots: one JOURNAL_DTYPE row per fill.
+
+record() only appends the row to a buffer; a worker thread writes the
+buffer out when `flush_rows` rows are waiting or every `flush_interval`
+seconds, and close() (also run at exit) writes what is left. Files rotate
+by UTC day of the row's time, per strategy:
+
+    <root>/<strategy>/<YYYY-MM-DD>.csv           header line, one row per line
+    <root>/<strategy>/<YYYY-MM-DD>/<field>.bin   binary: a raw column per field
+
+The binary layout is barstore's: little-endian columns, time_msc written
+last, so a write cut short leaves extra bytes in the other columns that
+the next one trims. load() reads either back as one JOURNAL_DTYPE array.
+
+    trade_journal = journal.from_env("snr", clock=mt5.time)
+    trade_journal.record_order(request, result)
+
+    python journal.py summary journal --start 2025-02-01
+"""
+import argparse
+import atexit
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from broker import Broker, to_timestamp
+
+JOURNAL_DTYPE = np.dtype([
+    ('time_msc', '<i8'), ('strategy', 'S24'), ('symbol', 'S16'), ('side', 'S4'),
+    ('volume', '<f8'), ('price', '<f8'), ('sl', '<f8'), ('tp', '<f8'),
+    ('ticket', '<i8'), ('magic', '<i8'),
+])
+
+DAY_MSC = 86_400_000
+
+
+class Journal:
+    """
+    strategy: name the bot's rows are filed under
+    clock:    epoch seconds of a row, e.g. mt5.time for the replay clock
+    binary:   column files instead of CSV
+    """
+
+    def __init__(self, root, strategy, clock=time.time, binary=False, flush_interval=5.0, flush_rows=256):
+        self.root = root
+        self.strategy = strategy
+        self.clock = clock
+        self.binary = binary
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self._rows = []
+        self._cond = threading.Condition()
+        # flush() writes on its caller's thread; one write at a time per journal
+        self._write_lock = threading.Lock()
+        self._worker = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def record(self, symbol, side, volume, price, sl=0.0, tp=0.0, ticket=0, magic=0):
+        # Queue a fill; side is 'BUY' or 'SELL'
+        row = (int(self.clock() * 1000), self.strategy, symbol, side, float(volume), float(price),
+               float(sl or 0.0), float(tp or 0.0), int(ticket or 0), int(magic or 0))
+        with self._cond:
+            self._rows.append(row)
+            if self._worker is None and not self._closed:
+                self._worker = threading.Thread(target=self._work, name='journal', daemon=True)
+                self._worker.start()
+            if len(self._rows) >= self.flush_rows:
+                self._cond.notify()
+
+    def record_order(self, request, result=None):
+        # Queue the fill of an order_send request, with the price and ticket of its result
+        price = (result.price if result is not None else 0.0) or request['price']
+        volume = (result.volume if result is not None else 0.0) or request['volume']
+        self.record(
+            request['symbol'], 'BUY' if request['type'] == Broker.ORDER_TYPE_BUY else 'SELL', volume, price,
+            request.get('sl', 0.0), request.get('tp', 0.0),
+            request.get('position') or (result.order if result is not None else 0), request.get('magic', 0),
+        )
+
+    def flush(self):
+        # Write what is buffered now, on the calling thread
+        with self._cond:
+            rows, self._rows = self._rows, []
+        self._write(rows)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            worker = self._worker
+            self._cond.notify()
+        if worker is not None:
+            worker.join()
+        self.flush()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or len(self._rows) >= self.flush_rows, self.flush_interval)
+                rows, self._rows = self._rows, []
+                closed = self._closed
+            self._write(rows)
+            if closed:
+                return
+
+    def _write(self, rows):
+        if not rows:
+            return
+        with self._write_lock:
+            try:
+                rows = np.array(rows, dtype=JOURNAL_DTYPE)
+                days = rows['time_msc'] // DAY_MSC
+                for day in np.unique(days):
+                    path = _day_path(self.root, self.strategy, int(day))
+                    (_append_columns if self.binary else _append_csv)(path, rows[days == day])
+            except OSError as e:
+                print(f"Journal write failed, {len(rows)} rows lost: {e}")
+
+
+def _day_name(day):
+    return time.strftime('%Y-%m-%d', time.gmtime(day * 86400))
+
+
+def _day_path(root, strategy, day):
+    return os.path.join(root, strategy, _day_name(day))
+
+
+def _append_csv(path, rows):
+    path += '.csv'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    new = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(JOURNAL_DTYPE.names)
+        writer.writerows(
+            [value.decode() if isinstance(value, bytes) else value for value in row] for row in rows.tolist())
+
+
+def _append_columns(path, rows):
+    os.makedirs(path, exist_ok=True)
+    count = _column_count(path)
+    for name in JOURNAL_DTYPE.names[1:] + ('time_msc',):
+        with open(os.path.join(path, f'{name}.bin'), 'ab') as f:
+            # Drop what an interrupted write left past the last whole row
+            f.truncate(count * JOURNAL_DTYPE[name].itemsize)
+            np.ascontiguousarray(rows[name]).tofile(f)
+
+
+def _column_count(path):
+    times = os.path.join(path, 'time_msc.bin')
+    return os.path.getsize(times) // JOURNAL_DTYPE['time_msc'].itemsize if os.path.exists(times) else 0
+
+
+def _read_columns(path):
+    count = _column_count(path)
+    rows = np.zeros(count, dtype=JOURNAL_DTYPE)
+    for name in JOURNAL_DTYPE.names:
+        rows[name] = np.fromfile(os.path.join(path, f'{name}.bin'), dtype=JOURNAL_DTYPE[name], count=count)
+    return rows
+
+
+def _read_csv(path):
+    frame = pd.read_csv(path, dtype={'strategy': str, 'symbol': str, 'side': str}, keep_default_na=False)
+    rows = np.zeros(len(frame), dtype=JOURNAL_DTYPE)
+    for name in JOURNAL_DTYPE.names:
+        rows[name] = frame[name].to_numpy()
+    return rows
+
+
+def load(root, start=None, end=None, strategy=None):
+    """
+    Rows with time in [start, end) (epoch seconds or datetimes, open-ended
+    when None) from the days the range touches, of one strategy or all,
+    sorted by time. Days written in both formats are read from both.
+    """
+    lo = None if start is None else int(to_timestamp(start) * 1000)
+    hi = None if end is None else int(to_timestamp(end) * 1000)
+    first = None if lo is None else _day_name(lo // DAY_MSC)
+    last = None if hi is None else _day_name((hi - 1) // DAY_MSC)
+    strategies = [strategy] if strategy is not None else sorted(os.listdir(root)) if os.path.isdir(root) else []
+    parts = []
+    for name in strategies:
+        directory = os.path.join(root, name)
+        if not os.path.isdir(directory):
+            continue
+        for entry in sorted(os.listdir(directory)):
+            day = entry[:10]
+            # Day names sort as dates
+            if (first is not None and day < first) or (last is not None and day > last):
+                continue
+            path = os.path.join(directory, entry)
+            parts.append(_read_csv(path) if entry.endswith('.csv') else _read_columns(path))
+    if not parts:
+        return np.zeros(0, dtype=JOURNAL_DTYPE)
+    rows = np.concatenate(parts)
+    keep = np.ones(len(rows), dtype=bool)
+    if lo is not None:
+        keep &= rows['time_msc'] >= lo
+    if hi is not None:
+        keep &= rows['time_msc'] < hi
+    rows = rows[keep]
+    return rows[np.argsort(rows['time_msc'], kind='stable')]
+
+
+def from_env(strategy, clock=time.time):
+    # The journal at TRADE_JOURNAL (default ./journal), binary when TRADE_JOURNAL_FORMAT=bin
+    root = os.environ.get('TRADE_JOURNAL', 'journal')
+    return Journal(root, strategy, clock=clock, binary=os.environ.get('TRADE_JOURNAL_FORMAT') == 'bin')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trade journal")
+    commands = parser.add_subparsers(dest='command', required=True)
+    summary = commands.add_parser('summary', help="fills and lots per strategy and symbol")
+    summary.add_argument('root')
+    summary.add_argument('--start', type=datetime.fromisoformat, help="UTC date or datetime")
+    summary.add_argument('--end', type=datetime.fromisoformat, help="UTC date or datetime")
+    summary.add_argument('--strategy')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = load(args.root, args.start, args.end, args.strategy)
+    elapsed = time.perf_counter() - started
+    print(f"{len(rows)} rows loaded in {elapsed * 1000:.1f} ms")
+    if len(rows):
+        frame = pd.DataFrame({name: rows[name] for name in ('strategy', 'symbol', 'volume')})
+        frame[['strategy', 'symbol']] = frame[['strategy', 'symbol']].apply(lambda column: column.str.decode('ascii'))
+        print(frame.groupby(['strategy', 'symbol'])['volume'].agg(fills='count', lots='sum').to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,13 @@
-import MetaTrader5 as mt5
-import pandas as pd
-import time
+from broker import mt5
 import numpy as np
 from datetime import datetime
+from barcache import BarCache
+import barstore
+import journal
+from metadata import MetadataCache
+from orders import OrderPipeline
+from ratelimit import RateLimiter
+from scheduler import BarScheduler
 
 # Initialize MT5 connection
 def initialize_mt5():
@@ -21,11 +26,23 @@ def login_mt5(account, password, server):
     print(f"Connected to account #{account}")
     return True
 
+# Bars are kept between loops; only the newest ones are pulled from the terminal
+bar_cache = BarCache(mt5, store=barstore.from_env())
+
+# Specs, quotes and account state for the order path, one snapshot per decision
+metadata = MetadataCache(mt5)
+
+# Fills go to the shared trade journal, written off the loop
+trade_journal = journal.from_env("m1", clock=mt5.time)
+
+# Orders are sent off the analysis loop and reported back by orders.poll(),
+# at most one a minute; a signal repeated meanwhile replaces the waiting order,
+# and one held 10 s expires instead of going out at a stale price
+orders = OrderPipeline(mt5, limiter=RateLimiter(symbol=(1 / 60, 1)), max_age=10)
+
 # Fetch historical data
 def get_historical_data(symbol, timeframe, num_bars):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_bars)
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
+    df = bar_cache.get(symbol, timeframe, num_bars)
     return df
 
 
@@ -62,18 +79,18 @@ def generate_signal(df, lowest, highest):
 
 # Execute trade with enhanced features
 def execute_trade(symbol, signal, df, lowest, highest):
-    symbol_info = mt5.symbol_info(symbol)
+    symbol_info = metadata.symbol_info(symbol)
     if not symbol_info:
         print(f"Failed to get info for {symbol}")
         return
 
     if not symbol_info.visible:
-        if not mt5.symbol_select(symbol, True):
+        if not metadata.symbol_select(symbol, True):
             print("Symbol select failed")
             return
 
     point = symbol_info.point
-    price = mt5.symbol_info_tick(symbol).ask if signal == 'BUY' else mt5.symbol_info_tick(symbol).bid
+    price = metadata.symbol_info_tick(symbol).ask if signal == 'BUY' else metadata.symbol_info_tick(symbol).bid
     
     # Calculate position size
     lot_size = 0.06
@@ -101,14 +118,18 @@ def execute_trade(symbol, signal, df, lowest, highest):
         "type_filling": mt5.ORDER_FILLING_FOK,
     }
 
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        print(f"Order failed: {result.comment}")
+    orders.submit(request, on_event=report_trade)
+
+
+def report_trade(event):
+    metadata.on_order(event)
+    request = event.request
+    if event.kind != 'filled':
+        print(f"Order {event.kind}: {event.result.comment if event.result else event.error}")
     else:
+        price, sl, tp, lot_size = (request[k] for k in ('price', 'sl', 'tp', 'volume'))
         print(f"Executed {lot_size} lots at {price} | SL: {sl:.2f} | TP: {tp:.2f}")
-
-        with open('trades_m1.csv', 'a') as f:
-            f.write(f"{datetime.now()},{symbol},{signal},price:{price},sl:{sl},tp:{tp},lot_size:{lot_size}\n")
+        trade_journal.record_order(request, event.result)
 
 # Main trading loop
 def main():
@@ -126,28 +147,30 @@ def main():
     if not login_mt5(account=239634700, password="B6D4YAMdemo_", server="Exness-MT5Trial6"):
         return
 
-    while True:
-        try:
-            lowest = 0
-            highest = 0
-            print(f"\n{datetime.now()} - Analyzing market...")
-            df = get_historical_data(symbol, timeframe, num_bars)
-            signal, lowest, highest = generate_signal(df, lowest, highest)
-            
-            print(f"Signal: {signal}")
-            print(f"Executed: {executed}")
-
-            if signal in ['BUY', 'SELL']:
-                execute_trade(symbol, signal, df, lowest, highest)
-                executed += 1
-            else:
-                print("No signal")
-
-            time.sleep(check_interval)
-
-        except Exception as e:
-            print(f"Error: {str(e)}")
-            time.sleep(60)
+    def analyze(symbol, tick):
+        nonlocal executed
+        orders.poll()
+        metadata.on_tick(symbol, tick)
+        lowest = 0
+        highest = 0
+        print(f"\n{datetime.now()} - Analyzing market...")
+        df = get_historical_data(symbol, timeframe, num_bars)
+        signal, lowest, highest = generate_signal(df, lowest, highest)
+        
+        print(f"Signal: {signal}")
+        print(f"Executed: {executed}")
+
+        if signal in ['BUY', 'SELL']:
+            execute_trade(symbol, signal, df, lowest, highest)
+            executed += 1
+        else:
+            print("No signal")
+
+    scheduler = BarScheduler(mt5, tick_interval=check_interval)
+    scheduler.register(symbol, timeframe, on_tick=analyze)
+    scheduler.run()
+    orders.stop()
+    orders.poll()
 
 if __name__ == "__main__":
     main()
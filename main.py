@@ -1,10 +1,15 @@
-import MetaTrader5 as mt5
+from broker import mt5
 import pandas as pd
-import time
 from datetime import datetime
 import warnings
-import ta  # technical analysis library
+import indicators
+from scheduler import BarScheduler
 import numpy as np
+from barcache import BarCache
+import barstore
+from metadata import MetadataCache
+from orders import OrderPipeline
+from ratelimit import RateLimiter
 
 warnings.filterwarnings("ignore", category=pd.errors.ChainedAssignmentError)
 
@@ -29,18 +34,27 @@ def login_mt5(account, password, server):
     print(f"Connected to account #{account}")
     return True
 
+# Bars are kept between loops; only the newest ones are pulled from the terminal
+bar_cache = BarCache(mt5, store=barstore.from_env())
+
+# Specs, quotes and account state for the order path, one snapshot per decision
+metadata = MetadataCache(mt5)
+
+# Orders are sent off the analysis loop and reported back by orders.poll(),
+# at most one a minute; a signal repeated meanwhile replaces the waiting order,
+# and one held 10 s expires instead of going out at a stale price
+orders = OrderPipeline(mt5, limiter=RateLimiter(symbol=(1 / 60, 1)), max_age=10)
+
 # Fetch historical data
 def get_historical_data(symbol, timeframe, num_bars):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_bars)
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    # Calculate ATR using the ta library over a 14–bar window
-    df['ATR'] = ta.volatility.average_true_range(high=df['high'], low=df['low'], close=df['close'], window=14)
+    df = bar_cache.get(symbol, timeframe, num_bars)
+    # Calculate Wilder's ATR over a 14–bar window
+    df['ATR'] = indicators.atr(df['high'], df['low'], df['close'], 14, method='wilder')
     # Add an ATR_count column:
     # This counts how many consecutive bars have an ATR above its own 14–bar rolling average.
     df['ATR_count'] = count_consecutive_high_atr(df['ATR'], window=14, factor=1.0)
     # For additional filtering, we also calculate a 50–period SMA of the closing prices
-    df['SMA50'] = ta.trend.sma_indicator(close=df['close'], window=50)
+    df['SMA50'] = indicators.sma(df['close'], 50)
     return df
 
 
@@ -128,21 +142,16 @@ def count_consecutive_high_atr(atr_series, window=14, factor=1.0):
       A pd.Series with the count of consecutive bars meeting the condition.
     """
     # Calculate the rolling average of ATR (with at least one period)
-    atr_avg = atr_series.rolling(window=window, min_periods=1).mean()
-    counts = []
-    count = 0
-    for atr, avg in zip(atr_series, atr_avg):
-        if atr > factor * avg:
-            count += 1
-        else:
-            count = 0
-        counts.append(count)
-    return pd.Series(counts, index=atr_series.index)
+    atr = np.asarray(atr_series, dtype=float)
+    atr_avg = indicators.rolling_mean(atr, window, min_periods=1)
+    with np.errstate(invalid='ignore'):
+        above = atr > factor * atr_avg
+    return pd.Series(indicators.streak(above), index=atr_series.index)
 
 
 # Calculate lot size based on ATR-based stop loss
 def calculate_lot_size(symbol, atr_value):
-    account_info = mt5.account_info()
+    account_info = metadata.account_info()
     if account_info is None:
         print("Account info not available")
         return 0
@@ -157,24 +166,24 @@ def calculate_lot_size(symbol, atr_value):
 # Execute trade with dynamic SL/TP using ATR for stop loss and RR of 1:2
 def execute_trade(symbol, signal, df):
     print("Start Executing Trade")
-    account_info = mt5.account_info()
+    account_info = metadata.account_info()
     if account_info is None:
         print("Failed to get account info")
         return
 
-    symbol_info = mt5.symbol_info(symbol)
+    symbol_info = metadata.symbol_info(symbol)
     if symbol_info is None:
         print(f"Failed to get info for {symbol}")
         return
 
     if not symbol_info.visible:
         print(f"{symbol} is not visible, trying to switch on")
-        if not mt5.symbol_select(symbol, True):
+        if not metadata.symbol_select(symbol, True):
             print("Symbol select failed")
             return
 
     # Check spread
-    tick = mt5.symbol_info_tick(symbol)
+    tick = metadata.symbol_info_tick(symbol)
     current_spread = tick.ask - tick.bid
     if current_spread > MAX_ALLOWED_SPREAD * 0.1:  # 0.1 is pip size for XAUUSD
         print(f"Spread too wide: {current_spread/0.1:.1f} pips")
@@ -223,11 +232,16 @@ def execute_trade(symbol, signal, df):
 
     print(request)
 
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        print(f"Order failed: {result.comment}")
+    orders.submit(request, on_event=report_trade)
+
+
+def report_trade(event):
+    metadata.on_order(event)
+    request = event.request
+    if event.kind != 'filled':
+        print(f"Order {event.kind}: {event.result.comment if event.result else event.error}")
     else:
-        print(f"Executed {lot_size} lots at {price} | SL: {sl:.2f} | TP: {tp:.2f}")
+        print(f"Executed {request['volume']} lots at {request['price']} | SL: {request['sl']:.2f} | TP: {request['tp']:.2f}")
 
 # Main function
 def main():
@@ -243,33 +257,34 @@ def main():
     if not login_mt5(239634700, password="B6D4YAMdemo_", server="Exness-MT5Trial6"):
         return
 
-    while True:
-        try:
-            print(f"\nChecking market at {datetime.now()}")
-            df = get_historical_data(symbol, timeframe, num_bars)
-            # Detect fractal support/resistance and get aggregated key levels
-            df, key_supports, key_resistances = detect_support_resistance(df, window=20)
-            signal = generate_signal(df, key_supports, key_resistances)
-            
-            # Print latest key levels if available
-            if key_resistances:
-                print(f"Key Resistance Level: {key_resistances[-1]:.2f}")
-            print(f"Current Price: {df['close'].iloc[-1]:.2f}")
-            if key_supports:
-                print(f"Key Support Level: {key_supports[-1]:.2f}")
-            print(f"Signal: {signal}")
-            print(f"Executed Trades: {executed}")
-            
-            execute_trade(symbol, 'BUY', df)
-            # if signal in ['BUY', 'SELL']:
-            #     execute_trade(symbol, signal, df)
-            #     executed += 1
-
-            time.sleep(check_interval)
-
-        except Exception as e:
-            print(f"Error occurred: {str(e)}")
-            time.sleep(60)
+    def analyze(symbol, tick):
+        orders.poll()
+        metadata.on_tick(symbol, tick)
+        print(f"\nChecking market at {datetime.now()}")
+        df = get_historical_data(symbol, timeframe, num_bars)
+        # Detect fractal support/resistance and get aggregated key levels
+        df, key_supports, key_resistances = detect_support_resistance(df, window=20)
+        signal = generate_signal(df, key_supports, key_resistances)
+        
+        # Print latest key levels if available
+        if key_resistances:
+            print(f"Key Resistance Level: {key_resistances[-1]:.2f}")
+        print(f"Current Price: {df['close'].iloc[-1]:.2f}")
+        if key_supports:
+            print(f"Key Support Level: {key_supports[-1]:.2f}")
+        print(f"Signal: {signal}")
+        print(f"Executed Trades: {executed}")
+        
+        execute_trade(symbol, 'BUY', df)
+        # if signal in ['BUY', 'SELL']:
+        #     execute_trade(symbol, signal, df)
+        #     executed += 1
+
+    scheduler = BarScheduler(mt5, tick_interval=check_interval)
+    scheduler.register(symbol, timeframe, on_tick=analyze)
+    scheduler.run()
+    orders.stop()
+    orders.poll()
 
 if __name__ == "__main__":
     main()
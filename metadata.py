@@ -0,0 +1,80 @@
+"""
+Symbol, tick and account lookups for the order path, without a terminal
+round trip per use.
+
+- symbol_info() answers are reused for `spec_ttl` seconds. Only their
+  static fields (point, digits, tick value and size, contract size, volume
+  limits and step) should be read; the quote fields in them go stale.
+- symbol_info_tick() is a snapshot per symbol, held until the next decision:
+  on_tick() sets it from a tick the caller already has (the scheduler's
+  on_tick handlers), refresh() drops it so the next call fetches one.
+  Every read within one decision therefore sees the same quote.
+- account_info() is a snapshot dropped after an order event, so balance and
+  margin follow fills, or after `account_ttl` seconds for floating equity.
+
+Ages are taken on terminal.time(), so the offline broker's replay clock
+drives them.
+
+    metadata = MetadataCache(mt5)
+    metadata.on_tick(symbol, tick)
+    point = metadata.symbol_info(symbol).point
+"""
+
+
+class MetadataCache:
+    def __init__(self, terminal, spec_ttl=300.0, account_ttl=30.0):
+        self.terminal = terminal
+        self.spec_ttl = spec_ttl
+        self.account_ttl = account_ttl
+        self._specs = {}     # symbol -> (fetched at, SymbolInfo)
+        self._ticks = {}     # symbol -> Tick
+        self._account = None  # (fetched at, AccountInfo)
+
+    def symbol_info(self, symbol):
+        cached = self._specs.get(symbol)
+        now = self.terminal.time()
+        if cached is None or now - cached[0] >= self.spec_ttl:
+            info = self.terminal.symbol_info(symbol)
+            if info is None:
+                # Not cached, the symbol may show up once selected
+                return None
+            cached = self._specs[symbol] = (now, info)
+        return cached[1]
+
+    def symbol_select(self, symbol, enable=True):
+        # Selecting changes `visible`; the spec is fetched again next time
+        self._specs.pop(symbol, None)
+        return self.terminal.symbol_select(symbol, enable)
+
+    def symbol_info_tick(self, symbol):
+        tick = self._ticks.get(symbol)
+        if tick is None:
+            tick = self.terminal.symbol_info_tick(symbol)
+            if tick is not None:
+                self._ticks[symbol] = tick
+        return tick
+
+    def account_info(self):
+        now = self.terminal.time()
+        if self._account is None or now - self._account[0] >= self.account_ttl:
+            info = self.terminal.account_info()
+            if info is None:
+                return None
+            self._account = (now, info)
+        return self._account[1]
+
+    def on_tick(self, symbol, tick):
+        # Scheduler tick handler signature; the tick becomes the symbol's snapshot
+        self._ticks[symbol] = tick
+
+    def on_order(self, event=None):
+        # After an order went out, filled or not: balance and margin may have moved.
+        # Takes an orders.OrderEvent to serve as a pipeline callback
+        self._account = None
+
+    def refresh(self, symbol=None):
+        # Start a new decision: quotes are fetched again on their next use
+        if symbol is None:
+            self._ticks.clear()
+        else:
+            self._ticks.pop(symbol, None)
@@ -1,9 +1,16 @@
-import MetaTrader5 as mt5
+from broker import mt5
 import pandas as pd
-import numpy as np
-import time
 from datetime import datetime, timedelta
 import pytz
+import indicators
+import streaming
+from barcache import BarCache
+import barstore
+from metadata import MetadataCache
+from positions import PositionBook
+from trailing import TrailingStops
+from orders import OrderPipeline
+from ratelimit import RateLimiter
 
 # ========================
 # Global Configuration
@@ -12,6 +19,13 @@ SYMBOLS = ["EURUSD", "GBPUSD", "USDJPY"]
 TIMEFRAME = mt5.TIMEFRAME_M1
 RISK_PERCENT = 0.3
 MAX_DAILY_LOSS = 2.0  # Percentage of account
+# Order budgets as (orders per second, burst); orders over budget wait in the pipeline
+ORDER_LIMITS = {"account": (1.0, 3), "symbol": (1 / 60, 1)}
+# Seconds an entry may wait for its budget before it expires unsent
+ORDER_MAX_AGE = 10
+# Stop management in ATRs: break-even at 1 ATR of profit (locking 0.1), then
+# trail 1.5 behind the best price; SL changes under 0.2 are not sent
+TRAILING = {"trail": 1.5, "break_even": 1.0, "lock": 0.1, "step": 0.2}
 TRADE_SESSIONS = {
     "Tokyo": {
         "symbols": ["USDJPY"],
@@ -53,13 +67,27 @@ STRATEGY_PARAMS = {
     }
 }
 
+# Bars are kept between loops; only the newest ones are pulled from the terminal
+bar_cache = BarCache(mt5, store=barstore.from_env())
+
+# Specs, quotes and account state for the order path, one snapshot per decision
+metadata = MetadataCache(mt5)
+
+# Open positions, kept from our order results and a periodic diff against the terminal
+position_book = PositionBook(mt5)
+
 class ScalpingEngine:
     def __init__(self):
         self.sessions = TRADE_SESSIONS
         self.strategy_params = STRATEGY_PARAMS
         self.trade_history = []
+        self.indicator_sets = {}  # (strategy, symbol) -> streaming.IndicatorSet
         self.daily_pnl = 0.0
         self.equity = None
+        self.orders = OrderPipeline(mt5, limiter=RateLimiter(**ORDER_LIMITS), max_age=ORDER_MAX_AGE)
+        # SL/TP changes go through their own pipeline, outside the entry budgets
+        self.modifications = OrderPipeline(mt5)
+        self.trailing = TrailingStops(mt5, **TRAILING)
         
     def connect_mt5(self):
         if not mt5.initialize():
@@ -70,11 +98,11 @@ class ScalpingEngine:
                 print("Login failed")
                 return False
             print(f"Connected to account #{239634700}")
-            self.equity = mt5.account_info().equity
+            self.equity = metadata.account_info().equity
             return True
             
     def calculate_position_size(self, symbol):
-        tick_value = mt5.symbol_info(symbol).trade_tick_value
+        tick_value = metadata.symbol_info(symbol).trade_tick_value
         risk_amount = self.equity * RISK_PERCENT / 100
         return round(risk_amount / tick_value, 2)
     
@@ -128,19 +156,13 @@ class ScalpingEngine:
     
     def momentum_scalp(self, symbol):
         params = self.strategy_params["momentum_scalp"]
-        rates = mt5.copy_rates_from_pos(symbol, TIMEFRAME, 0, 100)
-        df = pd.DataFrame(rates)
-        
-        # EMA Cross
-        df['ema_fast'] = df['close'].ewm(span=params["ema_fast"]).mean()
-        df['ema_slow'] = df['close'].ewm(span=params["ema_slow"]).mean()
-        
-        # RSI and Stochastic
-        df['rsi'] = self.calculate_rsi(df, params["rsi_period"])
-        df['stoch'] = self.calculate_stochastic(df, params["stoch_period"])
-        
-        current = df.iloc[-1]
-        prev = df.iloc[-2]
+        # EMA Cross, RSI and Stochastic, carried over from the previous loop
+        prev, current, _ = self.sync_indicators("momentum_scalp", symbol, lambda: streaming.IndicatorSet(
+            ema_fast=streaming.EMA(span=params["ema_fast"]),
+            ema_slow=streaming.EMA(span=params["ema_slow"]),
+            rsi=streaming.RSI(params["rsi_period"]),
+            stoch=streaming.Stochastic(params["stoch_period"]),
+        ))
         
         # Entry Conditions
         if (current['ema_fast'] > current['ema_slow'] and
@@ -155,49 +177,36 @@ class ScalpingEngine:
     
     def volatility_arbitrage(self, symbol):
         params = self.strategy_params["volatility_arbitrage"]
-        rates = mt5.copy_rates_from_pos(symbol, TIMEFRAME, 0, 100)
-        df = pd.DataFrame(rates)
+        _, current, df = self.sync_indicators("volatility_arbitrage", symbol, lambda: streaming.IndicatorSet(
+            bollinger=streaming.Bollinger(params["bollinger_period"], 2),
+            macd=streaming.MACD(params["macd_fast"], params["macd_slow"], params["macd_signal"]),
+        ))
         
-        # Bollinger Bands
-        df['ma'] = df['close'].rolling(params["bollinger_period"]).mean()
-        df['std'] = df['close'].rolling(params["bollinger_period"]).std()
-        df['upper'] = df['ma'] + (df['std'] * 2)
-        df['lower'] = df['ma'] - (df['std'] * 2)
+        close = df['close'].iloc[-1]
+        _, upper, lower = current['bollinger']
+        macd, signal, _ = current['macd']
         
-        # MACD
-        df['macd'] = df['close'].ewm(span=params["macd_fast"]).mean() - \
-                     df['close'].ewm(span=params["macd_slow"]).mean()
-        df['signal'] = df['macd'].ewm(span=params["macd_signal"]).mean()
-        
-        current = df.iloc[-1]
-        
-        if current['close'] < current['lower'] and current['macd'] > current['signal']:
+        if close < lower and macd > signal:
             return 'BUY'
-        elif current['close'] > current['upper'] and current['macd'] < current['signal']:
+        elif close > upper and macd < signal:
             return 'SELL'
         return None
+
+    def sync_indicators(self, strategy, symbol, make_set):
+        # Feed newly closed bars into this strategy's indicators for the symbol.
+        # Returns (values at the last closed bar, preview for the forming bar, bars)
+        key = (strategy, symbol)
+        if key not in self.indicator_sets:
+            self.indicator_sets[key] = make_set()
+        df = bar_cache.get(symbol, TIMEFRAME, 100)
+        prev, current = self.indicator_sets[key].sync(df)
+        return prev, current, df
     
     # ========================
     # Utility Functions
     # ========================
     def calculate_atr(self, df, period):
-        high_low = df['high'] - df['low']
-        high_close = np.abs(df['high'] - df['close'].shift())
-        low_close = np.abs(df['low'] - df['close'].shift())
-        tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-        return tr.rolling(period).mean().iloc[-1]
-    
-    def calculate_rsi(self, df, period):
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).ewm(alpha=1/period).mean()
-        loss = (-delta.where(delta < 0, 0)).ewm(alpha=1/period).mean()
-        rs = gain / loss
-        return 100 - (100 / (1 + rs))
-    
-    def calculate_stochastic(self, df, period):
-        low_min = df['low'].rolling(period).min()
-        high_max = df['high'].rolling(period).max()
-        return 100 * (df['close'] - low_min) / (high_max - low_min)
+        return indicators.atr(df['high'], df['low'], df['close'], period)[-1]
     
     def execute_trade(self, symbol, direction):
         # Risk Management Check
@@ -205,8 +214,8 @@ class ScalpingEngine:
             return False
             
         lot_size = self.calculate_position_size(symbol)
-        price = mt5.symbol_info_tick(symbol).ask if direction == 'BUY' else \
-                mt5.symbol_info_tick(symbol).bid
+        price = metadata.symbol_info_tick(symbol).ask if direction == 'BUY' else \
+                metadata.symbol_info_tick(symbol).bid
         
         request = {
             "action": mt5.TRADE_ACTION_DEAL,
@@ -221,17 +230,24 @@ class ScalpingEngine:
             "type_filling": mt5.ORDER_FILLING_IOC,
         }
         
-        result = mt5.order_send(request)
-        if result.retcode == mt5.TRADE_RETCODE_DONE:
-            self.trade_history.append(result)
-            return True
-        return False
+        # Sent off the loop; fills come back through on_order_event
+        return self.orders.submit(request, on_event=self.on_order_event)
+
+    def on_order_event(self, event):
+        metadata.on_order(event)
+        position_book.on_order(event)
+        if event.kind == 'filled':
+            self.trade_history.append(event.result)
     
     def monitor_positions(self):
-        positions = mt5.positions_get()
-        for pos in positions:
-            # Implement trailing stops or profit protection logic
-            pass
+        # Break-even and trailing stops for every open position in one step
+        self.modifications.poll()
+        positions = position_book.positions()
+        atr = lambda symbol: self.calculate_atr(bar_cache.get(symbol, TIMEFRAME, 100), 14)
+        self.trailing.sync(positions, atr)
+        quotes = {symbol: metadata.symbol_info_tick(symbol) for symbol in {pos.symbol for pos in positions}}
+        for request in self.trailing.update(quotes):
+            self.modifications.submit(request, on_event=position_book.on_order)
             
     def run(self):
         self.connect_mt5()
@@ -239,11 +255,14 @@ class ScalpingEngine:
         
         while True:
             try:
+                self.orders.poll()
+                metadata.refresh()
+                position_book.sync()
                 current_session, config = self.get_current_session()
                 print(f"Current Session: {current_session}")
                 print(f"config: {config}")
                 if not current_session:
-                    time.sleep(60)
+                    mt5.sleep(60)
                     continue
                 
                 for symbol in config["symbols"]:
@@ -255,17 +274,19 @@ class ScalpingEngine:
                     
                     if signal:
                         self.execute_trade(symbol, signal)
-                        time.sleep(1)  # Rate limit
                 
                 self.monitor_positions()
-                time.sleep(5)
+                mt5.sleep(5)
                 
             except KeyboardInterrupt:
                 print("Shutting down...")
+                self.orders.stop()
+                self.modifications.stop()
+                print(f"Orders: {self.orders.limiter.stats()}")
                 break
             except Exception as e:
                 print(f"Error: {str(e)}")
-                time.sleep(30)
+                mt5.sleep(30)
 
 if __name__ == "__main__":
     engine = ScalpingEngine()
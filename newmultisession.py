@@ -1,9 +1,27 @@
-import MetaTrader5 as mt5
-import pandas as pd
-import numpy as np
-import time
-from datetime import datetime, timedelta
+from broker import mt5
+from datetime import datetime
 import pytz
+import streaming
+from barcache import BarCache
+import barstore
+import journal
+from metadata import MetadataCache
+from positions import PositionBook
+from orders import OrderPipeline
+from ratelimit import RateLimiter
+from virtualstops import VirtualStops
+
+# Bars are kept between loops; only the newest ones are pulled from the terminal
+bar_cache = BarCache(mt5, store=barstore.from_env())
+
+# Specs, quotes and account state for the order path, one snapshot per decision
+metadata = MetadataCache(mt5)
+
+# Fills go to the shared trade journal, written off the loop
+trade_journal = journal.from_env("newmultisession", clock=mt5.time)
+
+# Open positions, kept from our order results and a periodic diff against the terminal
+position_book = PositionBook(mt5)
 
 class ScalpingBot:
     def __init__(self, config):
@@ -13,9 +31,18 @@ class ScalpingBot:
         self.trade_allowed = True
         self.daily_loss = 0.0
         self.last_check = datetime.now()
-        self.trade_history = []
+        self.trade_history = {}  # position ticket -> trade
+        self.exit_deals = {}  # position ticket -> exit deals seen so far
+        self.deals_since = None  # time of the newest deal seen (epoch s)
+        self.deals_at_since = set()  # tickets of the deals at that time
+        self.indicator_sets = {}  # symbol -> streaming.IndicatorSet
+        self.orders = OrderPipeline(mt5, limiter=RateLimiter(**self.config.get('order_limits', {})),
+                                    max_age=self.config.get('order_max_age'))
+        # SL/TP held here instead of on the broker's order; closes skip the entry budgets
+        self.virtual_stops = VirtualStops(mt5) if self.config.get('virtual_stops') else None
+        self.closes = OrderPipeline(mt5)
         
-        print(f"Connected to account #{mt5.account_info().login}")
+        print(f"Connected to account #{metadata.account_info().login}")
 
     def initialize_mt5(self):
         if not mt5.initialize():
@@ -36,42 +63,63 @@ class ScalpingBot:
 
     def check_if_trade_history_closed(self):
         """Check closed trades and update daily loss tracking"""
-        if not self.trade_history:
-            return
-        
-        # Get all current positions
-        positions = mt5.positions_get()
-        current_tickets = [pos.ticket for pos in positions] if positions else []
-        
-        # Process closed trades
-        for trade in self.trade_history[:]:  # Create copy to modify during iteration
-            position = mt5.history_deals_get(
-                position=trade.get('ticket'),
-                date_from=datetime.now() - timedelta(days=1)
-            )
-            
-            if position:  # Trade is closed
-                profit = sum(deal.profit for deal in position)
+        # The book first: a trade that closes after its sync still shows as
+        # open, and is picked up once a later sync drops it
+        position_book.sync()
+        if self.virtual_stops is not None:
+            self.virtual_stops.sync(position_book.positions())
+        closed = [t for t in self.trade_history if t not in position_book]
+        if closed:
+            exits = self.fetch_exit_deals()
+
+            for ticket in closed:
+                trade = self.trade_history.pop(ticket)
+                deals = exits.pop(ticket, None)
+                if not deals:
+                    # Trade not found in history or current positions, drop it
+                    continue
+                profit = sum(deal.profit for deal in deals)
                 self.daily_loss += profit
-                
+
                 # Log trade result
                 result = "WIN" if profit > 0 else "LOSS"
                 print(f"Trade closed: {trade['symbol']} {trade['direction']} - {result} (${profit:.2f})")
-                
-                # Remove from trade history
-                self.trade_history.remove(trade)
-            
-            elif trade.get('ticket') not in current_tickets:
-                # Trade not found in history or current positions, remove it
-                self.trade_history.remove(trade)
-        
-        # Print current positions
+
+        # Print current positions, profit as of the last sync
+        positions = position_book.positions()
         if positions:
             print("\nCurrent Positions:")
             for pos in positions:
                 profit = pos.profit + pos.swap
                 print(f"{pos.symbol} {pos.type} - Profit: ${profit:.2f}")
 
+    def fetch_exit_deals(self):
+        """
+        Exit deals of tracked trades, by position ticket, from one ranged
+        history request per cycle. Deals are read from the newest deal time
+        seen so far; exits of trades still partly open are kept until they close.
+        """
+        if self.deals_since is None:
+            self.deals_since = int(mt5.time()) - 86400
+        # Far enough ahead to cover the server clock running ahead of ours
+        deals = mt5.history_deals_get(self.deals_since, int(mt5.time()) + 86400) or ()
+        newest, at_newest = self.deals_since, set()
+        for deal in deals:
+            if deal.time == self.deals_since and deal.ticket in self.deals_at_since:
+                # Already seen: the range starts at the last deal's second
+                continue
+            if deal.time > newest:
+                newest, at_newest = deal.time, set()
+            if deal.time == newest:
+                at_newest.add(deal.ticket)
+            if deal.entry != mt5.DEAL_ENTRY_IN and deal.position_id in self.trade_history:
+                self.exit_deals.setdefault(deal.position_id, []).append(deal)
+        if newest == self.deals_since:
+            self.deals_at_since |= at_newest
+        else:
+            self.deals_since, self.deals_at_since = newest, at_newest
+        return self.exit_deals
+
     def run(self):
         while True:
             try:
@@ -80,7 +128,10 @@ class ScalpingBot:
                 # Check daily loss limit
                 # self.check_daily_loss_limit()
 
+                # Fills first, so trades closed since are already tracked
+                self.orders.poll()
                 self.check_if_trade_history_closed()
+                metadata.refresh()
                 
                 # Main trading logic
                 for symbol in self.config['symbols']:
@@ -91,22 +142,47 @@ class ScalpingBot:
                     #     print(f'{symbol} is not in session')
                 
                 # Sleep for 10 seconds between checks
-                time.sleep(10)
+                self.wait(10)
                 
             except KeyboardInterrupt:
                 print("\nShutting down...")
+                self.orders.stop()
+                self.closes.stop()
+                print(f"Orders: {self.orders.limiter.stats()}")
                 mt5.shutdown()
                 break
 
+    def wait(self, seconds):
+        # Sleep between checks; virtual stops are checked on every tick meanwhile
+        if self.virtual_stops is None:
+            mt5.sleep(seconds)
+            return
+        until = mt5.time() + seconds
+        while True:
+            self.closes.poll()
+            for symbol in self.virtual_stops.symbols():
+                for request in self.virtual_stops.on_tick(symbol, mt5.symbol_info_tick(symbol)):
+                    self.closes.submit(request, on_event=self.report_close)
+            if mt5.time() >= until:
+                return
+            mt5.sleep(self.config.get('stop_check_interval', 1))
+
+    def report_close(self, event):
+        metadata.on_order(event)
+        position_book.on_order(event)
+        self.virtual_stops.on_order(event)
+        if event.kind != 'filled':
+            print(f"Close {event.kind}: {event.result.comment if event.result else event.error}")
+
     def process_symbol(self, symbol):
         # Get latest market data
-        rates = self.get_rates(symbol, self.config['timeframe'], 100)
-        if rates is None or len(rates) < 50:
+        bars = bar_cache.get(symbol, self.config['timeframe'], 100)
+        if len(bars) < 50:
             return
             
         # Calculate indicators
-        df = self.calculate_indicators(rates)
-        current_price = mt5.symbol_info_tick(symbol).ask
+        df = self.calculate_indicators(symbol, bars)
+        current_price = metadata.symbol_info_tick(symbol).ask
         # Check entry conditions
         print(f'Processing {symbol}')
         if self.check_long_conditions(df, symbol):
@@ -114,14 +190,20 @@ class ScalpingBot:
         elif self.check_short_conditions(df, symbol):
             self.execute_trade(symbol, 'sell', current_price)
 
-    def calculate_indicators(self, rates):
-        df = pd.DataFrame(rates)
-        df['ema9'] = df['close'].ewm(span=9).mean()
-        df['ema21'] = df['close'].ewm(span=21).mean()
-        df['rsi'] = self.calculate_rsi(df['close'])
-        df['bb_upper'], df['bb_lower'] = self.calculate_bollinger_bands(df['close'])
-        df['vol_sma'] = df['tick_volume'].rolling(20).mean()
-        return df.iloc[-1]  # Return latest values
+    def calculate_indicators(self, symbol, bars):
+        # Indicators are carried across loops and only fed newly closed bars
+        if symbol not in self.indicator_sets:
+            self.indicator_sets[symbol] = streaming.IndicatorSet(
+                ema9=streaming.EMA(span=9),
+                ema21=streaming.EMA(span=21),
+                rsi=streaming.RSI(7),
+                bollinger=streaming.Bollinger(20, 2),
+                vol_sma=streaming.SMA(20, source='tick_volume'),
+            )
+        _, current = self.indicator_sets[symbol].sync(bars)
+        _, bb_upper, bb_lower = current.pop('bollinger')
+        # Latest values, the forming bar included
+        return {**bars.iloc[-1], **current, 'bb_upper': bb_upper, 'bb_lower': bb_lower}
 
     def check_long_conditions(self, data, symbol):
         cond1 = data['close'] > data['ema9'] and data['close'] > data['ema21']
@@ -170,19 +252,33 @@ class ScalpingBot:
             "type_time": mt5.ORDER_TIME_GTC,
         }
         
-        # Send order
-        result = mt5.order_send(request)
-        if result.retcode != mt5.TRADE_RETCODE_DONE:
-            print(f"Trade failed: {result.comment}")
+        on_event = lambda event: self.report_trade(event, direction)
+        if self.virtual_stops is not None:
+            request, on_event = self.virtual_stops.hide(request, on_event)
+
+        # Send order; the other symbols are processed while it is in flight
+        self.orders.submit(request, on_event=on_event)
+
+    def report_trade(self, event, direction):
+        metadata.on_order(event)
+        position_book.on_order(event)
+        request = event.request
+        symbol, position_size = request['symbol'], request['volume']
+        if event.kind != 'filled':
+            print(f"Trade {event.kind}: {event.result.comment if event.result else event.error}")
         else:
             print(f"Trade executed: {symbol} {direction} {position_size} lots")
-            with open(f'{symbol}.csv', 'a') as f:
-                f.write(f"{datetime.now()} | {symbol} | {direction} | {position_size} | Entry: {entry_price} | SL: {sl}, TP: {tp}\n")
+            # The position takes the ticket of the order that opened it
+            ticket = event.result.order
+            self.trade_history[ticket] = {'ticket': ticket, 'symbol': symbol, 'direction': direction}
+            stop = self.virtual_stops.get(ticket) if self.virtual_stops is not None else None
+            sl, tp = (stop.sl, stop.tp) if stop is not None else (request['sl'], request['tp'])
+            trade_journal.record_order({**request, 'sl': sl, 'tp': tp}, event.result)
 
     def calculate_position_size(self, symbol, entry_price):
-        account_balance = mt5.account_info().balance
+        account_balance = metadata.account_info().balance
         risk_amount = account_balance * self.config['risk_per_trade']
-        symbol_info = mt5.symbol_info(symbol)
+        symbol_info = metadata.symbol_info(symbol)
         
         if 'XAU' in symbol:
             risk_per_unit = (self.config['sl_dollars'] / symbol_info.trade_tick_value)
@@ -195,7 +291,7 @@ class ScalpingBot:
         return round(position_size, 2)
 
     def calculate_risk_levels(self, symbol, direction, entry_price):
-        symbol_info = mt5.symbol_info(symbol)
+        symbol_info = metadata.symbol_info(symbol)
         if 'XAU' in symbol:
             if direction == 'buy':
                 sl = entry_price - self.config['sl_dollars']
@@ -245,22 +341,6 @@ class ScalpingBot:
         else:
             return self.session_times['Sydney']
 
-    @staticmethod
-    def calculate_rsi(series, period=7):
-        delta = series.diff()
-        gain = delta.where(delta > 0, 0)
-        loss = -delta.where(delta < 0, 0)
-        avg_gain = gain.ewm(alpha=1/period).mean()
-        avg_loss = loss.ewm(alpha=1/period).mean()
-        rs = avg_gain / avg_loss
-        return 100 - (100 / (1 + rs))
-
-    @staticmethod
-    def calculate_bollinger_bands(series, period=20, dev=2):
-        sma = series.rolling(period).mean()
-        std = series.rolling(period).std()
-        return sma + (std * dev), sma - (std * dev)
-
 if __name__ == "__main__":
     config = {
         'account': 239634700,
@@ -274,7 +354,13 @@ if __name__ == "__main__":
         'tp_pips': 10,
         'sl_dollars': 3.0,
         'tp_dollars': 5.0,
-        'volatility_threshold': 1.5
+        'volatility_threshold': 1.5,
+        # (orders per second, burst); orders over budget wait in the pipeline
+        'order_limits': {'account': (1.0, 3), 'symbol': (1 / 60, 1)},
+        'order_max_age': 10,  # seconds an entry may wait for its budget before it expires
+        # Keep SL/TP off the broker and close at market when a tick reaches them
+        'virtual_stops': False,
+        'stop_check_interval': 1,  # seconds between tick checks
     }
 
     bot = ScalpingBot(config)
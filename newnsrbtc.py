@@ -1,9 +1,16 @@
-import MetaTrader5 as mt5
+from broker import mt5
 import pandas as pd
-import time
 from datetime import datetime
 import warnings
-import numpy as np
+from support_resistance import detect_support_resistance
+import indicators
+import barstore
+import journal
+from metadata import MetadataCache
+from orders import OrderPipeline
+from positions import PositionBook
+from ratelimit import RateLimiter
+from resample import ResampledFeed
 
 warnings.filterwarnings("ignore", category=pd.errors.ChainedAssignmentError)
 
@@ -22,68 +29,32 @@ def login_mt5(account, password, server):
     print(f"Connected to account #{account}")
     return True
 
-def get_historical_data(symbol, timeframe, num_bars):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_bars)
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    return df
+# Higher-timeframe bars are resampled from one cached M1 feed; only new M1 bars are pulled
+bar_feed = ResampledFeed(mt5, store=barstore.from_env())
+
+# Specs, quotes and account state for the order path, one snapshot per decision
+metadata = MetadataCache(mt5)
+
+# Fills go to the shared trade journal, written off the loop
+trade_journal = journal.from_env("newnsrbtc", clock=mt5.time)
 
-def detect_support_resistance(df, window=20, touch_threshold=2):
-    df = df.copy()
-    df['resistance'] = None
-    df['support'] = None
-
-    for i in range(window, len(df)):
-        current_window = df.iloc[i-window:i]
-        current_high = current_window['high'].max()
-        current_low = current_window['low'].min()
-
-        resistance_touches = sum((current_window['high'] >= current_high * 0.999) & 
-                               (current_window['high'] <= current_high * 1.001))
-        support_touches = sum((current_window['low'] >= current_low * 0.999) & 
-                            (current_window['low'] <= current_low * 1.001))
-
-        if resistance_touches >= touch_threshold:
-            df.loc[i, 'resistance'] = current_high
-        if support_touches >= touch_threshold:
-            df.loc[i, 'support'] = current_low
+# Orders are sent off the analysis loop and reported back by orders.poll(),
+# at most one a minute; an entry held 10 s expires instead of going out at a stale price
+orders = OrderPipeline(mt5, limiter=RateLimiter(symbol=(1 / 60, 1)), max_age=10)
+
+# Open positions, so a signal repeated every loop does not stack trades
+position_book = PositionBook(mt5)
+
+def get_historical_data(symbol, timeframe, num_bars):
+    df = bar_feed.get(symbol, timeframe, num_bars)
     return df
 
 def calculate_atr(df, period=14):
-    df['high_low'] = df['high'] - df['low']
-    df['high_close'] = abs(df['high'] - df['close'].shift())
-    df['low_close'] = abs(df['low'] - df['close'].shift())
-    df['tr'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
-    df['atr'] = df['tr'].rolling(period).mean()
-    return df['atr'].iloc[-1]
+    return indicators.atr(df['high'], df['low'], df['close'], period)[-1]
 
 def calculate_adx(df, period=14):
-    high = df['high'].values
-    low = df['low'].values
-    close = df['close'].values
-    
-    plus_dm = high[1:] - high[:-1]
-    minus_dm = low[:-1] - low[1:]
-    plus_dm = np.where((plus_dm > minus_dm) & (plus_dm > 0), plus_dm, 0)
-    minus_dm = np.where((minus_dm > plus_dm) & (minus_dm > 0), minus_dm, 0)
-
-    tr = np.maximum(high[1:] - low[1:], 
-                   np.abs(high[1:] - close[:-1]), 
-                   np.abs(low[1:] - close[:-1]))
-    
-    atr = np.zeros(len(tr))
-    for i in range(len(tr)):
-        if i < period:
-            atr[i] = tr[:i+1].mean()
-        else:
-            atr[i] = (atr[i-1] * (period - 1) + tr[i]) / period
-
-    plus_di = 100 * (pd.Series(plus_dm).ewm(alpha=1/period).mean() / atr)
-    minus_di = 100 * (pd.Series(minus_dm).ewm(alpha=1/period).mean() / atr)
-    dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
-    adx = dx.ewm(alpha=1/period).mean()
-    
-    return adx.iloc[-1], plus_di.iloc[-1], minus_di.iloc[-1]
+    adx, plus_di, minus_di = indicators.adx(df['high'], df['low'], df['close'], period)
+    return adx[-1], plus_di[-1], minus_di[-1]
 
 def determine_trend(adx, plus_di, minus_di):
     if adx > 25:
@@ -111,19 +82,26 @@ def generate_signal(df, trend):
     return 'BUY' if valid_buy else 'SELL' if valid_sell else 'HOLD'
 
 def calculate_lot_size(balance, risk_percent, sl_pips, symbol):
-    tick_value = mt5.symbol_info(symbol).trade_tick_value
+    tick_value = metadata.symbol_info(symbol).trade_tick_value
     risk_amount = balance * (risk_percent / 100)
     return round(risk_amount / (sl_pips * tick_value), 2)
 
 def execute_trade(symbol, signal, df, risk=1.0):
-    tick = mt5.symbol_info_tick(symbol)
+    if position_book.has_position(symbol):
+        print(f"Position already open for {symbol}, skipping trade.")
+        return
+    if orders.busy((symbol, mt5.ORDER_TYPE_BUY, None)) or orders.busy((symbol, mt5.ORDER_TYPE_SELL, None)):
+        print(f"Order for {symbol} still pending, skipping trade.")
+        return
+
+    tick = metadata.symbol_info_tick(symbol)
     price = tick.ask if signal == 'BUY' else tick.bid
     atr = calculate_atr(df)
     
     request = {
         "action": mt5.TRADE_ACTION_DEAL,
         "symbol": symbol,
-        "volume": calculate_lot_size(mt5.account_info().balance, risk, atr*1.5, symbol),
+        "volume": calculate_lot_size(metadata.account_info().balance, risk, atr*1.5, symbol),
         "type": mt5.ORDER_TYPE_BUY if signal == 'BUY' else mt5.ORDER_TYPE_SELL,
         "price": price,
         "sl": price - (atr * 1.5 if signal == 'BUY' else -atr * 1.5),
@@ -135,13 +113,17 @@ def execute_trade(symbol, signal, df, risk=1.0):
         "type_filling": mt5.ORDER_FILLING_FOK,
     }
     
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        print(f"Trade failed: {result.comment}")
+    orders.submit(request, on_event=report_trade)
+
+def report_trade(event):
+    metadata.on_order(event)
+    position_book.on_order(event)
+    request = event.request
+    if event.kind != 'filled':
+        print(f"Trade {event.kind}: {event.result.comment if event.result else event.error}")
     else:
-        print(f"Executed {request['volume']} lots at {price}")
-        with open('trades_log.csv', 'a') as f:
-            f.write(f"{datetime.now()},{symbol},{signal},{price},{request['sl']},{request['tp']},{request['volume']}\n")
+        print(f"Executed {request['volume']} lots at {request['price']}")
+        trade_journal.record_order(request, event.result)
 
 def main():
     symbol = "BTCUSD"
@@ -153,6 +135,9 @@ def main():
 
     while True:
         try:
+            orders.poll()
+            position_book.sync()
+            metadata.refresh(symbol)
             df = get_historical_data(symbol, timeframe, num_bars)
             df = detect_support_resistance(df)
             adx, plus_di, minus_di = calculate_adx(df)
@@ -166,11 +151,11 @@ def main():
             if signal != 'HOLD':
                 execute_trade(symbol, signal, df)
             
-            time.sleep(5)
+            mt5.sleep(5)
             
         except Exception as e:
             print(f"Error: {str(e)}")
-            time.sleep(60)
+            mt5.sleep(60)
 
 if __name__ == "__main__":
     main()
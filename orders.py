@@ -0,0 +1,224 @@
+"""
+Order submission off the strategy loop.
+
+Strategies submit() MT5 requests and carry on; a worker thread sends them
+one at a time and reports each outcome as an OrderEvent. Events are handed
+back on the strategy's own thread by poll(), which also calls the callback
+given with the request, so bots keep their bookkeeping single-threaded.
+
+Requests are keyed by symbol, order type and position ticket (set on
+closes and SL/TP changes). One submitted while another with its key is
+still waiting replaces it (the newer price wins, the older is reported as
+'replaced'); one submitted while its key is in flight is dropped. This
+only coalesces orders the pipeline still holds: a strategy that must not
+stack trades checks busy() and its open positions before submitting.
+
+A ratelimit.RateLimiter makes orders over budget wait in the queue, where
+other symbols' orders can pass them, or sheds them as 'throttled' events.
+With `max_age`, an order held longer than that is dropped as 'expired'
+rather than sent late with a stale price, SL and TP.
+
+Backends that are not thread-safe (the offline broker, whose clock only
+moves in sleep()) send inline from submit(), as the bots did before; orders
+held by the limiter go out from a later submit() or poll().
+
+    orders = OrderPipeline(mt5, limiter=RateLimiter(symbol=(0.2, 1)))
+    orders.submit(request, on_event=report)
+    ...
+    orders.poll()
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# kind is 'filled', 'rejected' (the terminal answered with another retcode),
+# 'error' (no answer: order_send returned None or raised), or for orders
+# never sent: 'throttled' (shed by the rate limiter), 'expired' (held past
+# max_age) or 'replaced' (by a newer order with its key); latency is the
+# seconds from submit() to the answer or drop
+OrderEvent = namedtuple('OrderEvent', ['kind', 'key', 'request', 'result', 'error', 'latency'])
+
+
+class _Intent:
+    def __init__(self, request, on_event, queued=None):
+        self.request = request
+        self.on_event = on_event
+        self.submitted = time.monotonic()
+        self.queued = queued    # terminal.time() at submit, with a limiter
+
+
+class OrderPipeline:
+    """
+    threaded: send from a worker thread; defaults to the terminal's
+              `threadsafe` flag
+    limiter:  optional ratelimit.RateLimiter, timed by terminal.time()
+    max_age:  seconds of terminal.time() an order may be held by the
+              limiter before it expires; None holds it until it can go
+    """
+
+    def __init__(self, terminal, threaded=None, limiter=None, max_age=None):
+        self.terminal = terminal
+        self.threaded = getattr(terminal, 'threadsafe', True) if threaded is None else threaded
+        self.limiter = limiter
+        self.max_age = max_age
+        self._waiting = OrderedDict()
+        self._in_flight = {}
+        self._events = []
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def submit(self, request, on_event=None):
+        """
+        Queue `request` for order_send. Returns False when it was dropped:
+        an order with the same key is in flight, or the limiter shed it.
+        """
+        key = self.key(request)
+        intent = _Intent(request, on_event)
+        with self._cond:
+            if key in self._in_flight:
+                return False
+            if self.limiter is not None:
+                intent.queued = self.terminal.time()
+                wait, scope = self.limiter.delay(request, intent.queued)
+                if wait > 0 and self.limiter.shed:
+                    self.limiter.rejected[scope] += 1
+                    event = OrderEvent('throttled', key, request, None, None, 0.0)
+                    self._events.append((event, on_event))
+                    return False
+                if wait > 0 and key not in self._waiting:
+                    self.limiter.delayed[scope] += 1
+            replaced = self._waiting.get(key)
+            if replaced is not None:
+                self._drop(replaced, 'replaced', key)
+            # A replaced request keeps its place in the queue
+            self._waiting[key] = intent
+            if self.threaded:
+                self._start()
+                self._cond.notify_all()
+        if not self.threaded:
+            self._pump()
+        return True
+
+    def busy(self, key):
+        # Whether an order with this key is waiting or in flight
+        with self._cond:
+            return key in self._waiting or key in self._in_flight
+
+    def poll(self):
+        # Events since the last poll, oldest first, after calling their callbacks
+        if not self.threaded:
+            self._pump()
+        with self._cond:
+            events, self._events = self._events, []
+        for event, on_event in events:
+            if on_event is not None:
+                on_event(event)
+        return [event for event, _ in events]
+
+    def flush(self, timeout=None):
+        # Wait until every submitted order has been answered; False on timeout.
+        # Inline, orders the limiter still holds are not waited for
+        if not self.threaded:
+            self._pump()
+            return not self._waiting
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._waiting and not self._in_flight, timeout)
+
+    def stop(self, timeout=None):
+        # Let the worker send what is queued, then end it
+        worker = self._worker
+        with self._cond:
+            self._worker = None
+            self._cond.notify_all()
+        if worker is not None:
+            worker.join(timeout)
+
+    @staticmethod
+    def key(request):
+        return request.get('symbol'), request.get('type'), request.get('position')
+
+    def _start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, name='order-pipeline', daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        me = threading.current_thread()
+        while True:
+            with self._cond:
+                while True:
+                    if not self._waiting:
+                        if self._worker is not me:
+                            return
+                        self._cond.wait()
+                        continue
+                    key, wait = self._next()
+                    if key is not None:
+                        break
+                    # Everything queued is over budget; a submit() may bring one that is not
+                    self._cond.wait(wait)
+                intent = self._take(key)
+            self._finish(key, intent, *self._send(intent))
+
+    def _pump(self):
+        # Inline sending of the queued orders the limiter lets through now
+        while True:
+            with self._cond:
+                key, _ = self._next() if self._waiting else (None, None)
+                if key is None:
+                    return
+                intent = self._take(key)
+            self._finish(key, intent, *self._send(intent))
+
+    def _next(self):
+        # Oldest queued order the limiter lets go now, else None and the shortest wait
+        if self.limiter is None:
+            return next(iter(self._waiting)), 0.0
+        now = self.terminal.time()
+        shortest = None
+        for key, intent in list(self._waiting.items()):
+            if self.max_age is not None and now - intent.queued >= self.max_age:
+                self._drop(self._waiting.pop(key), 'expired', key)
+                continue
+            wait, _ = self.limiter.delay(intent.request, now)
+            if wait <= 0:
+                return key, 0.0
+            if self.max_age is not None:
+                # Wake up to expire it if it cannot go before then
+                wait = min(wait, intent.queued + self.max_age - now)
+            shortest = wait if shortest is None else min(shortest, wait)
+        return None, shortest
+
+    def _drop(self, intent, kind, key):
+        # Report an order that will not be sent; called holding the lock
+        event = OrderEvent(kind, key, intent.request, None, None, time.monotonic() - intent.submitted)
+        self._events.append((event, intent.on_event))
+        self._cond.notify_all()
+
+    def _take(self, key):
+        intent = self._waiting.pop(key)
+        if self.limiter is not None:
+            self.limiter.take(intent.request, self.terminal.time())
+        self._in_flight[key] = intent
+        return intent
+
+    def _send(self, intent):
+        try:
+            return self.terminal.order_send(intent.request), None
+        except Exception as e:
+            return None, e
+
+    def _finish(self, key, intent, result, error):
+        if result is None:
+            kind = 'error'
+            if error is None:
+                error = self.terminal.last_error()
+        elif result.retcode == self.terminal.TRADE_RETCODE_DONE:
+            kind = 'filled'
+        else:
+            kind = 'rejected'
+        event = OrderEvent(kind, key, intent.request, result, error, time.monotonic() - intent.submitted)
+        with self._cond:
+            self._in_flight.pop(key, None)
+            self._events.append((event, intent.on_event))
+            self._cond.notify_all()
@@ -0,0 +1,135 @@
+"""
+In-memory book of the account's open positions.
+
+The book follows our own orders as their results come in (record(), or
+on_order() as an orders.OrderPipeline callback) and is diffed against
+terminal.positions_get() at most every `sync_interval` seconds by sync(),
+which catches what happened on the server: SL/TP closes, stop-outs,
+positions opened from elsewhere. Between syncs, profit and current price
+are as of the last one.
+
+Lookups by ticket or symbol and the exposure totals are dict reads, so a
+pre-trade check costs no terminal round trip.
+
+    position_book = PositionBook(mt5)
+    position_book.sync()
+    if not position_book.has_position("XAUUSD"):
+        ...
+"""
+from broker import TradePosition
+
+# Volume left below this after a partial close counts as closed
+VOLUME_EPSILON = 1e-9
+
+
+class PositionBook:
+    def __init__(self, terminal, sync_interval=30.0):
+        self.terminal = terminal
+        self.sync_interval = sync_interval
+        self._positions = {}   # ticket -> TradePosition
+        self._by_symbol = {}   # symbol -> {ticket: TradePosition}
+        self._net = {}         # symbol -> buy volume minus sell volume
+        self._gross = 0.0      # open volume across all symbols
+        self._synced = None    # terminal.time() of the last sync
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, ticket):
+        return ticket in self._positions
+
+    def get(self, ticket):
+        return self._positions.get(ticket)
+
+    def has_position(self, symbol):
+        return bool(self._by_symbol.get(symbol))
+
+    def positions(self, symbol=None):
+        if symbol is None:
+            return list(self._positions.values())
+        return list(self._by_symbol.get(symbol, {}).values())
+
+    def net_exposure(self, symbol):
+        # Lots long minus lots short
+        return self._net.get(symbol, 0.0)
+
+    def gross_exposure(self):
+        return self._gross
+
+    def sync(self, force=False):
+        """
+        Diff the book against the terminal when `sync_interval` has passed
+        (or `force`). Returns the tickets that appeared and disappeared.
+        """
+        now = self.terminal.time()
+        if not force and self._synced is not None and now - self._synced < self.sync_interval:
+            return [], []
+        positions = self.terminal.positions_get()
+        if positions is None:
+            # No answer from the terminal; keep what we have
+            return [], []
+        fresh = {position.ticket: position for position in positions}
+        opened = [ticket for ticket in fresh if ticket not in self._positions]
+        closed = [ticket for ticket in self._positions if ticket not in fresh]
+
+        self._positions, self._by_symbol, self._net = {}, {}, {}
+        self._gross = 0.0
+        for position in fresh.values():
+            self._add(position)
+        self._synced = now
+        return opened, closed
+
+    def record(self, request, result):
+        # Apply an order_send result for `request`; anything but a done deal or SL/TP change is ignored
+        if result is None or result.retcode != self.terminal.TRADE_RETCODE_DONE:
+            return
+        action = request.get('action')
+        ticket = request.get('position')
+        if action == self.terminal.TRADE_ACTION_SLTP:
+            position = self._positions.get(ticket)
+            if position is not None:
+                self._add(position._replace(sl=request.get('sl', 0.0), tp=request.get('tp', 0.0)))
+        elif action == self.terminal.TRADE_ACTION_DEAL and ticket:
+            position = self._positions.get(ticket)
+            if position is not None:
+                left = position.volume - (result.volume or request['volume'])
+                if left > VOLUME_EPSILON:
+                    self._add(position._replace(volume=left))
+                else:
+                    self._remove(position)
+        elif action == self.terminal.TRADE_ACTION_DEAL:
+            # A new position takes the ticket of the order that opened it
+            price = result.price or request.get('price', 0.0)
+            self._add(TradePosition(
+                ticket=result.order, time=int(self.terminal.time()), type=request['type'],
+                magic=request.get('magic', 0), identifier=result.order,
+                volume=result.volume or request['volume'], price_open=price,
+                sl=request.get('sl', 0.0), tp=request.get('tp', 0.0), price_current=price,
+                swap=0.0, profit=0.0, symbol=request['symbol'], comment=request.get('comment', ''),
+            ))
+
+    def on_order(self, event):
+        # orders.OrderPipeline callback
+        self.record(event.request, event.result)
+
+    def _add(self, position):
+        # Replaces the entry for the ticket if there is one (a fill polled after a sync saw it)
+        previous = self._positions.get(position.ticket)
+        if previous is not None:
+            self._remove(previous)
+        self._positions[position.ticket] = position
+        self._by_symbol.setdefault(position.symbol, {})[position.ticket] = position
+        self._net[position.symbol] = self._net.get(position.symbol, 0.0) + self._signed(position)
+        self._gross += position.volume
+
+    def _remove(self, position):
+        del self._positions[position.ticket]
+        by_symbol = self._by_symbol[position.symbol]
+        del by_symbol[position.ticket]
+        if not by_symbol:
+            del self._by_symbol[position.symbol]
+        self._net[position.symbol] -= self._signed(position)
+        self._gross -= position.volume
+
+    def _signed(self, position):
+        return position.volume if position.type == self.terminal.POSITION_TYPE_BUY else -position.volume
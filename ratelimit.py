@@ -0,0 +1,93 @@
+"""
+Token-bucket budgets for order submission.
+
+A budget is (rate, burst): `burst` orders may go at once, and the bucket
+refills at `rate` orders per second. Budgets apply per account (all
+orders), per symbol and per strategy, the strategy being the request's
+magic number. Symbol and strategy budgets are one (rate, burst) for each
+symbol or strategy alike, or a dict of them by name with None as the
+default for the rest.
+
+An order goes when every bucket it draws from has a token. Otherwise it is
+shed (shed=True) or held until the buckets refill (the default);
+orders.OrderPipeline holds it in its queue, so the strategy never waits.
+
+    limiter = RateLimiter(account=(1.0, 3), symbol=(0.2, 1))
+    orders = OrderPipeline(mt5, limiter=limiter)
+"""
+from collections import Counter
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = None
+
+    def delay(self, now):
+        # Seconds until a token is available, 0 when one is
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def _refill(self, now):
+        if self.stamp is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+
+class RateLimiter:
+    """
+    Counters, by the scope that ran out (('account', None), ('symbol',
+    'EURUSD'), ('strategy', 234000)):
+
+    rejected: orders shed
+    delayed:  orders held back, counted once each
+    """
+
+    def __init__(self, account=None, symbol=None, strategy=None, shed=False):
+        self.budgets = {'account': account, 'symbol': symbol, 'strategy': strategy}
+        self.shed = shed
+        self.sent = 0
+        self.rejected = Counter()
+        self.delayed = Counter()
+        self._buckets = {}
+
+    def delay(self, request, now):
+        # Seconds until `request` may go, and the scope that holds it back
+        wait, scope = 0.0, None
+        for key, bucket in self._buckets_for(request):
+            bucket_wait = bucket.delay(now)
+            if bucket_wait > wait:
+                wait, scope = bucket_wait, key
+        return wait, scope
+
+    def take(self, request, now):
+        for _, bucket in self._buckets_for(request):
+            bucket.take(now)
+        self.sent += 1
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'rejected': sum(self.rejected.values()),
+            'delayed': sum(self.delayed.values()),
+        }
+
+    def _buckets_for(self, request):
+        names = {'account': None, 'symbol': request.get('symbol'), 'strategy': request.get('magic')}
+        for scope, name in names.items():
+            budget = self.budgets[scope]
+            if isinstance(budget, dict):
+                budget = budget.get(name, budget.get(None))
+            if budget is None:
+                continue
+            key = (scope, name)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(*budget)
+            yield key, bucket
@@ -0,0 +1,317 @@
+"""
+Tick-level replay of the backtest strategies.
+
+Recorded bid/ask ticks are read from disk in chunks and built into bid bars
+of the strategy's timeframe (or tick-count, volume or range bars) as they
+stream past, so the tick file never has to fit in memory. Whenever bars
+close, the strategy's signal function from backtest.py is evaluated on them
+with `lookback` closed bars of history behind, as the bots do on their bar
+frames, and a signal is acted on at the first tick of the next bar:
+
+- The order is gated on that tick's spread, as main.execute_trade does with
+  MAX_ALLOWED_SPREAD (`spread_limit`, in price).
+- It fills `latency_ms` later at the tick then current, plus `slippage`
+  points against the trade. A fill more than `deviation` points away from
+  the requested price is rejected as a requote, like the bots' orders.
+- SL/TP sit where the bot put them, off the requested price. Buys close on
+  the first bid at or beyond a level, sells on the ask, at that tick's price
+  less `slippage`, so gaps through a stop fill where the market was.
+
+Python only runs per chunk, per signal and per fill; finding bar closes and
+the tick that hits a level are vectorized. One position at a time, as in
+backtest.run().
+
+Ticks are a TICK_DTYPE .npy (memory-mapped), an MT5 ticks .csv with
+`time_msc` (or `time`) and bid/ask columns, or a symbol of a tickarchive.
+
+    python replay.py data/XAUUSD_ticks.npy main --spread-limit 0.5 --latency-ms 150
+    python replay.py ticks main --symbol XAUUSD
+    python replay.py data/XAUUSD_ticks.npy main --range-bars 2.0
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import resample
+import tickarchive
+from broker import DEFAULT_SYMBOL_SPEC, RATES_DTYPE, TICK_DTYPE, TIMEFRAMES
+
+# Ticks read from disk at a time
+CHUNK_TICKS = 1 << 20
+
+
+def iter_ticks(path, chunk_size=CHUNK_TICKS):
+    # TICK_DTYPE chunks of a tick file, without loading the rest of it
+    if os.path.splitext(path)[1] == '.npy':
+        ticks = np.load(path, mmap_mode='r')
+        for start in range(0, len(ticks), chunk_size):
+            yield ticks[start:start + chunk_size]
+        return
+    for df in pd.read_csv(path, chunksize=chunk_size):
+        yield _ticks_from_frame(df)
+
+
+def _ticks_from_frame(df):
+    ticks = np.zeros(len(df), dtype=TICK_DTYPE)
+    for name in TICK_DTYPE.names:
+        if name in df:
+            ticks[name] = df[name].to_numpy()
+    if 'time_msc' not in df:
+        if np.issubdtype(df['time'].dtype, np.integer):
+            ticks['time_msc'] = df['time'].to_numpy() * 1000
+        else:
+            ticks['time_msc'] = pd.to_datetime(df['time']).to_numpy().astype('datetime64[ms]').astype('int64')
+    ticks['time'] = ticks['time_msc'] // 1000
+    return ticks
+
+
+def _chunks(ticks, chunk_size):
+    if isinstance(ticks, str):
+        return iter_ticks(ticks, chunk_size)
+    if isinstance(ticks, np.ndarray):
+        return (ticks[start:start + chunk_size] for start in range(0, len(ticks), chunk_size))
+    return ticks
+
+
+class ReplayResult(backtest.BacktestResult):
+    """
+    trades:   as in BacktestResult, with tick-precise entry/exit times and the
+              entry slippage in points
+    equity:   balance plus the open position's floating profit at every bar close
+    rejected: one row per order refused for its spread or as a requote
+    """
+
+    def __init__(self, trades, equity, rejected):
+        super().__init__(trades, equity)
+        self.rejected = rejected
+
+    def summary(self):
+        reasons = self.rejected['reason']
+        return {
+            **super().summary(),
+            'rejected_spread': int((reasons == 'spread').sum()),
+            'rejected_requote': int((reasons == 'requote').sum()),
+        }
+
+
+class _Replay:
+    # Order, position and bar state carried from one tick chunk to the next
+
+    def __init__(self, signals, builder, point, spread_limit, deviation, latency_ms, slippage, lookback, params):
+        self.signals = signals
+        self.point = point
+        self.spread_limit = spread_limit
+        self.deviation = deviation
+        self.latency_ms = latency_ms
+        self.slippage = slippage * point
+        self.lookback = lookback
+        self.params = params
+        self.builder = builder
+        self.history = np.zeros(0, dtype=RATES_DTYPE)
+        self.closed = []
+        self.bars_closed = 0
+        self.pending = None
+        self.position = None
+        self.trades = []
+        self.rejected = []
+        self.last = None
+
+    def feed(self, chunk):
+        t = np.asarray(chunk['time_msc'], dtype=np.int64)
+        bid = np.asarray(chunk['bid'], dtype=float)
+        ask = np.asarray(chunk['ask'], dtype=float)
+        n = len(t)
+        if n == 0:
+            return
+        closed, closes_at = self.builder.add(t, bid, ask, chunk['volume'])
+        events, sides, stops, targets = self._signals(closed, closes_at)
+        base = self.bars_closed
+        self.bars_closed += len(closed)
+        self.closed.append(closed)
+        bar_of = lambda i: base + int(np.searchsorted(closes_at, i, side='right'))
+
+        pos = 0
+        while pos < n:
+            if self.position is not None:
+                hit = self._first_exit(bid, ask, pos)
+                if hit is None:
+                    break
+                quote = bid[hit] if self.position['side'] > 0 else ask[hit]
+                self._close(bar_of(hit), int(t[hit]), quote)
+                pos = hit + 1
+            elif self.pending is not None:
+                i = pos + int(np.searchsorted(t[pos:], self.pending['fill_msc']))
+                if i == n:
+                    break
+                self._fill(bar_of(i), int(t[i]), bid[i], ask[i])
+                pos = i + 1
+            else:
+                k = int(np.searchsorted(events, pos))
+                if k == len(events):
+                    break
+                i = int(events[k])
+                side = int(sides[k])
+                spread = ask[i] - bid[i]
+                if self.spread_limit is not None and spread > self.spread_limit:
+                    self._reject(int(t[i]), side, 'spread', spread, 0.0)
+                    pos = i + 1
+                    continue
+                self.pending = {
+                    'side': side, 'requested': ask[i] if side > 0 else bid[i],
+                    'stop': stops[k], 'target': targets[k], 'fill_msc': t[i] + self.latency_ms,
+                }
+                pos = i
+        self.last = (bar_of(n - 1), int(t[-1]), bid[-1], ask[-1])
+
+    def finish(self):
+        # Close what is still open at the last tick; an unfilled order is dropped
+        if self.position is not None and self.last is not None:
+            bar, when, bid, ask = self.last
+            self._close(bar, when, bid if self.position['side'] > 0 else ask, 'end')
+        return np.concatenate(self.closed + [self.builder.forming])
+
+    def _signals(self, closed, closes_at):
+        # Signals of the newly closed bars, as ticks they act on and their (side, stop, target)
+        if len(closed) == 0:
+            empty = np.zeros(0)
+            return np.zeros(0, dtype=np.int64), empty, empty, empty
+        frame = np.concatenate((self.history, closed))
+        self.history = frame[-self.lookback:]
+        direction, stop, target = self.signals(frame, point=self.point, **self.params)
+        new = slice(len(frame) - len(closed), None)
+        direction, stop, target = direction[new], stop[new], target[new]
+        with np.errstate(invalid='ignore'):
+            valid = (direction != 0) & (stop > 0) & (target > 0)
+        return closes_at[valid], direction[valid], stop[valid], target[valid]
+
+    def _first_exit(self, bid, ask, pos):
+        # First tick from `pos` on reaching the position's sl or tp, scanning in growing chunks
+        position = self.position
+        side, sl, tp = position['side'], position['sl'], position['tp']
+        prices = bid if side > 0 else ask
+        start, size = pos, 256
+        while start < len(prices):
+            stop = min(len(prices), start + size)
+            window = prices[start:stop]
+            hits = (window <= sl) | (window >= tp) if side > 0 else (window >= sl) | (window <= tp)
+            found = np.flatnonzero(hits)
+            if len(found):
+                return start + int(found[0])
+            start, size = stop, size * 4
+        return None
+
+    def _fill(self, bar, when, bid, ask):
+        order, self.pending = self.pending, None
+        side, requested = order['side'], order['requested']
+        price = (ask if side > 0 else bid) + side * self.slippage
+        slipped = (price - requested) * side / self.point
+        if self.deviation is not None and abs(price - requested) > self.deviation * self.point:
+            self._reject(when, side, 'requote', ask - bid, slipped)
+            return
+        self.position = {
+            'side': side, 'entry_bar': bar, 'entry_msc': when, 'price': price, 'slippage': slipped,
+            'sl': requested - side * order['stop'], 'tp': requested + side * order['target'],
+        }
+
+    def _close(self, bar, when, quote, reason=None):
+        position, self.position = self.position, None
+        side, sl = position['side'], position['sl']
+        if reason is None:
+            reason = 'sl' if (quote <= sl if side > 0 else quote >= sl) else 'tp'
+        price = quote - side * self.slippage
+        self.trades.append((
+            position['entry_bar'], bar, side, position['price'], price, position['sl'], position['tp'], reason,
+            position['entry_msc'], when, position['slippage'],
+        ))
+
+    def _reject(self, when, side, reason, spread, slipped):
+        self.rejected.append((when, side, reason, spread / self.point, slipped))
+
+
+def replay(ticks, strategy, timeframe=TIMEFRAMES['M1'], point=0.01, volume=0.1, balance=10000.0,
+           spread_limit=None, deviation=20, latency_ms=0, slippage=0.0, lookback=500, spec=None,
+           chunk_size=CHUNK_TICKS, bars=None, **params):
+    """
+    Replay `ticks` (a tick file path, a TICK_DTYPE array or an iterable of
+    TICK_DTYPE chunks) through `strategy` (a backtest.STRATEGIES key or a
+    signal function) on bars of `timeframe`, or on the custom bars of `bars`
+    (a fresh resample.TickCountBars, VolumeBars or RangeBars) when given.
+    `params` go to the signal function. Memory grows with the number of
+    bars, not ticks.
+    """
+    if lookback < 1:
+        raise ValueError("lookback must be at least one bar")
+    if bars is None:
+        bars = resample.TimeBars(timeframe, point)
+    signals = backtest.STRATEGIES[strategy] if isinstance(strategy, str) else strategy
+    state = _Replay(signals, bars, point, spread_limit, deviation, latency_ms, slippage, lookback, params)
+    for chunk in _chunks(ticks, chunk_size):
+        state.feed(chunk)
+    bars = state.finish()
+
+    spec = dict(DEFAULT_SYMBOL_SPEC, point=point, **(spec or {}))
+    c = backtest._columns(bars)
+    trades = [trade[:8] for trade in state.trades]
+    result = backtest._result(bars, c, c['spread'] * point, trades, volume, balance, spec, 0, len(bars))
+    entry_msc, exit_msc, slipped = (np.array([trade[i] for trade in state.trades]) for i in (8, 9, 10))
+    trades = result.trades
+    trades['entry_time'] = pd.to_datetime(entry_msc.astype(np.int64), unit='ms')
+    trades['exit_time'] = pd.to_datetime(exit_msc.astype(np.int64), unit='ms')
+    trades['slippage'] = slipped.astype(float)
+
+    rejected = pd.DataFrame(state.rejected, columns=['time', 'direction', 'reason', 'spread', 'slippage'])
+    rejected['time'] = pd.to_datetime(rejected['time'].astype(np.int64), unit='ms')
+    return ReplayResult(trades, result.equity, rejected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded ticks through a bot's signals")
+    parser.add_argument('ticks', help="TICK_DTYPE .npy, MT5 ticks .csv or tick archive directory")
+    parser.add_argument('--symbol', help="replay this symbol from the tick archive at `ticks`")
+    parser.add_argument('strategy', choices=sorted(backtest.STRATEGIES))
+    parser.add_argument('--timeframe', choices=list(TIMEFRAMES), default='M1')
+    custom = parser.add_mutually_exclusive_group()
+    custom.add_argument('--tick-bars', type=int, help="bars of this many ticks instead of time bars")
+    custom.add_argument('--volume-bars', type=float, help="bars of this much tick volume instead of time bars")
+    custom.add_argument('--range-bars', type=float, help="bars of this high-low range (price) instead of time bars")
+    parser.add_argument('--point', type=float, default=0.01)
+    parser.add_argument('--volume', type=float, default=0.1)
+    parser.add_argument('--balance', type=float, default=10000.0)
+    parser.add_argument('--spread-limit', type=float, help="reject entries quoted wider than this (price)")
+    parser.add_argument('--deviation', type=int, default=20, help="max fill distance from the request (points)")
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--slippage', type=float, default=0.0, help="extra points against every fill")
+    parser.add_argument('--lookback', type=int, default=500, help="closed bars the signals see")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_TICKS)
+    parser.add_argument('--trades', help="write the trade list to this CSV")
+    args = parser.parse_args()
+
+    bars, label = None, args.timeframe
+    if args.tick_bars:
+        bars, label = resample.TickCountBars(args.tick_bars, args.point), f"{args.tick_bars}-tick"
+    elif args.volume_bars:
+        bars, label = resample.VolumeBars(args.volume_bars, args.point), f"{args.volume_bars:g}-volume"
+    elif args.range_bars:
+        bars, label = resample.RangeBars(args.range_bars, args.point), f"{args.range_bars:g}-range"
+    ticks = args.ticks
+    if args.symbol:
+        ticks = tickarchive.TickArchive(args.ticks).iter_chunks(args.symbol)
+    started = time.perf_counter()
+    result = replay(ticks, args.strategy, TIMEFRAMES[args.timeframe], point=args.point,
+                    volume=args.volume, balance=args.balance, spread_limit=args.spread_limit,
+                    deviation=args.deviation, latency_ms=args.latency_ms, slippage=args.slippage,
+                    lookback=args.lookback, chunk_size=args.chunk_size, bars=bars)
+    elapsed = time.perf_counter() - started
+    print(f"{args.strategy} on {len(result.equity)} {label} bars of ticks in {elapsed:.2f}s")
+    for name, value in result.summary().items():
+        print(f"{name:>16}: {value:.2f}" if isinstance(value, float) else f"{name:>16}: {value}")
+    if args.trades:
+        result.trades.to_csv(args.trades, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Higher-timeframe and custom bars built from one feed.
+
+Time bars follow MT5's alignment: a bar opens at a whole multiple of its
+length in server time, so H4 and D1 bars start at the server's midnight,
+W1 bars on Sunday and MN1 bars on the 1st. Bar and tick times from the
+terminal are server time already; `tz_offset` is for feeds on another
+clock, as the seconds to add to reach server time.
+
+- resample() turns a bar history into bars of a longer timeframe at once.
+- Resampler does the same incrementally: each update() folds in the latest
+  window of base bars, which may overlap what it already saw and end with
+  a forming bar.
+- ResampledFeed serves any timeframe from one cached M1 feed per symbol,
+  with the same get() as BarCache, so strategies on different timeframes
+  share it. A timeframe's history is seeded once from the terminal and
+  then only grows from the M1 bars.
+- TimeBars, TickCountBars, VolumeBars and RangeBars build bid bars from a
+  tick stream, chunk by chunk, carrying the forming bar between chunks.
+
+    feed = ResampledFeed(mt5)
+    h1 = feed.get("XAUUSD", mt5.TIMEFRAME_H1, 500)
+"""
+import numpy as np
+import pandas as pd
+
+from barcache import BarCache
+from broker import RATES_DTYPE, TIMEFRAMES, timeframe_seconds
+
+# 1970-01-04, the first Sunday of the epoch, where MT5 weeks start
+_FIRST_SUNDAY = 3 * 86400
+_WEEK = 7 * 86400
+# Longest MN1 bar, for sizing base windows
+_MONTH = 31 * 86400
+
+
+def bar_open(times, timeframe, tz_offset=0):
+    # Open time of the `timeframe` bar each epoch-second time falls in
+    times = np.asarray(times, dtype=np.int64) + tz_offset
+    if timeframe == TIMEFRAMES['MN1']:
+        opens = times.astype('datetime64[s]').astype('datetime64[M]').astype('datetime64[s]').astype(np.int64)
+    elif timeframe == TIMEFRAMES['W1']:
+        opens = (times - _FIRST_SUNDAY) // _WEEK * _WEEK + _FIRST_SUNDAY
+    else:
+        seconds = timeframe_seconds(timeframe)
+        opens = times // seconds * seconds
+    return opens - tz_offset
+
+
+def _span(timeframe):
+    return timeframe_seconds(timeframe) or _MONTH
+
+
+def _as_rates(bars):
+    # RATES_DTYPE array of a rates array, BarCache frame or mapping of columns
+    if isinstance(bars, np.ndarray) and bars.dtype == RATES_DTYPE:
+        return bars
+    rates = np.zeros(len(bars['time']), dtype=RATES_DTYPE)
+    for name in RATES_DTYPE.names:
+        column = np.asarray(bars[name])
+        if name == 'time' and np.issubdtype(column.dtype, np.datetime64):
+            column = column.astype('datetime64[s]').astype(np.int64)
+        rates[name] = column
+    return rates
+
+
+def _frame(rates):
+    df = pd.DataFrame(rates)
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    return df
+
+
+def resample(rates, timeframe, tz_offset=0):
+    """
+    Bars of `timeframe` from a sorted, finer-grained bar history. Ranges
+    and volumes are combined; a bar's spread is the lowest of its parts.
+    """
+    rates = _as_rates(rates)
+    if len(rates) == 0:
+        return rates[:0].copy()
+    opens = bar_open(rates['time'], timeframe, tz_offset)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(opens)) + 1))
+    ends = np.append(starts[1:], len(rates))
+    bars = np.zeros(len(starts), dtype=RATES_DTYPE)
+    bars['time'] = opens[starts]
+    bars['open'] = rates['open'][starts]
+    bars['high'] = np.maximum.reduceat(rates['high'], starts)
+    bars['low'] = np.minimum.reduceat(rates['low'], starts)
+    bars['close'] = rates['close'][ends - 1]
+    bars['tick_volume'] = np.add.reduceat(rates['tick_volume'], starts)
+    bars['spread'] = np.minimum.reduceat(rates['spread'], starts)
+    bars['real_volume'] = np.add.reduceat(rates['real_volume'], starts)
+    return bars
+
+
+class Resampler:
+    """
+    Keeps the last `capacity` bars of `timeframe`, the newest still forming,
+    from updates of finer base bars, each ending with a forming base bar.
+    The base bars of the forming bar are kept, so a re-sent forming base bar
+    replaces the one seen before; an update should reach back to since().
+    """
+
+    def __init__(self, timeframe, capacity, tz_offset=0):
+        self.timeframe = timeframe
+        self.capacity = capacity
+        self.tz_offset = tz_offset
+        self.closed = np.zeros(0, dtype=RATES_DTYPE)
+        self.forming = np.zeros(0, dtype=RATES_DTYPE)
+        self._parts = np.zeros(0, dtype=RATES_DTYPE)
+
+    def seed(self, bars):
+        # Closed bars of `timeframe` from elsewhere (the terminal), before any update()
+        self.closed = _as_rates(bars)[-self.capacity:].copy()
+
+    def since(self):
+        # Open time of the oldest base bar the next update() should hold, or None
+        return int(self._parts['time'][0]) if len(self._parts) else None
+
+    def update(self, rates):
+        rates = _as_rates(rates)
+        if len(rates) == 0:
+            return
+        if len(self._parts):
+            # Base bars from the new batch on supersede the ones kept; the
+            # last kept one was still forming, so it is never carried over
+            rates = rates[rates['time'] >= self._parts['time'][0]]
+            kept = self._parts[:-1]
+            rates = np.concatenate((kept[kept['time'] < rates['time'][0]], rates))
+        elif len(self.closed):
+            rates = rates[bar_open(rates['time'], self.timeframe, self.tz_offset) > self.closed['time'][-1]]
+        if len(rates) == 0:
+            return
+        bars = resample(rates, self.timeframe, self.tz_offset)
+        self.closed = np.concatenate((self.closed, bars[:-1]))[-self.capacity:]
+        self.forming = bars[-1:]
+        self._parts = rates[rates['time'] >= bar_open(rates['time'][-1:], self.timeframe, self.tz_offset)[0]]
+
+    def rates(self, num_bars):
+        return np.concatenate((self.closed, self.forming))[-num_bars:]
+
+
+class ResampledFeed:
+    """
+    BarCache-compatible get() for any timeframe, resampled from one cached
+    feed of `base` bars per symbol. A new (symbol, timeframe) takes its closed
+    history from the terminal in one request, or from base bars when the
+    terminal has none, and its forming bar from the base feed.
+    """
+
+    def __init__(self, terminal, base=TIMEFRAMES['M1'], store=None, tz_offset=0):
+        self.terminal = terminal
+        self.base = base
+        self.tz_offset = tz_offset
+        self.cache = BarCache(terminal, store=store)
+        self._resamplers = {}
+        self._window = {}
+
+    def get(self, symbol, timeframe, num_bars):
+        if timeframe == self.base:
+            return self.cache.get(symbol, timeframe, num_bars)
+        key = (symbol, timeframe)
+        resampler = self._resamplers.get(key)
+        # Base bars covering one bar of `timeframe` and the forming base bar
+        span = -(-_span(timeframe) // timeframe_seconds(self.base)) + 1
+        if resampler is None or resampler.capacity < num_bars:
+            resampler = Resampler(timeframe, num_bars, self.tz_offset)
+            self._resamplers[key] = resampler
+            history = self.terminal.copy_rates_from_pos(symbol, timeframe, 0, num_bars)
+            if history is not None and len(history) > 1:
+                resampler.seed(history[:-1])
+            else:
+                span *= num_bars
+        resampler.update(self._base(symbol, span, resampler.since()))
+        return _frame(resampler.rates(num_bars))
+
+    def _base(self, symbol, count, since=None):
+        # One window per symbol, as deep as the deepest timeframe needs, so
+        # every timeframe's update reuses the same cached buffer
+        window = max(self._window.get(symbol, 0), count)
+        self._window[symbol] = window
+        rates = self.cache.get(symbol, self.base, window)
+        if since is None:
+            return rates
+        # A late get() (a retried or slow handler) needs base bars from
+        # further back than one bar of its timeframe; reach back to `since`
+        step = timeframe_seconds(self.base)
+        times = rates['time'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        while len(rates) == window and times[0] > since:
+            window = max(2 * window, (int(times[-1]) - since) // step + 1)
+            rates = self.cache.get(symbol, self.base, window)
+            times = rates['time'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        return rates
+
+
+class _TickBars:
+    # Bid bars built chunk by chunk; the last one stays forming until a tick of a later bar arrives
+
+    def __init__(self, point):
+        self.point = point
+        self.forming = np.zeros(0, dtype=RATES_DTYPE)
+
+    def add(self, time_msc, bid, ask, volume=None):
+        """
+        Bars closed by these ticks, and for each the index of the tick that
+        closed it (the first tick of the next bar). `volume` is the ticks'
+        TICK_DTYPE volume, summed into real_volume.
+        """
+        n = len(bid)
+        if n == 0:
+            return np.zeros(0, dtype=RATES_DTYPE), np.zeros(0, dtype=np.int64)
+        volume = np.zeros(n, dtype=np.uint64) if volume is None else np.asarray(volume, dtype=np.uint64)
+        starts, opens, continued = self._starts(time_msc, bid, volume)
+        ends = np.append(starts[1:], n)
+        bars = np.zeros(len(starts), dtype=RATES_DTYPE)
+        bars['time'] = opens
+        bars['open'] = bid[starts]
+        bars['high'] = np.maximum.reduceat(bid, starts)
+        bars['low'] = np.minimum.reduceat(bid, starts)
+        bars['close'] = bid[ends - 1]
+        bars['tick_volume'] = ends - starts
+        # MT5 bars carry the lowest spread seen in them
+        bars['spread'] = np.rint(np.minimum.reduceat(ask - bid, starts) / self.point)
+        bars['real_volume'] = np.add.reduceat(volume, starts)
+        closes_at = starts[1:]
+
+        if continued:
+            forming, first = self.forming[0], bars[:1]
+            first['time'] = forming['time']
+            first['open'] = forming['open']
+            first['high'] = max(forming['high'], first['high'][0])
+            first['low'] = min(forming['low'], first['low'][0])
+            first['tick_volume'] += forming['tick_volume']
+            first['spread'] = min(forming['spread'], first['spread'][0])
+            first['real_volume'] += forming['real_volume']
+        elif len(self.forming):
+            bars = np.concatenate((self.forming, bars))
+            closes_at = np.concatenate(([0], closes_at))
+        self.forming = bars[-1:].copy()
+        return bars[:-1], closes_at
+
+    def _starts(self, time_msc, bid, volume):
+        # Index of the first tick of each bar in the chunk (starting with 0),
+        # their open times, and whether the first continues the forming bar
+        raise NotImplementedError
+
+
+class TimeBars(_TickBars):
+
+    def __init__(self, timeframe, point, tz_offset=0):
+        super().__init__(point)
+        self.timeframe = timeframe
+        self.tz_offset = tz_offset
+
+    def _starts(self, time_msc, bid, volume):
+        opens = bar_open(time_msc // 1000, self.timeframe, self.tz_offset)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(opens)) + 1))
+        continued = len(self.forming) > 0 and self.forming['time'][0] == opens[0]
+        return starts, opens[starts], continued
+
+
+class TickCountBars(_TickBars):
+    # A bar every `count` ticks
+
+    def __init__(self, count, point):
+        super().__init__(point)
+        self.count = count
+
+    def _starts(self, time_msc, bid, volume):
+        have = int(self.forming['tick_volume'][0]) if len(self.forming) else 0
+        continued = 0 < have < self.count
+        first = self.count - have if continued else 0
+        starts = np.arange(first, len(bid), self.count)
+        if continued:
+            starts = np.concatenate(([0], starts))
+        return starts, time_msc[starts] // 1000, continued
+
+
+class VolumeBars(_TickBars):
+    # A bar closes on the tick that takes its volume to `size`
+
+    def __init__(self, size, point):
+        super().__init__(point)
+        self.size = size
+        self.filled = 0
+
+    def _starts(self, time_msc, bid, volume):
+        continued = len(self.forming) > 0 and self.filled < self.size
+        filled = self.filled if continued else 0
+        total = np.cumsum(volume)
+        starts, before = [0], 0
+        while True:
+            end = int(np.searchsorted(total, before + self.size - filled))
+            if end >= len(bid) - 1:
+                self.filled = filled + total[-1] - before
+                break
+            starts.append(end + 1)
+            before, filled = total[end], 0
+        starts = np.array(starts)
+        return starts, time_msc[starts] // 1000, continued
+
+
+class RangeBars(_TickBars):
+    # A bar closes on the tick that stretches its high-low range to `size`
+
+    def __init__(self, size, point):
+        super().__init__(point)
+        self.size = size
+
+    def _starts(self, time_msc, bid, volume):
+        forming = self.forming[0] if len(self.forming) else None
+        continued = forming is not None and forming['high'] - forming['low'] < self.size
+        high, low = (forming['high'], forming['low']) if continued else (-np.inf, np.inf)
+        starts, start = [0], 0
+        while True:
+            end = self._end(bid, start, high, low)
+            if end is None or end >= len(bid) - 1:
+                break
+            starts.append(end + 1)
+            start, high, low = end + 1, -np.inf, np.inf
+        starts = np.array(starts)
+        return starts, time_msc[starts] // 1000, continued
+
+    def _end(self, bid, start, high, low):
+        # First tick from `start` on that makes the range reach size, scanning in growing chunks
+        size = 64
+        while start < len(bid):
+            stop = min(len(bid), start + size)
+            highs = np.maximum.accumulate(np.maximum(bid[start:stop], high))
+            lows = np.minimum.accumulate(np.minimum(bid[start:stop], low))
+            found = np.flatnonzero(highs - lows >= self.size)
+            if len(found):
+                return start + int(found[0])
+            high, low = highs[-1], lows[-1]
+            start, size = stop, size * 4
+        return None
@@ -0,0 +1,159 @@
+"""
+Wake strategies when their bars close instead of polling on a fixed sleep.
+
+Register a handler per (symbol, timeframe) and call run(). Bar handlers are
+called once per new bar, a moment after the close. The time comes from the
+bar open the terminal reports and the server's clock offset, which is
+estimated from tick timestamps. Tick handlers are optional and run at most
+every `tick_interval` seconds, and only when the symbol's tick changed.
+
+    scheduler = BarScheduler(mt5)
+    scheduler.register("XAUUSD", mt5.TIMEFRAME_H1, on_bar=analyze)
+    scheduler.run()
+
+Handlers are called as on_bar(symbol, timeframe) and on_tick(symbol, tick).
+All waiting goes through terminal.sleep(), so the offline broker's replay
+clock jumps from one bar close to the next.
+
+Bots whose bars come from a resample.ResampledFeed pass it as `feed`: bar
+opens are then read from the feed's base timeframe, as the feed builds its
+bars, so a timeframe the terminal has no bars for still closes on time.
+
+    scheduler = BarScheduler(mt5, feed=bar_feed)
+"""
+import math
+
+from broker import TIMEFRAME_NAMES, timeframe_seconds
+from resample import bar_open
+
+# Server clocks sit a whole number of quarter hours away from UTC, and no
+# further than this
+OFFSET_STEP = 900
+MAX_OFFSET = 14 * 3600
+
+
+class _Job:
+    def __init__(self, symbol, timeframe, on_bar, on_tick):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.on_bar = on_bar
+        self.on_tick = on_tick
+        self.last_open = None    # open time of the forming bar at the last check
+        self.next_bar = 0.0      # server time of the next bar check
+        self.next_tick = 0.0     # server time of the next tick check
+        self.last_tick = None    # time_msc of the last tick handed to on_tick
+        self.retry = None
+
+
+class BarScheduler:
+    """
+    settle: seconds to wait after a bar close before reading the new bar
+    tick_interval: minimum seconds between tick handler calls
+    max_retry: longest wait between checks when a bar close brings no new bar
+               (market closed, no ticks yet)
+    feed: optional resample.ResampledFeed whose base bars give the bar opens
+    """
+
+    def __init__(self, terminal, settle=1.0, tick_interval=1.0, max_retry=60.0, feed=None):
+        self.terminal = terminal
+        self.feed = feed
+        self.settle = settle
+        self.tick_interval = tick_interval
+        self.max_retry = max_retry
+        self.offset = 0
+        self.running = False
+        self._jobs = []
+        self._last_tick_time = {}
+
+    def register(self, symbol, timeframe, on_bar=None, on_tick=None):
+        if on_bar is None and on_tick is None:
+            raise ValueError("register() needs on_bar, on_tick or both")
+        self._jobs.append(_Job(symbol, timeframe, on_bar, on_tick))
+
+    def server_time(self):
+        return self.terminal.time() + self.offset
+
+    def run(self):
+        self.running = True
+        while self.running:
+            wait = self.run_pending()
+            if self.running:
+                # Whole seconds, the offline clock does not move on fractions
+                self.terminal.sleep(max(1, math.ceil(wait)))
+
+    def stop(self):
+        # Ends run() once the current handler returns
+        self.running = False
+
+    def run_pending(self):
+        # Run every handler that is due; returns the seconds until the next one
+        for job in self._jobs:
+            if job.on_bar is not None and self._due(job.next_bar):
+                self._check_bar(job)
+            if job.on_tick is not None and self._due(job.next_tick):
+                self._check_tick(job)
+        due = [job.next_bar for job in self._jobs if job.on_bar is not None]
+        due += [job.next_tick for job in self._jobs if job.on_tick is not None]
+        return min(due) - self.server_time()
+
+    def _due(self, when):
+        # Jobs start due; the clock is only read once the terminal has data
+        return not when or self.server_time() >= when
+
+    def _check_bar(self, job):
+        self._tick(job.symbol)
+        timeframe = job.timeframe if self.feed is None else self.feed.base
+        rates = self.terminal.copy_rates_from_pos(job.symbol, timeframe, 0, 1)
+        now = self.server_time()
+        if rates is None or len(rates) == 0:
+            self._retry(job, now)
+            return
+        opened = int(rates[-1]['time'])
+        if self.feed is not None:
+            # The feed's forming bar opened with the bar its newest base bar falls in
+            opened = int(bar_open(opened, job.timeframe, self.feed.tz_offset))
+        if job.last_open is not None and opened <= job.last_open:
+            # The close is due but the new bar has not shown up yet
+            self._retry(job, now)
+            return
+        job.last_open = opened
+        job.retry = None
+        seconds = timeframe_seconds(job.timeframe) or 86400
+        job.next_bar = opened + seconds + self.settle
+        if job.next_bar <= now:
+            self._retry(job, now)
+        self._call(job, job.on_bar, job.symbol, job.timeframe)
+
+    def _check_tick(self, job):
+        tick = self._tick(job.symbol)
+        job.next_tick = self.server_time() + self.tick_interval
+        if tick is None or tick.time_msc == job.last_tick:
+            return
+        job.last_tick = tick.time_msc
+        self._call(job, job.on_tick, job.symbol, tick)
+
+    def _retry(self, job, now):
+        job.retry = self.settle if job.retry is None else min(job.retry * 2, self.max_retry)
+        job.next_bar = now + job.retry
+
+    def _tick(self, symbol):
+        # Latest tick, also used to keep the server clock offset current.
+        # A tick can be old (quiet symbol, market closed), which only ever
+        # makes the offset look too small, so a lower estimate is taken only
+        # from a tick that changed since the last look, i.e. a live one.
+        tick = self.terminal.symbol_info_tick(symbol)
+        if tick is None:
+            return None
+        previous = self._last_tick_time.get(symbol)
+        self._last_tick_time[symbol] = tick.time
+        offset = round((tick.time - self.terminal.time()) / OFFSET_STEP) * OFFSET_STEP
+        live = previous is not None and tick.time != previous
+        if abs(offset) <= MAX_OFFSET and (offset > self.offset or live):
+            self.offset = offset
+        return tick
+
+    def _call(self, job, handler, *args):
+        try:
+            handler(*args)
+        except Exception as e:
+            print(f"Error in {job.symbol} {TIMEFRAME_NAMES.get(job.timeframe, job.timeframe)} handler: {e}")
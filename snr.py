@@ -1,9 +1,17 @@
-import MetaTrader5 as mt5
+from broker import mt5
 import pandas as pd
-import time
 from datetime import datetime
 import pytz
 import warnings
+from barcache import BarCache
+import barstore
+import journal
+from metadata import MetadataCache
+from orders import OrderPipeline
+from positions import PositionBook
+from ratelimit import RateLimiter
+from scheduler import BarScheduler
+from support_resistance import SupportResistanceTracker
 warnings.filterwarnings("ignore", category=pd.errors.ChainedAssignmentError)
 
 TARGET_PROFIT_PCT = 1.0  # Close position at 1% profit
@@ -55,53 +63,36 @@ def login_mt5(account, password, server):
     print(f"Connected to account #{account}")
     return True
 
-# Fetch historical data
-def get_historical_data(symbol, timeframe, num_bars):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_bars)
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    return df
+# Bars are kept between loops; only the newest ones are pulled from the terminal
+bar_cache = BarCache(mt5, store=barstore.from_env())
 
-# Detect support and resistance levels
-def detect_support_resistance(df, window=20, touch_threshold=2):
-    df = df.copy()
-    df['resistance'] = None
-    df['support'] = None
+# Specs, quotes and account state for the order path, one snapshot per decision
+metadata = MetadataCache(mt5)
 
-    # Analyze all candles in the window
-    for i in range(window, len(df)):
-        lookback_start = i - window
-        current_window = df.iloc[lookback_start:i]  # Look back window candles
-        
-        current_high = current_window['high'].max()
-        current_low = current_window['low'].min()
-        
-        resistance_touches = sum(
-            (current_window['high'] >= current_high * 0.999) &
-            (current_window['high'] <= current_high * 1.001)
-        )
-        
-        support_touches = sum(
-            (current_window['low'] >= current_low * 0.999) &
-            (current_window['low'] <= current_low * 1.001)
-        )
+# Fills go to the shared trade journal, written off the loop
+trade_journal = journal.from_env("snr", clock=mt5.time)
+
+# Orders are sent off the analysis loop and reported back by orders.poll(),
+# at most one a minute; an entry held 10 s expires instead of going out at a stale price
+orders = OrderPipeline(mt5, limiter=RateLimiter(symbol=(1 / 60, 1)), max_age=10)
 
-        # Set levels for current candle based on previous window
-        if resistance_touches >= touch_threshold:
-            df.loc[i, 'resistance'] = current_high
-        if support_touches >= touch_threshold:
-            df.loc[i, 'support'] = current_low
+# Open positions, so a signal repeated every loop does not stack trades
+position_book = PositionBook(mt5)
 
+# Fetch historical data
+def get_historical_data(symbol, timeframe, num_bars):
+    df = bar_cache.get(symbol, timeframe, num_bars)
     return df
 
-def generate_signal(df):
+# levels: SupportResistanceTracker synced up to the previous (last closed) candle
+def generate_signal(df, levels):
     if len(df) < 2:
         return 'HOLD'
     
     # Get previous candle's data
     previous_close = df['close'].iloc[-2]
-    previous_resistance = df['resistance'].iloc[-2]
-    previous_support = df['support'].iloc[-2]
+    previous_resistance = levels.resistance
+    previous_support = levels.support
     
     # Get current price
     current_price = df['close'].iloc[-1]
@@ -117,31 +108,38 @@ def generate_signal(df):
     return 'HOLD'
 
 def calculate_position_size(self, symbol):
-    tick_value = mt5.symbol_info(symbol).trade_tick_value
-    risk_amount = mt5.account_info().equity * 1 / 100
+    tick_value = metadata.symbol_info(symbol).trade_tick_value
+    risk_amount = metadata.account_info().equity * 1 / 100
     return round(risk_amount / tick_value, 2)
 
 # Execute trade
 def execute_trade(symbol, signal, df):
     print("StartExecutingTrade")
-    account_info = mt5.account_info()
+    if position_book.has_position(symbol):
+        print(f"Position already open for {symbol}, skipping trade.")
+        return
+    if orders.busy((symbol, mt5.ORDER_TYPE_BUY, None)) or orders.busy((symbol, mt5.ORDER_TYPE_SELL, None)):
+        print(f"Order for {symbol} still pending, skipping trade.")
+        return
+
+    account_info = metadata.account_info()
     if account_info is None:
         print("Failed to get account info")
         return
 
-    symbol_info = mt5.symbol_info(symbol)
+    symbol_info = metadata.symbol_info(symbol)
     if symbol_info is None:
         print(f"Failed to get info for {symbol}")
         return
 
     if not symbol_info.visible:
         print(f"{symbol} is not visible, trying to switch on")
-        if not mt5.symbol_select(symbol, True):
+        if not metadata.symbol_select(symbol, True):
             print("Symbol select failed")
             return
 
     point = symbol_info.point
-    price = mt5.symbol_info_tick(symbol).ask if signal == 'BUY' else mt5.symbol_info_tick(symbol).bid
+    price = metadata.symbol_info_tick(symbol).ask if signal == 'BUY' else metadata.symbol_info_tick(symbol).bid
     deviation = 20
 
     if signal == 'BUY':
@@ -173,15 +171,20 @@ def execute_trade(symbol, signal, df):
 
     print("Before Order")
 
-    result = mt5.order_send(request)
+    orders.submit(request, on_event=report_trade)
+
+
+def report_trade(event):
+    metadata.on_order(event)
+    position_book.on_order(event)
+    request = event.request
     print(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        print(f"Order failed: {result.comment}")
+    if event.kind != 'filled':
+        print(f"Order {event.kind}: {event.result.comment if event.result else event.error}")
     else:
+        price, sl, tp, lot_size = (request[k] for k in ('price', 'sl', 'tp', 'volume'))
         print(f"Executed {lot_size} lots at {price} | SL: {sl:.2f} | TP: {tp:.2f}")
-        # TODO: add trade price sl tp lot size to csv
-        with open('trades_snr.csv', 'a') as f:
-            f.write(f"{datetime.now()},{symbol},{signal},price:{price},sl:{sl},tp:{tp},lot_size:{lot_size}\n")
+        trade_journal.record_order(request, event.result)
 
 
 def main():
@@ -191,6 +194,7 @@ def main():
     executed = 0
     window = 20
     check_interval = 5  # 30 seconds
+    levels = SupportResistanceTracker(window=window)
 
     if not initialize_mt5():
         return
@@ -198,33 +202,38 @@ def main():
     if not login_mt5(239634700, password="B6D4YAMdemo_",server="Exness-MT5Trial6"):
         return
 
-    while True:
-        try:
-            print(f"\nChecking market at {datetime.now()}")
-            df = get_historical_data(symbol, timeframe, num_bars)
-            df = detect_support_resistance(df, window=window)
-            signal = generate_signal(df)
-            print(f"Position Size: {calculate_position_size(symbol)}")
-            session, config = get_current_session(TRADE_SESSIONS)
-            if session == "NewYork":
-                print("NewYork session dont trade")
-                return
-            
-            print(f"Current Price: {df['close'].iloc[-1]:.2f}")
-            print(f"Latest Resistance: {df['resistance'].iloc[-1]}" if not df['resistance'].dropna().empty else "No resistance")
-            print(f"Latest Support: {df['support'].iloc[-1]}" if not df['support'].dropna().empty else "No support")
-            print(f"Signal: {signal}")
-            print(f"Executed: {executed}")
-
-            if signal in ['BUY', 'SELL']:
-                execute_trade(symbol, signal, df)
-                executed += 1
-
-            time.sleep(check_interval)
-
-        except Exception as e:
-            print(f"Error occurred: {str(e)}")
-            time.sleep(60)
+    def analyze(symbol, tick):
+        nonlocal executed
+        orders.poll()
+        position_book.sync()
+        metadata.on_tick(symbol, tick)
+        print(f"\nChecking market at {datetime.now()}")
+        df = get_historical_data(symbol, timeframe, num_bars)
+        levels.sync(df)
+        signal = generate_signal(df, levels)
+        print(f"Position Size: {calculate_position_size(symbol)}")
+        session, config = get_current_session(TRADE_SESSIONS)
+        if session == "NewYork":
+            print("NewYork session dont trade")
+            scheduler.stop()
+            return
+        
+        print(f"Current Price: {df['close'].iloc[-1]:.2f}")
+        resistance, support = levels.peek()
+        print(f"Latest Resistance: {resistance}" if resistance is not None else "No resistance")
+        print(f"Latest Support: {support}" if support is not None else "No support")
+        print(f"Signal: {signal}")
+        print(f"Executed: {executed}")
+
+        if signal in ['BUY', 'SELL']:
+            execute_trade(symbol, signal, df)
+            executed += 1
+
+    scheduler = BarScheduler(mt5, tick_interval=check_interval)
+    scheduler.register(symbol, timeframe, on_tick=analyze)
+    scheduler.run()
+    orders.stop()
+    orders.poll()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,437 @@
+"""
+Incremental versions of the indicators in indicators.py.
+
+Each object carries its state across calls: update() commits one closed bar
+in O(1) and returns the new value, peek() returns what the value would be if
+the still-forming bar closed at the given price, without committing it.
+Warm-up behaviour matches indicators.py, so feeding a whole history through
+update() gives the same series as the batch function.
+"""
+import math
+from collections import deque
+
+import indicators
+
+NAN = float('nan')
+
+
+def _divide(a, b):
+    # a / b with NumPy's inf/NaN results instead of ZeroDivisionError
+    if b != 0:
+        return a / b
+    if a == 0 or a != a:
+        return NAN
+    return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+class _Indicator:
+    # Price field read by update_bar()/peek_bar() for single-input indicators
+    source = 'close'
+
+    def update_bar(self, bar):
+        return self.update(bar[self.source])
+
+    def peek_bar(self, bar):
+        return self.peek(bar[self.source])
+
+
+class EMA(_Indicator):
+    # Series.ewm(span=..., alpha=..., adjust=...).mean()
+
+    def __init__(self, span=None, alpha=None, adjust=True, source='close'):
+        self.alpha = 2.0 / (span + 1) if alpha is None else alpha
+        self.decay = 1.0 - self.alpha
+        self.adjust = adjust
+        self.source = source
+        self.value = NAN
+        self._num = 0.0
+        self._den = 0.0
+
+    def update(self, x):
+        self._num, self._den, self.value = self._step(x)
+        return self.value
+
+    def peek(self, x):
+        return self._step(x)[2]
+
+    def _step(self, x):
+        if self.adjust:
+            # A NaN adds no weight, the value carries over
+            missing = x != x
+            num = (0.0 if missing else x) + self.decay * self._num
+            den = (0.0 if missing else 1.0) + self.decay * self._den
+            return num, den, _divide(num, den)
+        if self._den == 0:
+            return x, 1.0, x
+        value = self.decay * self._num + self.alpha * x
+        return value, 1.0, value
+
+
+class RollingWindow(_Indicator):
+    """
+    Mean and sample variance over the last `period` values.
+
+    Uses Welford's update with the outgoing value removed in the same step,
+    so the variance stays accurate over long streams where running sums of
+    squares would cancel badly. A window holding a NaN is NaN, as in
+    indicators.sma; NaNs enter the moments as 0 and drop out with the window.
+    """
+
+    def __init__(self, period, source='close'):
+        self.period = period
+        self.source = source
+        self._window = deque()
+        self._gaps = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.value = NAN
+
+    @property
+    def mean(self):
+        return self._mean if len(self._window) == self.period and not self._gaps else NAN
+
+    @property
+    def variance(self):
+        if len(self._window) < self.period or self.period < 2 or self._gaps:
+            return NAN
+        return self._m2 / (self.period - 1)
+
+    def update(self, x):
+        self._window.append(x)
+        if x != x:
+            self._gaps += 1
+        if len(self._window) > self.period:
+            old = self._window.popleft()
+            if old != old:
+                self._gaps -= 1
+            self._mean, self._m2 = self._replace(old, x)
+        else:
+            n = len(self._window)
+            delta = self._clean(x) - self._mean
+            self._mean += delta / n
+            self._m2 += delta * (self._clean(x) - self._mean)
+        self.value = self.mean
+        return self.value
+
+    def peek(self, x):
+        return self.peek_moments(x)[0]
+
+    def peek_moments(self, x):
+        # (mean, variance) if x were the next value
+        n = len(self._window)
+        if n + 1 < self.period:
+            return NAN, NAN
+        gaps = self._gaps + (x != x)
+        if n < self.period:
+            delta = self._clean(x) - self._mean
+            mean = self._mean + delta / (n + 1)
+            m2 = self._m2 + delta * (self._clean(x) - mean)
+        else:
+            gaps -= self._window[0] != self._window[0]
+            mean, m2 = self._replace(self._window[0], x)
+        if gaps:
+            return NAN, NAN
+        variance = m2 / (self.period - 1) if self.period > 1 else NAN
+        return mean, variance
+
+    def _replace(self, old, new):
+        old, new = self._clean(old), self._clean(new)
+        mean = self._mean + (new - old) / self.period
+        m2 = self._m2 + (new - old) * (new - mean + old - self._mean)
+        return mean, max(m2, 0.0)
+
+    @staticmethod
+    def _clean(x):
+        return 0.0 if x != x else x
+
+
+class SMA(RollingWindow):
+    pass
+
+
+class Bollinger(_Indicator):
+    # Value is (middle, upper, lower)
+
+    def __init__(self, period=20, dev=2.0, source='close'):
+        self.dev = dev
+        self.source = source
+        self._window = RollingWindow(period)
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, x):
+        self._window.update(x)
+        self.value = self._bands(self._window.mean, self._window.variance)
+        return self.value
+
+    def peek(self, x):
+        return self._bands(*self._window.peek_moments(x))
+
+    def _bands(self, mean, variance):
+        width = math.sqrt(variance) * self.dev
+        return mean, mean + width, mean - width
+
+
+class RSI(_Indicator):
+    # Gains/losses averaged with ewm(alpha=1/period), like indicators.rsi
+
+    def __init__(self, period=14, source='close'):
+        self.source = source
+        self._gain = EMA(alpha=1.0 / period)
+        self._loss = EMA(alpha=1.0 / period)
+        self._prev = None
+        self.value = NAN
+
+    def update(self, x):
+        gain, loss = self._moves(x)
+        self.value = self._rsi(self._gain.update(gain), self._loss.update(loss))
+        self._prev = x
+        return self.value
+
+    def peek(self, x):
+        gain, loss = self._moves(x)
+        return self._rsi(self._gain.peek(gain), self._loss.peek(loss))
+
+    def _moves(self, x):
+        delta = 0.0 if self._prev is None else x - self._prev
+        return max(delta, 0.0), max(-delta, 0.0)
+
+    @staticmethod
+    def _rsi(gain, loss):
+        if loss == 0:
+            return NAN if gain == 0 else 100.0
+        return 100 - 100 / (1 + gain / loss)
+
+
+class MACD(_Indicator):
+    # Value is (macd, signal, histogram)
+
+    def __init__(self, fast=12, slow=26, signal=9, source='close'):
+        self.source = source
+        self._fast = EMA(span=fast)
+        self._slow = EMA(span=slow)
+        self._signal = EMA(span=signal)
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, x):
+        line = self._fast.update(x) - self._slow.update(x)
+        signal = self._signal.update(line)
+        self.value = (line, signal, line - signal)
+        return self.value
+
+    def peek(self, x):
+        line = self._fast.peek(x) - self._slow.peek(x)
+        signal = self._signal.peek(line)
+        return line, signal, line - signal
+
+
+class ATR(_Indicator):
+    # method='sma' (rolling mean of TR) or 'wilder', as indicators.atr
+
+    def __init__(self, period=14, method='sma'):
+        self.period = period
+        self.method = method
+        self._mean = RollingWindow(period)
+        self._prev_close = None
+        self._count = 0
+        self.value = NAN
+
+    def update(self, high, low, close):
+        tr = self._true_range(high, low)
+        self.value = self._smooth(tr, commit=True)
+        self._prev_close = close
+        return self.value
+
+    def peek(self, high, low, close):
+        return self._smooth(self._true_range(high, low), commit=False)
+
+    def update_bar(self, bar):
+        return self.update(bar['high'], bar['low'], bar['close'])
+
+    def peek_bar(self, bar):
+        return self.peek(bar['high'], bar['low'], bar['close'])
+
+    def _true_range(self, high, low):
+        if self._prev_close is None:
+            return high - low
+        return max(high - low, abs(high - self._prev_close), abs(low - self._prev_close))
+
+    def _smooth(self, tr, commit):
+        if self.method != 'wilder' or self._count < self.period:
+            value = self._mean.update(tr) if commit else self._mean.peek(tr)
+        else:
+            value = (self.value * (self.period - 1) + tr) / self.period
+        if commit:
+            self._count += 1
+        return value
+
+
+class ADX(_Indicator):
+    # Value is (adx, +DI, -DI); method='wilder' or 'sma', as indicators.adx
+
+    def __init__(self, period=14, method='wilder'):
+        self.period = period
+        self.method = method
+        self._prev = None  # (high, low, close) of the last closed bar
+        if method == 'sma':
+            self._atr = ATR(period)
+            self._plus = RollingWindow(period)
+            self._minus = RollingWindow(period)
+            self._dx = RollingWindow(period)
+        else:
+            self._tr_count = 0
+            self._tr = NAN
+            self._plus = EMA(alpha=1.0 / period)
+            self._minus = EMA(alpha=1.0 / period)
+            self._dx = EMA(alpha=1.0 / period)
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, high, low, close):
+        self.value = self._step(high, low, close, commit=True)
+        self._prev = (high, low, close)
+        return self.value
+
+    def peek(self, high, low, close):
+        return self._step(high, low, close, commit=False)
+
+    def update_bar(self, bar):
+        return self.update(bar['high'], bar['low'], bar['close'])
+
+    def peek_bar(self, bar):
+        return self.peek(bar['high'], bar['low'], bar['close'])
+
+    def _step(self, high, low, close, commit):
+        def feed(indicator, *args):
+            return indicator.update(*args) if commit else indicator.peek(*args)
+
+        plus_dm = minus_dm = 0.0
+        if self._prev is not None:
+            up = high - self._prev[0]
+            down = self._prev[1] - low
+            plus_dm = up if up > down and up > 0 else 0.0
+            minus_dm = down if down > up and down > 0 else 0.0
+
+        if self.method == 'sma':
+            tr = feed(self._atr, high, low, close)
+        elif self._prev is None:
+            return NAN, NAN, NAN
+        else:
+            prev_close = self._prev[2]
+            tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+            # Running mean over the first `period` bars, Wilder smoothing after
+            count = min(self._tr_count + 1, self.period)
+            tr = tr if self._tr_count == 0 else (self._tr * (count - 1) + tr) / count
+            if commit:
+                self._tr_count += 1
+                self._tr = tr
+
+        plus_di = 100 * _divide(feed(self._plus, plus_dm), tr)
+        minus_di = 100 * _divide(feed(self._minus, minus_dm), tr)
+        dx = 100 * _divide(abs(plus_di - minus_di), plus_di + minus_di)
+        return feed(self._dx, dx), plus_di, minus_di
+
+
+class Stochastic(_Indicator):
+    # Raw %K (0..100) with the window high/low kept in monotonic deques
+
+    def __init__(self, period=14):
+        self.period = period
+        self._count = 0
+        self._highs = deque()
+        self._lows = deque()
+        self.value = NAN
+
+    def update(self, high, low, close):
+        self._push(self._highs, high, lambda old, new: old <= new)
+        self._push(self._lows, low, lambda old, new: old >= new)
+        self._count += 1
+        self.value = self._k(self._highs[0][1], self._lows[0][1], close) if self._count >= self.period else NAN
+        return self.value
+
+    def peek(self, high, low, close):
+        if self._count + 1 < self.period:
+            return NAN
+        # The oldest bar drops out of the window when the forming bar closes
+        expired = self._count - self.period
+        highest = max(self._front(self._highs, expired, -math.inf), high)
+        lowest = min(self._front(self._lows, expired, math.inf), low)
+        return self._k(highest, lowest, close)
+
+    def update_bar(self, bar):
+        return self.update(bar['high'], bar['low'], bar['close'])
+
+    def peek_bar(self, bar):
+        return self.peek(bar['high'], bar['low'], bar['close'])
+
+    def _push(self, window, value, dominated):
+        while window and dominated(window[-1][1], value):
+            window.pop()
+        window.append((self._count, value))
+        if window[0][0] <= self._count - self.period:
+            window.popleft()
+
+    @staticmethod
+    def _front(window, expired, empty):
+        if window and window[0][0] > expired:
+            return window[0][1]
+        return window[1][1] if len(window) > 1 else empty
+
+    @staticmethod
+    def _k(highest, lowest, close):
+        if highest == lowest:
+            return NAN
+        return 100 * (close - lowest) / (highest - lowest)
+
+
+class Streak:
+    # Bars in a row meeting a condition, carried forward one closed bar at a
+    # time; indicators.streak() is the batch version
+
+    def __init__(self, count=0):
+        self.value = count
+
+    def update(self, hit):
+        self.value = self.peek(hit)
+        return self.value
+
+    def peek(self, hit):
+        return self.value + 1 if hit else 0
+
+    def extend(self, hits):
+        # Push several closed bars at once, returns the count after each
+        counts = indicators.streak(hits, initial=self.value)
+        if len(counts):
+            self.value = int(counts[-1])
+        return counts
+
+
+class IndicatorSet:
+    """
+    Named streaming indicators for one symbol, fed from its bar frame.
+
+    sync(df) pushes the closed bars not seen yet (every row but the last) and
+    returns two dicts: the committed values at the last closed bar, and the
+    preview for the forming bar.
+    """
+
+    def __init__(self, **indicators):
+        self.indicators = indicators
+        self.last_time = None
+
+    def sync(self, df):
+        times = df['time'].to_numpy()
+        columns = {name: df[name].to_numpy() for name in ('open', 'high', 'low', 'close', 'tick_volume')}
+        closed = len(times) - 1
+        start = 0
+        if self.last_time is not None:
+            start = next((i for i in range(closed - 1, -1, -1) if times[i] <= self.last_time), -1) + 1
+        for i in range(start, closed):
+            bar = {name: float(values[i]) for name, values in columns.items()}
+            for indicator in self.indicators.values():
+                indicator.update_bar(bar)
+        if closed > 0:
+            self.last_time = times[closed - 1]
+
+        forming = {name: float(values[-1]) for name, values in columns.items()}
+        previous = {name: indicator.value for name, indicator in self.indicators.items()}
+        current = {name: indicator.peek_bar(forming) for name, indicator in self.indicators.items()}
+        return previous, current
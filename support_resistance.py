@@ -0,0 +1,155 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Rows of the (bars x window) comparison matrix evaluated at once
+CHUNK_CELLS = 1 << 20
+
+
+def support_resistance_levels(high, low, window=20, touch_threshold=2, band=0.001):
+    """
+    Resistance/support level for every bar as float arrays (NaN where none).
+
+    Bar i looks at the `window` bars before it: the highest high is resistance
+    if at least `touch_threshold` highs sit within `band` of it, and likewise
+    the lowest low for support.
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    n = len(high)
+    resistance = np.full(n, np.nan)
+    support = np.full(n, np.nan)
+    if n <= window:
+        return resistance, support
+
+    lower, upper = 1 - band, 1 + band
+    # Window k covers bars [k, k + window) and sets the level of bar k + window
+    high_windows = sliding_window_view(high[:-1], window)
+    low_windows = sliding_window_view(low[:-1], window)
+    step = max(1, CHUNK_CELLS // window)
+    for start in range(0, len(high_windows), step):
+        stop = min(start + step, len(high_windows))
+        hw = high_windows[start:stop]
+        lw = low_windows[start:stop]
+
+        top = hw.max(axis=1)[:, None]
+        bottom = lw.min(axis=1)[:, None]
+        resistance_touches = ((hw >= top * lower) & (hw <= top * upper)).sum(axis=1)
+        support_touches = ((lw >= bottom * lower) & (lw <= bottom * upper)).sum(axis=1)
+
+        bars = slice(start + window, stop + window)
+        resistance[bars] = np.where(resistance_touches >= touch_threshold, top[:, 0], np.nan)
+        support[bars] = np.where(support_touches >= touch_threshold, bottom[:, 0], np.nan)
+
+    return resistance, support
+
+
+# Detect support and resistance levels
+def detect_support_resistance(df, window=20, touch_threshold=2):
+    df = df.copy()
+    resistance, support = support_resistance_levels(df['high'], df['low'], window, touch_threshold)
+    # Object columns with None, as the strategies test the levels for truthiness
+    df['resistance'] = _levels_column(resistance)
+    df['support'] = _levels_column(support)
+    return df
+
+
+def _levels_column(levels):
+    column = np.full(len(levels), None, dtype=object)
+    found = ~np.isnan(levels)
+    column[found] = levels[found]
+    return column
+
+
+class SupportResistanceTracker:
+    """
+    Streaming detect_support_resistance for one symbol/timeframe.
+
+    Closed bars are pushed one at a time. After update(), `resistance` and
+    `support` hold what detect_support_resistance gives for that bar (None
+    when there is no level); peek() gives the levels for the bar after it.
+    The window max/min come from monotonic deques and touches are counted
+    with bisect over a sorted copy of the window, so an update costs
+    O(log window) whatever the history length.
+    """
+
+    def __init__(self, window=20, touch_threshold=2, band=0.001):
+        self.window = window
+        self.touch_threshold = touch_threshold
+        self.lower, self.upper = 1 - band, 1 + band
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.last_time = None
+        self.resistance = None
+        self.support = None
+        self._highs = deque()
+        self._lows = deque()
+        self._sorted_highs = []
+        self._sorted_lows = []
+        # (bar number, value), values decreasing / increasing from the left
+        self._max = deque()
+        self._min = deque()
+
+    def update(self, high, low, time=None):
+        high, low = float(high), float(low)
+        self.resistance, self.support = self.peek()
+
+        if len(self._highs) == self.window:
+            old_high = self._highs.popleft()
+            old_low = self._lows.popleft()
+            del self._sorted_highs[bisect_left(self._sorted_highs, old_high)]
+            del self._sorted_lows[bisect_left(self._sorted_lows, old_low)]
+            expired = self.count - self.window
+            if self._max[0][0] == expired:
+                self._max.popleft()
+            if self._min[0][0] == expired:
+                self._min.popleft()
+
+        self._highs.append(high)
+        self._lows.append(low)
+        insort(self._sorted_highs, high)
+        insort(self._sorted_lows, low)
+        while self._max and self._max[-1][1] <= high:
+            self._max.pop()
+        self._max.append((self.count, high))
+        while self._min and self._min[-1][1] >= low:
+            self._min.pop()
+        self._min.append((self.count, low))
+
+        self.count += 1
+        self.last_time = time
+        return self.resistance, self.support
+
+    def peek(self):
+        # Levels for the next bar, from the current window
+        if len(self._highs) < self.window:
+            return None, None
+        top = self._max[0][1]
+        bottom = self._min[0][1]
+        resistance = support = None
+        if self._touches(self._sorted_highs, top) >= self.touch_threshold:
+            resistance = top
+        if self._touches(self._sorted_lows, bottom) >= self.touch_threshold:
+            support = bottom
+        return resistance, support
+
+    def sync(self, df):
+        # Push the closed bars of df (every row but the forming one) not seen yet
+        times = df['time'].to_numpy()[:-1]
+        if len(times) == 0:
+            return
+        if self.last_time is not None and times[0] > self.last_time:
+            # The frame no longer overlaps what was pushed, rebuild from it
+            self.reset()
+        start = 0 if self.last_time is None else int(np.searchsorted(times, self.last_time, side='right'))
+        highs = df['high'].to_numpy()
+        lows = df['low'].to_numpy()
+        for i in range(start, len(times)):
+            self.update(highs[i], lows[i], times[i])
+
+    def _touches(self, values, level):
+        return bisect_right(values, level * self.upper) - bisect_left(values, level * self.lower)
@@ -0,0 +1,178 @@
+"""
+Parallel parameter sweeps over the backtest strategies.
+
+The bars are copied once into a shared memory block, and every worker
+process maps that block as its bar array. Only the parameter dict of each
+combination is sent to a worker, and only its summary row comes back. Rows
+are yielded as workers finish, so a long sweep can be watched and written
+out while it runs.
+
+Any keyword run() or the strategy's signal function accepts can be swept,
+e.g. window, touch_threshold, band, sl_atr, rr, max_spread, or the
+multisession STRATEGY_PARAMS entries for the scalper strategies:
+
+    python sweep.py data/XAUUSD_M1.npy snr --grid window=10,20,30 \\
+        touch_threshold=2,3 band=0.0005,0.001 rr=1.5,2,3 --out snr_sweep.csv
+"""
+import argparse
+import csv
+import itertools
+import os
+import time
+from contextlib import contextmanager
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pandas as pd
+
+import backtest
+
+# BacktestResult.summary() keys, for the CSV header
+SUMMARY_COLUMNS = ['trades', 'win_rate', 'net_profit', 'profit_factor', 'max_drawdown', 'final_equity']
+
+# Set in each worker by _attach
+_bars = None
+_block = None
+
+
+def grid(**values):
+    # Every combination of the given value lists, as run() keyword dicts
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values[name] for name in names))]
+
+
+def sweep(bars, strategy, combos, processes=None, chunksize=1, **fixed):
+    """
+    Backtest `strategy` once per parameter dict in `combos` across a process
+    pool and yield a row (the parameters plus the result summary) per
+    combination in completion order. `fixed` is passed to every run.
+
+    A combination that raises yields a row with an `error` message instead,
+    so one bad setting does not end the sweep.
+    """
+    tasks = ((strategy, combo, fixed) for combo in combos)
+    with shared_pool(bars, processes) as pool:
+        yield from pool.imap_unordered(_evaluate, tasks, chunksize)
+
+
+@contextmanager
+def shared_pool(bars, processes=None):
+    """
+    Process pool whose workers see `bars` as the module global _bars, mapped
+    from one shared memory copy, with backtest caching switched on.
+    """
+    bars = _as_records(bars)
+    block = shared_memory.SharedMemory(create=True, size=max(bars.nbytes, 1))
+    try:
+        np.ndarray(bars.shape, dtype=bars.dtype, buffer=block.buf)[:] = bars
+        with Pool(processes, initializer=_attach, initargs=(block.name, bars.shape, bars.dtype)) as pool:
+            yield pool
+    finally:
+        block.close()
+        block.unlink()
+
+
+def rank(rows, by='net_profit', top=None):
+    # Results table best first; rows that failed go last
+    table = pd.DataFrame(list(rows))
+    if table.empty:
+        return table
+    if by not in table:
+        table[by] = np.nan
+    table = table.sort_values(by, ascending=False, na_position='last', kind='stable').reset_index(drop=True)
+    return table.head(top) if top else table
+
+
+def _as_records(bars):
+    if isinstance(bars, pd.DataFrame):
+        return np.ascontiguousarray(bars.to_records(index=False))
+    return np.ascontiguousarray(bars)
+
+
+def _attach(name, shape, dtype):
+    global _bars, _block
+    try:
+        # The parent owns the block; workers must not unlink it on exit
+        _block = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        _block = shared_memory.SharedMemory(name=name)
+    _bars = np.ndarray(shape, dtype=dtype, buffer=_block.buf)
+    # Combinations sharing a window or period reuse its indicator arrays
+    backtest.use_cache()
+
+
+def _evaluate(task):
+    strategy, combo, fixed = task
+    row = dict(combo)
+    try:
+        row.update(backtest.run(_bars, strategy, **fixed, **combo).summary())
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def _parse_grid(items):
+    values = {}
+    for item in items:
+        name, _, listed = item.partition('=')
+        if not listed:
+            raise argparse.ArgumentTypeError(f"Expected name=v1,v2,... got {item!r}")
+        values[name] = [_parse_value(value) for value in listed.split(',')]
+    return values
+
+
+def _parse_value(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest a strategy over a parameter grid in parallel")
+    parser.add_argument('bars', help="RATES_DTYPE .npy or MT5 rates .csv")
+    parser.add_argument('strategy', choices=sorted(backtest.STRATEGIES))
+    parser.add_argument('--grid', nargs='+', default=[], metavar='NAME=V1,V2', help="values to sweep")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--point', type=float, default=0.01)
+    parser.add_argument('--volume', type=float, default=0.1)
+    parser.add_argument('--rank', default='net_profit', help="summary column to rank by")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--every', type=int, default=100, help="print the leaders every N results")
+    parser.add_argument('--out', help="append every result row to this CSV as it arrives")
+    args = parser.parse_args()
+
+    combos = grid(**_parse_grid(args.grid))
+    bars = backtest.load_bars(args.bars)
+    print(f"{len(combos)} combinations of {args.strategy} on {len(bars)} bars, {args.processes} processes")
+
+    rows = []
+    started = time.perf_counter()
+    out = open(args.out, 'w', newline='') if args.out else None
+    if out:
+        writer = csv.DictWriter(out, fieldnames=list(combos[0]) + SUMMARY_COLUMNS + ['error'])
+        writer.writeheader()
+    try:
+        for row in sweep(bars, args.strategy, combos, args.processes, point=args.point, volume=args.volume):
+            rows.append(row)
+            if out:
+                writer.writerow(row)
+                out.flush()
+            if 'error' in row:
+                print(row)
+            if len(rows) % args.every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"\n{len(rows)}/{len(combos)} done in {elapsed:.0f}s")
+                print(rank(rows, args.rank, args.top).to_string())
+    finally:
+        if out:
+            out.close()
+
+    print(f"\n{len(rows)} combinations in {time.perf_counter() - started:.1f}s")
+    print(rank(rows, args.rank, args.top).to_string())
+
+
+if __name__ == "__main__":
+    main()
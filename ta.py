@@ -1,8 +1,9 @@
-import MetaTrader5 as mt5
+from broker import mt5
 import pandas as pd
 import pandas_ta as ta
-import time
-from datetime import datetime
+import numpy as np
+from barcache import BarCache
+import barstore
 
 # Initialize MT5 connection
 def initialize_mt5():
@@ -31,37 +32,38 @@ def getIndicator(df):
     macd = ta.macd(df['close'], fast=12, slow=26, signal=9)
     df = pd.concat([df, macd], axis=1)
 
-    # Generate signals
-    df['signal'] = "HOLD"
+    # Generate signals for every bar at once
+    close = df['close']
+    hist = df['MACDh_12_26_9']
+    prev_hist = hist.shift(1)
+    # LONG ENTRY CONDITIONS
+    buy = (close <= df['BBL_20_2.0']) & (df['RSI'] < 30) & (hist > 0) & (prev_hist <= 0)
+    # SHORT ENTRY CONDITIONS
+    sell = (close >= df['BBU_20_2.0']) & (df['RSI'] > 70) & (hist < 0) & (prev_hist >= 0)
+    df['signal'] = np.select([buy, sell], ["BUY", "SELL"], default="HOLD")
 
-    for i in range(1, len(df)):
-        # LONG ENTRY CONDITIONS
-        if (df['close'].iloc[i] <= df['BBL_20_2.0'].iloc[i] and
-            df['RSI'].iloc[i] < 30 and
-            df['MACDh_12_26_9'].iloc[i] > 0 and
-            df['MACDh_12_26_9'].iloc[i-1] <= 0):
-            df['signal'].iloc[i] = "BUY"
-
-            with open("signal.txt", "a") as file:
-                file.write(f"BUY: {df['close'].iloc[-1]}\n")
-        
-        # SHORT ENTRY CONDITIONS
-        elif (df['close'].iloc[i] >= df['BBU_20_2.0'].iloc[i] and
-            df['RSI'].iloc[i] > 70 and
-            df['MACDh_12_26_9'].iloc[i] < 0 and
-            df['MACDh_12_26_9'].iloc[i-1] >= 0):
-            df['signal'].iloc[i] = "SELL"
+    return df
 
-            with open("signal.txt", "a") as file:
-                file.write(f"SELL: {df['close'].iloc[-1]}\n")
+# Append signals of bars closed after `since` to signal.txt and return the new mark.
+# With no mark yet only the last closed bar is considered, not the whole history.
+def log_new_signals(df, since=None):
+    closed = df.iloc[:-1]
+    if closed.empty:
+        return since
+    new = closed.iloc[-1:] if since is None else closed[closed['time'] > since]
+    new = new[new['signal'] != "HOLD"]
+    if not new.empty:
+        with open("signal.txt", "a") as file:
+            for signal, close in zip(new['signal'], new['close']):
+                file.write(f"{signal}: {close}\n")
+    return closed['time'].iloc[-1]
 
-    return df
+# Bars are kept between loops; only the newest ones are pulled from the terminal
+bar_cache = BarCache(mt5, store=barstore.from_env())
 
 # Fetch historical data
 def get_historical_data(symbol, timeframe, num_bars):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, num_bars)
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
+    df = bar_cache.get(symbol, timeframe, num_bars)
     return df
 def main():
 
@@ -70,9 +72,11 @@ def main():
 
     if not login_mt5(account=239634700, password="B6D4YAMdemo_", server="Exness-MT5Trial6"):
         return
+    last_signal_time = None
     while True:
         df = get_historical_data(symbol="XAUUSD", timeframe=mt5.TIMEFRAME_M1, num_bars=500)
         df = getIndicator(df)
+        last_signal_time = log_new_signals(df, last_signal_time)
 
         print(f"Signal: {df['signal'].iloc[-1]}")
         print(f"RSI: {df['RSI'].iloc[-1]}")
@@ -80,7 +84,7 @@ def main():
         print(f"BB Upper: {df['BBU_20_2.0'].iloc[-1]}")
         print(f"Price: {df['close'].iloc[-1]}")
         print(f"BB Lower: {df['BBL_20_2.0'].iloc[-1]}\n")
-        time.sleep(5)
+        mt5.sleep(5)
     
 
 if __name__ == "__main__":
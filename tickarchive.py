@@ -0,0 +1,442 @@
+"""
+Compact archive of recorded ticks.
+
+Per symbol, <root>/<SYMBOL>.ticks holds the ticks in chunks that never span
+a UTC day, and <SYMBOL>.idx one INDEX_DTYPE record per chunk (day, first and
+last time_msc, tick count, byte range), the seek index that lets a reader
+decode only the chunks a date range touches.
+
+Inside a chunk every TICK_DTYPE column is stored on its own, prices as
+integer points of 10**-digits: time_msc, bid and last as deltas from the
+previous tick, ask as its spread over the bid, and volume, flags and
+volume_real as their offset from the chunk's first tick. Each is packed
+into the narrowest integer that holds all but a few of its values (a long
+pause, a price jump), and those few are stored apart and patched in after
+decoding. A column that never changes takes no space beyond its one value.
+Decoding is a widening copy of each packed column, plus a cumsum for the
+delta ones, so only time_msc and bid (and last, where it trades) pay for
+a running sum.
+
+The data file is written before the index record, so a chunk cut short by a
+crash is never indexed and is overwritten by the next append.
+
+    python tickarchive.py record ticks XAUUSD BTCUSD
+    python tickarchive.py import ticks XAUUSD data/XAUUSD_ticks.npy --digits 2
+    python tickarchive.py bench ticks XAUUSD
+"""
+import argparse
+import os
+import struct
+import time
+
+import numpy as np
+
+from broker import TICK_DTYPE, to_timestamp
+
+INDEX_DTYPE = np.dtype([
+    ('day', '<i8'), ('first_msc', '<i8'), ('last_msc', '<i8'), ('count', '<i8'),
+    ('offset', '<i8'), ('size', '<i8'), ('digits', '<i4'),
+])
+
+# Most ticks in one chunk
+CHUNK_TICKS = 1 << 20
+
+# Ticks asked of the terminal per copy_ticks_from call
+FETCH_TICKS = 100_000
+
+DAY_MSC = 86_400_000
+
+# Columns in chunk order, stored as deltas from the previous tick, the
+# spread over the bid, or the offset from the chunk's first value
+_COLUMNS = [
+    ('time_msc', 'delta'),
+    ('bid', 'delta'),
+    ('ask', 'spread'),
+    ('last', 'delta'),
+    ('volume', 'offset'),
+    ('flags', 'offset'),
+    ('volume_real', 'offset'),
+]
+_PRICES = {'bid', 'ask', 'last'}
+
+# Per column: width in bytes (0 when constant), first value, number of patched values
+_HEADER = struct.Struct('<Bqi')
+
+_WIDTHS = {1: np.int8, 2: np.int16, 4: np.int32, 8: np.int64}
+
+
+class TickArchive:
+
+    def __init__(self, root, chunk_ticks=CHUNK_TICKS):
+        self.root = root
+        self.chunk_ticks = chunk_ticks
+        self._data = {}
+        self._index = {}
+
+    def index(self, symbol):
+        # Read again only when the file has grown
+        path = self._path(symbol, 'idx')
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        cached = self._index.get(symbol)
+        if cached is None or cached.nbytes != size:
+            cached = np.fromfile(path, dtype=INDEX_DTYPE) if size else np.zeros(0, dtype=INDEX_DTYPE)
+            self._index[symbol] = cached
+        return cached
+
+    def last_msc(self, symbol):
+        # time_msc of the newest archived tick, or None when there are none
+        index = self.index(symbol)
+        return int(index['last_msc'][-1]) if len(index) else None
+
+    def last_count(self, symbol):
+        # How many archived ticks share the newest time_msc
+        index = self.index(symbol)
+        if not len(index):
+            return 0
+        last = index['last_msc'][-1]
+        data = self._map(symbol)
+        count = 0
+        # Chunks cut at chunk_ticks can split one millisecond
+        for record in index[::-1]:
+            times = _decode(data, int(record['offset']), int(record['count']), int(record['digits']), 'time_msc')
+            count += len(times) - int(np.searchsorted(times, last))
+            if record['first_msc'] != last:
+                break
+        return count
+
+    def append(self, symbol, ticks, digits, overlap=True):
+        """
+        Archive `ticks` (a TICK_DTYPE array or mapping of its columns, sorted
+        by time_msc) newer than the archived ones, with prices rounded to
+        `digits`. Returns how many were added.
+
+        With `overlap`, a batch reaching back to the newest archived
+        time_msc is taken to repeat the archived ticks at it (as a
+        copy_ticks_from batch started at that second does), and only those
+        are skipped. Without it, the ticks follow on from the archive and
+        only ticks older than its newest are skipped.
+        """
+        times = np.asarray(ticks['time_msc'], dtype=np.int64)
+        last = self.last_msc(symbol)
+        if last is None:
+            first = 0
+        else:
+            first = int(np.searchsorted(times, last, side='left'))
+            at_last = int(np.searchsorted(times, last, side='right')) - first
+            if overlap and at_last:
+                first += min(at_last, self.last_count(symbol))
+        if first == len(times):
+            return 0
+        columns = {name: np.asarray(ticks[name])[first:] for name, _ in _COLUMNS}
+        times = times[first:]
+
+        # Chunks end at day boundaries and every chunk_ticks ticks
+        days = times // DAY_MSC
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        bounds = np.union1d(bounds, np.arange(self.chunk_ticks, len(times), self.chunk_ticks))
+        starts = np.concatenate(([0], bounds))
+        ends = np.append(bounds, len(times))
+
+        os.makedirs(self.root, exist_ok=True)
+        index = self.index(symbol)
+        offset = int(index['offset'][-1] + index['size'][-1]) if len(index) else 0
+        records = np.zeros(len(starts), dtype=INDEX_DTYPE)
+        with open(self._path(symbol, 'ticks'), 'ab') as f:
+            # Drop a chunk an interrupted append left unindexed
+            f.truncate(offset)
+            for i, (lo, hi) in enumerate(zip(starts, ends)):
+                payload = _encode({name: column[lo:hi] for name, column in columns.items()}, digits)
+                f.write(payload)
+                records[i] = (days[lo], times[lo], times[hi - 1], hi - lo, offset, len(payload), digits)
+                offset += len(payload)
+        with open(self._path(symbol, 'idx'), 'ab') as f:
+            records.tofile(f)
+        self._data.pop(symbol, None)
+        return len(times)
+
+    def iter_chunks(self, symbol, start=None, end=None):
+        """
+        Decoded chunks of the ticks with start <= time < end (epoch seconds
+        or datetimes, open-ended when None), each a dict of the TICK_DTYPE
+        columns but `time`, which is time_msc // 1000. Only the chunks the
+        range touches are read.
+        """
+        index = self.index(symbol)
+        lo_msc = None if start is None else to_timestamp(start) * 1000
+        hi_msc = None if end is None else to_timestamp(end) * 1000
+        first = 0 if lo_msc is None else int(np.searchsorted(index['last_msc'], lo_msc))
+        stop = len(index) if hi_msc is None else int(np.searchsorted(index['first_msc'], hi_msc))
+        if first >= stop:
+            return
+        data = self._map(symbol)
+        for record in index[first:stop]:
+            chunk = _decode(data, int(record['offset']), int(record['count']), int(record['digits']))
+            times = chunk['time_msc']
+            lo = 0 if lo_msc is None else int(np.searchsorted(times, lo_msc))
+            hi = len(times) if hi_msc is None else int(np.searchsorted(times, hi_msc))
+            if lo > 0 or hi < len(times):
+                chunk = {name: column[lo:hi] for name, column in chunk.items()}
+            yield chunk
+
+    def read(self, symbol, start=None, end=None):
+        # All ticks of a range as one dict of columns
+        chunks = list(self.iter_chunks(symbol, start, end))
+        if not chunks:
+            return {name: np.zeros(0, dtype=TICK_DTYPE[name]) for name, _ in _COLUMNS}
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+    def _map(self, symbol):
+        size = os.path.getsize(self._path(symbol, 'ticks'))
+        cached = self._data.get(symbol)
+        if cached is None or len(cached) != size:
+            cached = np.memmap(self._path(symbol, 'ticks'), dtype=np.uint8, mode='r', shape=(size,))
+            self._data[symbol] = cached
+        return cached
+
+    def _path(self, symbol, extension):
+        return os.path.join(self.root, f'{symbol}.{extension}')
+
+
+def _encode(columns, digits):
+    scale = 10.0 ** digits
+    parts = []
+    for name, mode in _COLUMNS:
+        values = columns[name]
+        if name in _PRICES:
+            values = np.rint(np.asarray(values, dtype=np.float64) * scale).astype(np.int64)
+        elif values.dtype.kind == 'f':
+            # Raw bits; only constant columns shrink, which volume_real usually is
+            values = np.ascontiguousarray(values, dtype=np.float64).view(np.int64)
+        else:
+            values = values.astype(np.int64)
+        if name == 'bid':
+            bid = values
+        if mode == 'spread':
+            values = values - bid
+        base = int(values[0])
+        stored = np.diff(values, prepend=values[0]) if mode == 'delta' else values - base
+        parts.extend(_pack(stored, base))
+    return b''.join(parts)
+
+
+def _pack(stored, base):
+    if not stored.any():
+        return [_HEADER.pack(0, base, 0)]
+    # Narrowest width leaving at most 1 in 256 values to patch
+    allowed = len(stored) >> 8
+    for width in (1, 2, 4, 8):
+        info = np.iinfo(_WIDTHS[width])
+        outside = (stored < info.min) | (stored > info.max)
+        if width == 8 or np.count_nonzero(outside) <= allowed:
+            break
+    positions = np.flatnonzero(outside).astype(np.uint32)
+    packed = np.where(outside, 0, stored).astype(_WIDTHS[width])
+    return [_HEADER.pack(width, base, len(positions)), packed.tobytes(),
+            positions.tobytes(), stored[positions].tobytes()]
+
+
+def _decode(data, offset, count, digits, only=None):
+    # All columns, or just the column `only` when that is time_msc (stored first)
+    scale = 10.0 ** digits
+    chunk = {}
+    for name, mode in _COLUMNS:
+        width, base, patched = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        if width:
+            values = np.frombuffer(data, _WIDTHS[width], count, offset).astype(np.int64)
+            offset += count * width
+            if patched:
+                positions = np.frombuffer(data, np.uint32, patched, offset)
+                offset += patched * 4
+                values[positions] = np.frombuffer(data, np.int64, patched, offset)
+                offset += patched * 8
+            if mode == 'delta':
+                # The first delta is 0, so the running sum starts from base
+                values[0] += base
+                np.cumsum(values, out=values)
+            else:
+                values += base
+                if mode == 'spread':
+                    values += bid
+        elif mode == 'spread':
+            values = bid + base
+        elif name == 'last':
+            chunk[name] = np.full(count, base / scale)
+            continue
+        elif name == 'volume_real':
+            chunk[name] = np.full(count, np.int64(base).view(np.float64))
+            continue
+        else:
+            values = np.full(count, base, dtype=np.int64 if name in _PRICES else TICK_DTYPE[name])
+
+        if name == 'bid':
+            bid = values
+        if name in _PRICES:
+            values = values / scale
+        elif name == 'volume_real':
+            values = values.view(np.float64)
+        elif name != 'time_msc':
+            values = values.astype(TICK_DTYPE[name], copy=False)
+        if name == only:
+            return values
+        chunk[name] = values
+    return chunk
+
+
+class TickRecorder:
+    """
+    Archives every tick a symbol had since the last archived one. Use
+    on_tick() as a BarScheduler tick handler, and flush() before exiting.
+
+    New ticks are held until `flush_ticks` are waiting or a UTC day is
+    complete, so polling every second still archives whole-day chunks.
+    Ticks held when the process dies are fetched again from the terminal
+    on the next start, which resumes from the last archived tick.
+    """
+
+    def __init__(self, terminal, archive, flush_ticks=CHUNK_TICKS):
+        self.terminal = terminal
+        self.archive = archive
+        self.flush_ticks = flush_ticks
+        self._held = {}     # symbol -> TICK_DTYPE arrays not archived yet
+        self._count = {}    # symbol -> ticks held
+        self._last = {}     # symbol -> (newest time_msc seen, how many ticks had it)
+        self._digits = {}
+
+    def on_tick(self, symbol, tick):
+        self.record(symbol, tick.time)
+
+    def record(self, symbol, since=None):
+        # The first recording of a symbol starts at `since` (default: now).
+        # Returns how many new ticks were taken
+        if symbol not in self._digits:
+            self._start(symbol)
+        last = self._last[symbol]
+        since = last[0] // 1000 if last is not None else since if since is not None else self.terminal.time()
+        count = FETCH_TICKS
+        added = 0
+        while True:
+            ticks = self.terminal.copy_ticks_from(symbol, since, count, self.terminal.COPY_TICKS_ALL)
+            if ticks is None or len(ticks) == 0:
+                break
+            added += self._take(symbol, ticks)
+            if len(ticks) < count:
+                break
+            # A full batch: more are waiting from its last second on
+            following = int(ticks['time'][-1])
+            if following == since:
+                # All in one second; ask for more rather than skip the rest of it
+                count *= 2
+            else:
+                since, count = following, FETCH_TICKS
+        self._flush_due(symbol)
+        return added
+
+    def flush(self, symbol=None):
+        # Archive the held ticks of `symbol`, or of every symbol
+        for name in [symbol] if symbol is not None else list(self._held):
+            if self._held.get(name):
+                self._flush(name)
+
+    def _start(self, symbol):
+        last = self.archive.last_msc(symbol)
+        self._last[symbol] = None if last is None else (last, self.archive.last_count(symbol))
+        self._held[symbol], self._count[symbol] = [], 0
+        self._digits[symbol] = self.terminal.symbol_info(symbol).digits
+
+    def _take(self, symbol, ticks):
+        # Hold the ticks of a batch not seen before: batches restart at a
+        # whole second, so they repeat the newest ticks seen
+        times = ticks['time_msc']
+        last = self._last[symbol]
+        first = 0
+        if last is not None:
+            msc, seen = last
+            first = int(np.searchsorted(times, msc, side='left'))
+            first += min(int(np.searchsorted(times, msc, side='right')) - first, seen)
+        if first == len(ticks):
+            return 0
+        fresh = np.asarray(ticks[first:]).astype(TICK_DTYPE)
+        newest = int(fresh['time_msc'][-1])
+        at_newest = len(fresh) - int(np.searchsorted(fresh['time_msc'], newest))
+        if last is not None and newest == last[0]:
+            at_newest += last[1]
+        self._last[symbol] = (newest, at_newest)
+        self._held[symbol].append(fresh)
+        self._count[symbol] += len(fresh)
+        return len(fresh)
+
+    def _flush_due(self, symbol):
+        held = self._held[symbol]
+        if not held:
+            return
+        if self._count[symbol] >= self.flush_ticks:
+            self._flush(symbol)
+            return
+        newest_day = int(held[-1]['time_msc'][-1]) // DAY_MSC
+        if int(held[0]['time_msc'][0]) // DAY_MSC < newest_day:
+            # The days before the newest are complete
+            self._flush(symbol, newest_day * DAY_MSC)
+
+    def _flush(self, symbol, before=None):
+        ticks = np.concatenate(self._held[symbol])
+        cut = len(ticks) if before is None else int(np.searchsorted(ticks['time_msc'], before))
+        # Every held tick is new: nothing to skip at the archive's last time
+        self.archive.append(symbol, ticks[:cut], self._digits[symbol], overlap=False)
+        rest = ticks[cut:]
+        self._held[symbol] = [rest] if len(rest) else []
+        self._count[symbol] = len(rest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record, import and benchmark tick archives")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help="archive the terminal's ticks as they arrive")
+    record.add_argument('root')
+    record.add_argument('symbols', nargs='+')
+    record.add_argument('--interval', type=float, default=1.0, help="seconds between polls")
+    load = commands.add_parser('import', help="archive a TICK_DTYPE .npy or MT5 ticks .csv")
+    load.add_argument('root')
+    load.add_argument('symbol')
+    load.add_argument('ticks')
+    load.add_argument('--digits', type=int, default=2)
+    bench = commands.add_parser('bench', help="time decoding a symbol's whole archive")
+    bench.add_argument('root')
+    bench.add_argument('symbol')
+    args = parser.parse_args()
+
+    archive = TickArchive(args.root)
+    if args.command == 'record':
+        from broker import mt5
+        from scheduler import BarScheduler
+        if not mt5.initialize():
+            print("MT5 initialization failed")
+            return
+        recorder = TickRecorder(mt5, archive)
+        scheduler = BarScheduler(mt5, tick_interval=args.interval)
+        for symbol in args.symbols:
+            scheduler.register(symbol, mt5.TIMEFRAME_M1, on_tick=recorder.on_tick)
+        try:
+            scheduler.run()
+        finally:
+            recorder.flush()
+            mt5.shutdown()
+    elif args.command == 'import':
+        # replay imports this module for reading archives
+        import replay
+        # Chunks of one file follow on from each other
+        added = sum(archive.append(args.symbol, chunk, args.digits, overlap=False)
+                    for chunk in replay.iter_ticks(args.ticks))
+        print(f"{args.symbol}: {added} ticks added")
+    else:
+        index = archive.index(args.symbol)
+        started = time.perf_counter()
+        count = sum(len(chunk['time_msc']) for chunk in archive.iter_chunks(args.symbol))
+        elapsed = time.perf_counter() - started
+        size = int(index['size'].sum())
+        print(f"{args.symbol}: {count} ticks in {len(index)} chunks, {size / max(count, 1):.2f} bytes/tick, "
+              f"decoded in {elapsed:.2f}s ({count / elapsed / 1e6:.0f}M ticks/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Break-even and trailing stops for all open positions at once.
+
+Each tracked position's side, entry, SL, TP, ATR (as of when it was first
+seen) and best price since are held in arrays. update() takes a batch of
+quotes and moves every stop in one vectorized step:
+
+- once a position is `break_even` ATRs in profit, its SL goes to entry plus
+  `lock` ATRs;
+- from then on the SL trails `trail` ATRs behind the best price.
+
+Stops only tighten, and a TRADE_ACTION_SLTP request goes out only when a
+stop moved by more than `step` ATRs since the last one sent, so
+modification traffic stays bounded however many positions are open.
+
+    stops = TrailingStops(mt5)
+    stops.sync(position_book.positions(), atr_of)
+    for request in stops.update({symbol: tick}):
+        orders.submit(request)
+"""
+import numpy as np
+
+_FIELDS = ('ticket', 'symbol', 'side', 'entry', 'sl', 'tp', 'atr', 'best')
+
+
+class TrailingStops:
+    def __init__(self, terminal, trail=1.5, break_even=1.0, lock=0.1, step=0.2):
+        self.terminal = terminal
+        self.trail = trail
+        self.break_even = break_even
+        self.lock = lock
+        self.step = step
+        self.ticket = np.zeros(0, dtype=np.int64)
+        self.symbol = np.zeros(0, dtype=np.int64)  # index into _names
+        self.side = np.zeros(0)                     # +1 buy, -1 sell
+        self.entry = np.zeros(0)
+        self.sl = np.zeros(0)                       # 0 for none, as MT5 has it
+        self.tp = np.zeros(0)
+        self.atr = np.zeros(0)
+        self.best = np.zeros(0)                     # best price since first seen
+        self._names = []
+        self._index = {}
+        self._digits = []
+
+    def __len__(self):
+        return len(self.ticket)
+
+    def sync(self, positions, atr):
+        """
+        Track exactly `positions` (TradePositions, e.g. a PositionBook's).
+        SL/TP are taken from them; `atr(symbol)` is called for the symbols
+        of positions not seen before, and a position whose ATR is None or
+        not positive waits for a later sync.
+        """
+        by_ticket = {position.ticket: position for position in positions}
+        keep = np.fromiter((ticket in by_ticket for ticket in self.ticket.tolist()), bool, len(self.ticket))
+        for name in _FIELDS:
+            setattr(self, name, getattr(self, name)[keep])
+        tracked = [by_ticket[ticket] for ticket in self.ticket.tolist()]
+        self.sl = np.array([position.sl for position in tracked], dtype=float)
+        self.tp = np.array([position.tp for position in tracked], dtype=float)
+
+        known = set(self.ticket.tolist())
+        atrs = {}
+        new = []
+        for position in positions:
+            if position.ticket in known:
+                continue
+            if position.symbol not in atrs:
+                atrs[position.symbol] = atr(position.symbol)
+            if atrs[position.symbol] is not None and atrs[position.symbol] > 0:
+                new.append(position)
+        if not new:
+            return
+        buy = self.terminal.POSITION_TYPE_BUY
+        columns = {
+            'ticket': [p.ticket for p in new],
+            'symbol': [self._symbol_index(p.symbol) for p in new],
+            'side': [1.0 if p.type == buy else -1.0 for p in new],
+            'entry': [p.price_open for p in new],
+            'sl': [p.sl for p in new],
+            'tp': [p.tp for p in new],
+            'atr': [atrs[p.symbol] for p in new],
+            'best': [p.price_current or p.price_open for p in new],
+        }
+        for name in _FIELDS:
+            current = getattr(self, name)
+            setattr(self, name, np.concatenate((current, np.asarray(columns[name], dtype=current.dtype))))
+
+    def update(self, quotes):
+        """
+        SLTP requests for the stops that moved, given `quotes` (symbol ->
+        tick with bid and ask). Positions on symbols without a quote keep
+        their state.
+        """
+        if not len(self.ticket):
+            return []
+        bid = np.full(len(self._names), np.nan)
+        ask = np.full(len(self._names), np.nan)
+        for name, tick in quotes.items():
+            index = self._index.get(name)
+            if index is not None and tick is not None:
+                bid[index], ask[index] = tick.bid, tick.ask
+        side, entry, atr = self.side, self.entry, self.atr
+        # Buys close on the bid, sells on the ask
+        price = np.where(side > 0, bid[self.symbol], ask[self.symbol])
+        self.best = np.where(side > 0, np.fmax(self.best, price), np.fmin(self.best, price))
+
+        with np.errstate(invalid='ignore'):
+            armed = (self.best - entry) * side >= self.break_even * atr
+            # The tighter of break-even and trailing, by side
+            locked = entry + side * self.lock * atr
+            trailed = self.best - side * self.trail * atr
+            stop = side * np.maximum(side * locked, side * trailed)
+            current = np.where(self.sl > 0, self.sl, -side * np.inf)
+            moved = (stop - current) * side > self.step * atr
+            # A stop at or through the market would be refused
+            valid = armed & moved & ((price - stop) * side > 0)
+        changed = np.flatnonzero(valid)
+        if not len(changed):
+            return []
+        digits = np.asarray(self._digits)[self.symbol[changed]]
+        stop = np.array([round(value, int(d)) for value, d in zip(stop[changed].tolist(), digits.tolist())])
+        self.sl[changed] = stop
+
+        action = self.terminal.TRADE_ACTION_SLTP
+        return [
+            {'action': action, 'symbol': self._names[symbol], 'position': ticket, 'sl': sl, 'tp': tp}
+            for ticket, symbol, sl, tp in zip(
+                self.ticket[changed].tolist(), self.symbol[changed].tolist(),
+                stop.tolist(), self.tp[changed].tolist())
+        ]
+
+    def _symbol_index(self, name):
+        index = self._index.get(name)
+        if index is None:
+            info = self.terminal.symbol_info(name)
+            index = self._index[name] = len(self._names)
+            self._names.append(name)
+            # Stops must be on the symbol's price grid
+            self._digits.append(info.digits if info is not None else 5)
+        return index
@@ -0,0 +1,191 @@
+"""
+Stop-loss and take-profit held locally instead of on the broker's order.
+
+hide() strips SL/TP from an entry request before it is sent, and the
+callback it returns arms them once the fill comes back with the position
+ticket. Each symbol keeps its levels in four sorted lists: buy stops and
+targets on the bid, sell stops and targets on the ask. A tick compares
+against the nearest level of each, so its cost does not grow with the
+number of stops, and only the levels it crossed are taken off. on_tick()
+returns market closes for them; a close that does not fill re-arms its
+levels for the next tick.
+
+    virtual_stops = VirtualStops(mt5)
+    orders.submit(*virtual_stops.hide(request, on_event=report))
+    ...
+    for close in virtual_stops.on_tick(symbol, tick):
+        closes.submit(close, on_event=virtual_stops.on_order)
+"""
+import bisect
+from collections import namedtuple
+
+# fields: extra request fields the closes are sent with (magic, deviation, filling)
+VirtualStop = namedtuple('VirtualStop', ['ticket', 'symbol', 'type', 'volume', 'sl', 'tp', 'fields'])
+
+# Entry request fields carried over to its closes
+CLOSE_FIELDS = ('magic', 'deviation', 'type_time', 'type_filling')
+
+
+class _Levels:
+    # Levels on one side of the quote, sorted, firing when the price reaches them
+    # from above (`below`: at or below a level) or from below
+
+    def __init__(self, below):
+        self.below = below
+        self.levels = []
+        self.tickets = []
+
+    def add(self, level, ticket):
+        i = bisect.bisect_right(self.levels, level)
+        self.levels.insert(i, level)
+        self.tickets.insert(i, ticket)
+
+    def remove(self, level, ticket):
+        i = bisect.bisect_left(self.levels, level)
+        while self.tickets[i] != ticket:
+            i += 1
+        del self.levels[i]
+        del self.tickets[i]
+
+    def crossed(self, price):
+        # Take off and return the tickets whose level `price` reached
+        levels = self.levels
+        if self.below:
+            if not levels or levels[-1] < price:
+                return ()
+            i = bisect.bisect_left(levels, price)
+            fired = self.tickets[i:]
+            del levels[i:], self.tickets[i:]
+        else:
+            if not levels or levels[0] > price:
+                return ()
+            i = bisect.bisect_right(levels, price)
+            fired = self.tickets[:i]
+            del levels[:i], self.tickets[:i]
+        return fired
+
+
+class VirtualStops:
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self._stops = {}     # ticket -> VirtualStop
+        self._books = {}     # symbol -> (buy sl, buy tp, sell sl, sell tp) _Levels
+        self._closing = {}   # ticket -> VirtualStop whose close is out
+
+    def __len__(self):
+        return len(self._stops)
+
+    def __contains__(self, ticket):
+        return ticket in self._stops
+
+    def get(self, ticket):
+        return self._stops.get(ticket)
+
+    def symbols(self):
+        # Symbols with armed stops, the ones whose ticks need watching
+        return [symbol for symbol, books in self._books.items() if any(book.levels for book in books)]
+
+    def hide(self, request, on_event=None):
+        """
+        Copy of an entry request with SL/TP taken off, and the pipeline
+        callback to submit it with: it arms them if the entry fills, then
+        calls `on_event`. The levels travel with the callback, so an entry
+        the pipeline drops, replaces or expires arms nothing.
+        """
+        sl, tp = request.get('sl', 0.0) or 0.0, request.get('tp', 0.0) or 0.0
+
+        def arm(event):
+            if event.kind == 'filled':
+                # A new position takes the ticket of the order that opened it
+                fields = {name: request[name] for name in CLOSE_FIELDS if name in request}
+                self.set(event.result.order, request['symbol'], request['type'],
+                         event.result.volume or request['volume'], sl, tp, **fields)
+            if on_event is not None:
+                on_event(event)
+
+        return {**request, 'sl': 0.0, 'tp': 0.0}, arm
+
+    def set(self, ticket, symbol, type, volume, sl=0.0, tp=0.0, **fields):
+        # Arm or move the stops of a position; 0 for none, as MT5 has it
+        self.remove(ticket)
+        stop = VirtualStop(ticket, symbol, type, volume, sl or 0.0, tp or 0.0, fields)
+        if not stop.sl and not stop.tp:
+            return
+        self._stops[ticket] = stop
+        self._place(stop, _Levels.add)
+
+    def remove(self, ticket):
+        stop = self._stops.pop(ticket, None)
+        if stop is not None:
+            self._place(stop, _Levels.remove)
+
+    def sync(self, positions):
+        # Drop the stops of positions no longer open (closed on the server, or elsewhere)
+        open_tickets = {position.ticket for position in positions}
+        for ticket in [ticket for ticket in self._stops if ticket not in open_tickets]:
+            self.remove(ticket)
+
+    def on_tick(self, symbol, tick):
+        """
+        Close requests for the positions whose stop or target `tick` reached.
+        Their levels are taken off until on_order() hears how the close went.
+        """
+        books = self._books.get(symbol)
+        if books is None or tick is None:
+            return []
+        buy_sl, buy_tp, sell_sl, sell_tp = books
+        # Buys close on the bid, sells on the ask
+        fired = [(ticket, 'sl', tick.bid) for ticket in buy_sl.crossed(tick.bid)]
+        fired += [(ticket, 'tp', tick.bid) for ticket in buy_tp.crossed(tick.bid)]
+        fired += [(ticket, 'sl', tick.ask) for ticket in sell_sl.crossed(tick.ask)]
+        fired += [(ticket, 'tp', tick.ask) for ticket in sell_tp.crossed(tick.ask)]
+        requests = []
+        for ticket, reason, price in fired:
+            stop = self._stops.pop(ticket, None)
+            if stop is None:
+                continue
+            # The level that did not fire is still in its book
+            if reason == 'sl' and stop.tp:
+                self._book(stop, 'tp').remove(stop.tp, ticket)
+            elif reason == 'tp' and stop.sl:
+                self._book(stop, 'sl').remove(stop.sl, ticket)
+            self._closing[ticket] = stop
+            requests.append(self._close(stop, price, reason))
+        return requests
+
+    def on_order(self, event):
+        # orders.OrderPipeline callback for the closes on_tick() fired
+        ticket = event.request.get('position')
+        if not ticket:
+            return
+        stop = self._closing.pop(ticket, None)
+        if stop is not None and event.kind != 'filled':
+            # Still open as far as we know; try again on the next tick
+            self.set(stop.ticket, stop.symbol, stop.type, stop.volume, stop.sl, stop.tp, **stop.fields)
+        elif event.kind == 'filled':
+            self.remove(ticket)
+
+    def _book(self, stop, level):
+        buy = stop.type == self.terminal.ORDER_TYPE_BUY
+        return self._books[stop.symbol][(0 if buy else 2) + (level == 'tp')]
+
+    def _place(self, stop, apply):
+        if stop.symbol not in self._books:
+            self._books[stop.symbol] = (_Levels(True), _Levels(False), _Levels(False), _Levels(True))
+        for level in ('sl', 'tp'):
+            value = getattr(stop, level)
+            if value:
+                apply(self._book(stop, level), value, stop.ticket)
+
+    def _close(self, stop, price, reason):
+        buy = stop.type == self.terminal.ORDER_TYPE_BUY
+        return {
+            'action': self.terminal.TRADE_ACTION_DEAL,
+            'symbol': stop.symbol,
+            'volume': stop.volume,
+            'type': self.terminal.ORDER_TYPE_SELL if buy else self.terminal.ORDER_TYPE_BUY,
+            'position': stop.ticket,
+            'price': price,
+            **stop.fields,
+            'comment': f"virtual {reason}",
+        }
@@ -0,0 +1,148 @@
+"""
+Walk-forward optimization of a backtest strategy.
+
+History is cut into folds of `in_sample` bars followed by `out_sample` bars,
+each fold starting `step` bars (default `out_sample`) after the last, or
+always from bar 0 when anchored. On every fold the parameter grid is scored
+on the in-sample bars, and the best combination is traded on the
+out-of-sample bars that follow.
+
+Every (combination, fold) pair is a task of its own, so the folds of a
+single combination run in parallel too. A worker computes a combination's
+indicator and signal arrays over the whole history and keeps them in its
+backtest cache, and each fold trades a slice of them: the other folds of
+that combination it gets, and combinations sharing an indicator, reuse
+them rather than recompute the same rolling stats. The bars reach the
+workers through sweep.shared_pool.
+
+    python walkforward.py data/BTCUSD_M15.npy newnsrbtc --in-sample 20000 \\
+        --out-sample 5000 --grid adx_threshold=20,25,30 window=10,20,30
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import sweep
+
+
+def folds(n, in_sample, out_sample, step=None, anchored=False):
+    # (in-sample start, in-sample end / out-of-sample start, out-of-sample end) bar indices
+    step = step or out_sample
+    windows = []
+    start = 0
+    while start + in_sample < n:
+        split = start + in_sample
+        windows.append((0 if anchored else start, split, min(split + out_sample, n)))
+        start += step
+    return windows
+
+
+class WalkForwardResult:
+    """
+    scores:   one row per (fold, combination) with in-sample (is_*) and
+              out-of-sample (oos_*) summaries
+    selected: per fold, the combination with the best in-sample score and
+              how it did out of sample
+    """
+
+    def __init__(self, scores, selected):
+        self.scores = scores
+        self.selected = selected
+
+    def summary(self):
+        oos = self.selected
+        return {
+            'folds': len(oos),
+            'oos_trades': int(oos['oos_trades'].sum()) if len(oos) else 0,
+            'oos_net_profit': oos['oos_net_profit'].sum() if len(oos) else 0.0,
+            'oos_profitable_folds': int((oos['oos_net_profit'] > 0).sum()) if len(oos) else 0,
+        }
+
+
+def walk_forward(bars, strategy, combos, in_sample, out_sample, step=None, anchored=False,
+                 rank='net_profit', processes=None, **fixed):
+    """
+    Walk `strategy` forward over `bars` with the parameter dicts in `combos`.
+    Every fold of every combination runs in parallel; `fixed` is passed to
+    every backtest.
+    """
+    windows = folds(len(bars), in_sample, out_sample, step, anchored)
+    if not windows:
+        raise ValueError(f"{len(bars)} bars are too few for a {in_sample}-bar in-sample window")
+    # Consecutive folds of a combination go to a worker together, so it
+    # reuses the arrays it cached for the first; a few chunks per process
+    # keep the workers even when later (anchored) folds take longer
+    tasks = [(strategy, combo, fixed, fold, window) for combo in combos for fold, window in enumerate(windows)]
+    chunk = -(-len(tasks) // (4 * (processes or os.cpu_count())))
+    with sweep.shared_pool(bars, processes) as pool:
+        rows = list(pool.imap_unordered(_score, tasks, chunksize=chunk))
+
+    scores = pd.DataFrame(rows)
+    times = backtest._times(bars)
+    bounds = pd.DataFrame(windows, columns=['is_start', 'oos_start', 'oos_end'])
+    bounds['fold'] = np.arange(len(windows))
+    bounds['from'] = times[bounds['oos_start']]
+    bounds['to'] = times[bounds['oos_end'] - 1]
+
+    key = f'is_{rank}'
+    if key not in scores:
+        scores[key] = np.nan
+    ranked = scores.dropna(subset=[key]).sort_values(['fold', key], ascending=[True, False], kind='stable')
+    selected = ranked.groupby('fold', sort=True).head(1)
+    selected = bounds.merge(selected, on='fold').reset_index(drop=True)
+    return WalkForwardResult(scores.sort_values(['fold', key], ascending=[True, False]).reset_index(drop=True),
+                             selected)
+
+
+def _score(task):
+    strategy, combo, fixed, fold, (start, split, end) = task
+    row = {'fold': fold, **combo}
+    try:
+        in_sample = backtest.run(sweep._bars, strategy, start=start, end=split, **fixed, **combo)
+        out_sample = backtest.run(sweep._bars, strategy, start=split, end=end, **fixed, **combo)
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    else:
+        row.update({f'is_{name}': value for name, value in in_sample.summary().items()})
+        row.update({f'oos_{name}': value for name, value in out_sample.summary().items()})
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward optimization of a strategy's parameters")
+    parser.add_argument('bars', help="RATES_DTYPE .npy or MT5 rates .csv")
+    parser.add_argument('strategy', choices=sorted(backtest.STRATEGIES))
+    parser.add_argument('--grid', nargs='+', default=[], metavar='NAME=V1,V2', help="values to optimize over")
+    parser.add_argument('--in-sample', type=int, required=True, help="bars per in-sample window")
+    parser.add_argument('--out-sample', type=int, required=True, help="bars per out-of-sample window")
+    parser.add_argument('--step', type=int, help="bars between fold starts (default: --out-sample)")
+    parser.add_argument('--anchored', action='store_true', help="every in-sample window starts at bar 0")
+    parser.add_argument('--rank', default='net_profit', help="in-sample summary column to optimize")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--point', type=float, default=0.01)
+    parser.add_argument('--volume', type=float, default=0.1)
+    parser.add_argument('--scores', help="write every fold/combination score to this CSV")
+    args = parser.parse_args()
+
+    combos = sweep.grid(**sweep._parse_grid(args.grid))
+    bars = backtest.load_bars(args.bars)
+    started = time.perf_counter()
+    result = walk_forward(bars, args.strategy, combos, args.in_sample, args.out_sample, args.step,
+                          args.anchored, args.rank, args.processes, point=args.point, volume=args.volume)
+    print(f"{args.strategy}: {len(combos)} combinations x {len(result.selected)} folds "
+          f"in {time.perf_counter() - started:.1f}s")
+    names = list(combos[0])
+    columns = ['fold', 'from', 'to'] + names + [f'is_{args.rank}', 'oos_trades', 'oos_net_profit', 'oos_win_rate']
+    print(result.selected[[name for name in columns if name in result.selected]].to_string())
+    for name, value in result.summary().items():
+        print(f"{name:>20}: {value:.2f}" if isinstance(value, float) else f"{name:>20}: {value}")
+    if args.scores:
+        result.scores.to_csv(args.scores, index=False)
+
+
+if __name__ == "__main__":
+    main()